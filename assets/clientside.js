@@ -0,0 +1,338 @@
+// Callbacks executados no navegador.
+//
+// Filtragem no navegador (modo CLIENTSIDE_FILTERING): o servidor envia o cubo
+// pré-agregado uma vez por snapshot e os filtros, totais e gráficos são
+// calculados aqui, sem uma requisição ao servidor a cada interação.
+(function () {
+    var NO_DATA_MESSAGE = "Nenhum dado encontrado para os filtros selecionados.";
+    var FILTER_DIMENSIONS = ["Data", "Hospital", "Centro de Custo", "Categoria"];
+
+    // Mesmas paletas de px.colors.qualitative.Plotly e px.colors.qualitative.Safe
+    var NORMAL_COLORS = ["#636EFA", "#EF553B", "#00CC96", "#AB63FA", "#FFA15A",
+        "#19D3F3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52"];
+    var DALTONIC_COLORS = ["rgb(136, 204, 238)", "rgb(204, 102, 119)", "rgb(221, 204, 119)",
+        "rgb(17, 119, 51)", "rgb(51, 34, 136)", "rgb(170, 68, 153)", "rgb(68, 170, 153)",
+        "rgb(153, 153, 51)", "rgb(136, 34, 85)", "rgb(102, 17, 0)", "rgb(136, 136, 136)"];
+
+    function formatMoney(value) {
+        return value.toLocaleString("en-US", {minimumFractionDigits: 2, maximumFractionDigits: 2});
+    }
+
+    // Tabela booleana indexada pelo código: true para os valores selecionados
+    function lookup(labels, selected) {
+        var table = new Uint8Array(labels.length);
+        var wanted = {};
+        (selected || []).forEach(function (value) { wanted[value] = true; });
+        labels.forEach(function (label, code) {
+            if (wanted[label]) { table[code] = 1; }
+        });
+        return table;
+    }
+
+    // Índices das linhas da tabela fato que passam pelos quatro filtros (menos o de
+    // índice unfiltered, quando informado)
+    function selectRows(cube, selections, unfiltered) {
+        var tables = FILTER_DIMENSIONS.map(function (dimension, i) {
+            return i === unfiltered ? null : lookup(cube.labels[dimension], selections[i]);
+        });
+        var rows = [];
+        for (var row = 0; row < cube.values.length; row++) {
+            var keep = true;
+            for (var i = 0; i < FILTER_DIMENSIONS.length && keep; i++) {
+                keep = tables[i] === null || tables[i][cube.codes[FILTER_DIMENSIONS[i]][row]] === 1;
+            }
+            if (keep) { rows.push(row); }
+        }
+        return rows;
+    }
+
+    // Opções de cada filtro com dados para as seleções dos outros três (um filtro sem
+    // seleção não restringe os demais), mais as que já estão selecionadas
+    function filterOptions(cube, selections) {
+        var tables = FILTER_DIMENSIONS.map(function (dimension, i) {
+            return (selections[i] || []).length ? lookup(cube.labels[dimension], selections[i]) : null;
+        });
+        return FILTER_DIMENSIONS.map(function (dimension, i) {
+            var labels = cube.labels[dimension];
+            var codes = cube.codes[dimension];
+            var valid = new Uint8Array(labels.length);
+            for (var row = 0; row < cube.values.length; row++) {
+                var keep = true;
+                for (var j = 0; j < FILTER_DIMENSIONS.length && keep; j++) {
+                    if (j !== i && tables[j] !== null) {
+                        keep = tables[j][cube.codes[FILTER_DIMENSIONS[j]][row]] === 1;
+                    }
+                }
+                if (keep) { valid[codes[row]] = 1; }
+            }
+            var options = [];
+            var listed = {};
+            labels.forEach(function (label, code) {
+                if (valid[code] === 1) {
+                    options.push({label: label, value: label});
+                    listed[label] = true;
+                }
+            });
+            (selections[i] || []).forEach(function (value) {
+                if (!listed[value]) { options.push({label: value, value: value}); }
+            });
+            return options;
+        });
+    }
+
+    // Totais por valor da dimensão, em ordem alfabética (como o groupby)
+    function totals(cube, rows, dimension) {
+        var labels = cube.labels[dimension];
+        var codes = cube.codes[dimension];
+        var sums = new Float64Array(labels.length);
+        var present = new Uint8Array(labels.length);
+        var grandTotal = 0;
+        rows.forEach(function (row) {
+            sums[codes[row]] += cube.values[row];
+            present[codes[row]] = 1;
+            grandTotal += cube.values[row];
+        });
+        return cube.order[dimension].filter(function (code) {
+            return present[code] === 1;
+        }).map(function (code) {
+            return {label: labels[code], value: sums[code], percent: sums[code] / grandTotal * 100};
+        });
+    }
+
+    // Posições dos limit itens de maior valor (empates pela ordem original)
+    function largest(items, limit) {
+        var keep = {};
+        items.map(function (item, i) { return i; }).sort(function (a, b) {
+            return items[b].value - items[a].value || a - b;
+        }).slice(0, limit).forEach(function (i) { keep[i] = true; });
+        return keep;
+    }
+
+    // Maiores itens (na ordem original) e os demais somados em "Outros (n)", como top_n no servidor
+    function topItems(items, limit) {
+        if (!limit || items.length <= limit + 1) {
+            return items;
+        }
+        var keep = largest(items, limit);
+        var others = {label: "", value: 0, percent: 0};
+        var kept = items.filter(function (item, i) {
+            if (!keep[i]) {
+                others.value += item.value;
+                others.percent += item.percent;
+            }
+            return keep[i];
+        });
+        others.label = "Outros (" + (items.length - kept.length) + ")";
+        return kept.concat([others]);
+    }
+
+    // Equivalente ao px.bar(color=dimensão) montado por build_bar_chart
+    function barChart(items, dimension, colors, template) {
+        var data = items.map(function (item) {
+            return {
+                type: "bar", orientation: "v", alignmentgroup: "True",
+                name: item.label, legendgroup: item.label, offsetgroup: item.label, showlegend: true,
+                x: [item.label], y: [item.value], text: [item.percent],
+                texttemplate: "%{text:.2f}%", textposition: "outside",
+                hovertemplate: dimension + "=%{x}<br>Valor=%{y}<br>Percentual=%{text}<extra></extra>"
+            };
+        });
+        return {
+            data: data,
+            layout: {
+                template: template,
+                colorway: colors,
+                barmode: "relative",
+                title: {text: "Gastos por " + dimension, font: {size: 18, color: "#333"}},
+                xaxis: {title: {text: dimension}, categoryorder: "array",
+                    categoryarray: items.map(function (item) { return item.label; })},
+                yaxis: {title: {text: "Valor (R$)"}},
+                legend: {title: {text: dimension, font: {size: 12}}, tracegroupgap: 0},
+                font: {color: "#333"},
+                plot_bgcolor: "#C0C0C0",
+                paper_bgcolor: "#C0C0C0"
+            }
+        };
+    }
+
+    // "AAAA-MM" de um ordinal de mês (meses desde 01/1970, como os períodos do pandas)
+    function monthLabel(ordinal) {
+        var year = Math.floor(ordinal / 12);
+        var month = ordinal - year * 12 + 1;
+        return (1970 + year) + "-" + (month < 10 ? "0" : "") + month;
+    }
+
+    // Variação percentual (vazia quando a base é zero ou não existe)
+    function change(current, base) {
+        if (base === undefined || base === 0) {
+            return null;
+        }
+        return (current - base) / base * 100;
+    }
+
+    // Série mensal por valor da dimensão, do primeiro ao último mês com lançamentos, como
+    // CubeSlice.monthly: os limit valores de maior gasto e os demais somados em "Outros (n)"
+    function monthly(cube, rows, dimension, limit) {
+        var labels = cube.labels[dimension];
+        var codes = cube.codes[dimension];
+        var monthCodes = cube.codes["Data"];
+        var first = Infinity;
+        var last = -Infinity;
+        rows.forEach(function (row) {
+            var ordinal = cube.months[monthCodes[row]];
+            first = Math.min(first, ordinal);
+            last = Math.max(last, ordinal);
+        });
+        var sums = labels.map(function () { return null; });
+        rows.forEach(function (row) {
+            var code = codes[row];
+            sums[code] = sums[code] || new Float64Array(last - first + 1);
+            sums[code][cube.months[monthCodes[row]] - first] += cube.values[row];
+        });
+
+        var series = cube.order[dimension].filter(function (code) {
+            return sums[code] !== null;
+        }).map(function (code) {
+            var value = sums[code].reduce(function (sum, month) { return sum + month; }, 0);
+            return {label: labels[code], sums: sums[code], value: value};
+        });
+        if (limit && series.length > limit + 1) {
+            var keep = largest(series, limit);
+            var others = {
+                label: "Outros (" + (series.length - limit) + ")", sums: new Float64Array(last - first + 1), value: 0
+            };
+            series = series.filter(function (item, i) {
+                if (!keep[i]) {
+                    item.sums.forEach(function (value, month) { others.sums[month] += value; });
+                }
+                return keep[i];
+            });
+            series.push(others);
+        }
+
+        var months = [];
+        for (var ordinal = first; ordinal <= last; ordinal++) {
+            months.push(monthLabel(ordinal));
+        }
+        return {months: months, series: series};
+    }
+
+    // Equivalente ao px.line(color=dimensão, markers=True) montado por build_trend_chart
+    function trendChart(trend, dimension, metric, colors, cube) {
+        var metrics = Object.keys(cube.trend_metrics);
+        var position = metrics.indexOf(metric);
+        var data = trend.series.map(function (item) {
+            var customdata = [];
+            item.sums.forEach(function (value, month) {
+                customdata.push([value, change(value, item.sums[month - 1]), change(value, item.sums[month - 12])]);
+            });
+            return {
+                type: "scatter", mode: "lines+markers", orientation: "v", showlegend: true,
+                name: item.label, legendgroup: item.label, line: {dash: "solid"}, marker: {symbol: "circle"},
+                x: trend.months,
+                y: customdata.map(function (values) { return values[position]; }),
+                customdata: customdata,
+                hovertemplate: "%{x|%m/%Y}<br>R$ %{customdata[0]:,.2f}" +
+                    "<br>Mês anterior: %{customdata[1]:+.2f}%" +
+                    "<br>Ano anterior: %{customdata[2]:+.2f}%<extra>%{fullData.name}</extra>"
+            };
+        });
+        return {
+            data: data,
+            layout: {
+                template: cube.trend_template,
+                colorway: colors,
+                title: {text: "Evolução Mensal por " + dimension, font: {size: 18, color: "#333"}},
+                xaxis: {title: {text: "Mês"}, type: "date", tickformat: "%m/%Y"},
+                yaxis: {title: {text: cube.trend_metrics[metric]}},
+                legend: {title: {text: dimension, font: {size: 12}}, tracegroupgap: 0},
+                font: {color: "#333"},
+                plot_bgcolor: "#C0C0C0",
+                paper_bgcolor: "#C0C0C0"
+            }
+        };
+    }
+
+    function palette(nClicks) {
+        return (nClicks || 0) % 2 === 1 ? DALTONIC_COLORS : NORMAL_COLORS;
+    }
+
+    function info(items) {
+        return items.map(function (item) {
+            return {
+                namespace: "dash_html_components", type: "Div",
+                props: {children: item.label + ": R$ " + formatMoney(item.value) + " (" + item.percent.toFixed(2) + "%)"}
+            };
+        });
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        apura: {
+            // Filtros atuais serializados para o formulário de exportação
+            export_filters: function (dates, hospitals, costCenters, categories) {
+                return JSON.stringify([dates || [], hospitals || [], costCenters || [], categories || []]);
+            },
+
+            // Filtros da tabela de detalhes: só repassados ao servidor com a tabela aberta
+            // (a versão do snapshot vai junto, para a tabela acompanhar os dados novos)
+            drilldown_filters: function (dates, hospitals, costCenters, categories, version, target) {
+                if (!target) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                return {filters: [dates, hospitals, costCenters, categories], version: version};
+            },
+
+            filter_options: function (dates, hospitals, costCenters, categories, cube) {
+                if (!cube) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                return filterOptions(cube, [dates, hospitals, costCenters, categories]);
+            },
+
+            // Evolução mensal: todos os meses, com os filtros de hospital, centro de custo e categoria
+            update_trend: function (hospitals, costCenters, categories, dimension, metric, nClicks, cube) {
+                if (!cube) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                var rows = selectRows(cube, [null, hospitals, costCenters, categories], 0);
+                if (rows.length === 0) {
+                    return {};
+                }
+                return trendChart(monthly(cube, rows, dimension, cube.top_n), dimension, metric, palette(nClicks), cube);
+            },
+
+            update_dashboard: function (dates, hospitals, costCenters, categories, nClicks, cube) {
+                if (!cube) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                var isDaltonicMode = (nClicks || 0) % 2 === 1;
+                var colors = palette(nClicks);
+                var buttonText = isDaltonicMode ? "Modo Normal" : "Modo Daltonismo";
+
+                var rows = selectRows(cube, [dates, hospitals, costCenters, categories]);
+                if (rows.length === 0) {
+                    return [{}, {}, {}, {}, NO_DATA_MESSAGE, NO_DATA_MESSAGE,
+                        NO_DATA_MESSAGE, NO_DATA_MESSAGE, buttonText];
+                }
+
+                var total = rows.reduce(function (sum, row) { return sum + cube.values[row]; }, 0);
+                var category = topItems(totals(cube, rows, "Categoria"), cube.top_n);
+                var subcategory = topItems(totals(cube, rows, "Subcategoria"), cube.top_n);
+                var hospital = topItems(totals(cube, rows, "Hospital"), cube.top_n);
+                var costCenter = topItems(totals(cube, rows, "Centro de Custo"), cube.top_n);
+
+                return [
+                    barChart(category, "Categoria", colors, cube.template),
+                    barChart(subcategory, "Subcategoria", colors, cube.template),
+                    barChart(hospital, "Hospital", colors, cube.template),
+                    barChart(costCenter, "Centro de Custo", colors, cube.template),
+                    "Valor Total: R$ " + formatMoney(total),
+                    info(category),
+                    info(subcategory),
+                    info(hospital),
+                    buttonText
+                ];
+            }
+        }
+    });
+})();
@@ -0,0 +1,283 @@
+"""Benchmark do Apura-SUS com planilhas sintéticas.
+
+Gera planilhas com o mesmo esquema da original (de 10 mil a 10 milhões de
+linhas) e mede, sem navegador, a ingestão, o cubo, as etapas dos callbacks
+(recorte, totais, gráficos, evolução mensal, opções dos filtros) e o
+relatório em PDF. Cada etapa é medida em um passe de tempo (repetido) e em
+outro passe com o tracemalloc, para o pico de memória. O resultado vai para
+um arquivo JSON que pode ser comparado com o de outra versão:
+
+    python benchmark.py --rows 10000 100000 1000000 --output resultados.json
+    python benchmark.py --rows 10000 100000 --compare resultados.json
+"""
+import argparse
+import datetime
+import gc
+import gzip
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+import dashboard
+from data_source import Snapshot
+from ingestion import ingest
+from reports import build_pdf
+
+# Tamanhos medidos quando --rows não é informado
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# Meses de histórico e cardinalidades das dimensões (próximas às da planilha original)
+MONTHS = 60
+COST_CENTERS = 61
+CATEGORIES = 4
+SUBCATEGORIES_PER_CATEGORY = 10
+
+
+def synthetic_sheet(rows, seed=0):
+    """Planilha sintética no formato em que o Google Sheets a entrega (tudo texto).
+
+    O número de hospitais cresce com o tamanho da planilha (3 a 200), como
+    numa rede que passa a usar o dashboard; os valores seguem o formato
+    brasileiro ("1.234,56"), como na planilha original.
+    """
+    rng = np.random.default_rng(seed)
+    hospitals = np.array([f"HOSPITAL REGIONAL {i:03d}" for i in range(min(max(3, rows // 50_000), 200))], dtype=object)
+    cost_centers = np.array([f"Centro de Custo {i:02d}" for i in range(COST_CENTERS)], dtype=object)
+    categories = np.array([f"Categoria {i}" for i in range(CATEGORIES)], dtype=object)
+    months = np.array(
+        [period.strftime("%m/%Y") for period in pd.period_range("2020-01", periods=MONTHS, freq="M")],
+        dtype=object,
+    )
+
+    category_codes = rng.integers(0, CATEGORIES, rows)
+    subcategory_codes = category_codes * SUBCATEGORIES_PER_CATEGORY + rng.integers(0, SUBCATEGORIES_PER_CATEGORY, rows)
+    cents = rng.lognormal(mean=9, sigma=2, size=rows).astype(np.int64)
+    reais = pd.Series(cents // 100)
+    valor = (
+        "R$ "
+        + reais.map("{:,}".format).str.replace(",", ".", regex=False)
+        + ","
+        + pd.Series(cents % 100).astype(str).str.zfill(2)
+    )
+
+    return pd.DataFrame({
+        "Data": months[rng.integers(0, MONTHS, rows)],
+        "Hospital": hospitals[rng.integers(0, len(hospitals), rows)],
+        "Tipo de Custo": np.where(rng.random(rows) < 0.8, "Direto", "Indireto").astype(object),
+        "Centro de Custo": cost_centers[rng.integers(0, COST_CENTERS, rows)],
+        "Categoria": categories[category_codes],
+        "Subcategoria": np.array([f"Subcategoria {i:02d}" for i in range(CATEGORIES * SUBCATEGORIES_PER_CATEGORY)], dtype=object)[subcategory_codes],
+        "Valor": valor.to_numpy(dtype=object),
+    })
+
+
+def scenarios(cube):
+    # Seleções típicas: um mês de um hospital, o último ano da rede inteira e tudo
+    options = {dimension: cube.options(dimension) for dimension in dashboard.AGGREGATE_DIMENSIONS + ["Data"]}
+    months = sorted(options["Data"], key=lambda label: label[3:] + label[:2])
+    return {
+        "estreito": dashboard.normalize_filters(
+            months[-1:], options["Hospital"][:1], options["Centro de Custo"][:5], options["Categoria"][:1],
+        ),
+        "ultimo_ano": dashboard.normalize_filters(
+            months[-12:], options["Hospital"], options["Centro de Custo"], options["Categoria"],
+        ),
+        "tudo": dashboard.normalize_filters(
+            options["Data"], options["Hospital"], options["Centro de Custo"], options["Categoria"],
+        ),
+    }
+
+
+def callback_stages(snapshot, filters):
+    """Etapas dos callbacks do dashboard para uma seleção, na ordem em que rodam.
+
+    Cada etapa chama as mesmas funções dos callbacks (get_slice,
+    compute_totals, render_panel, render_trend, compute_aggregates); os
+    caches do dashboard são esvaziados no início de cada passe, para que
+    cada etapa reaproveite só o que a anterior calculou, como numa
+    requisição nova.
+    """
+    cube = snapshot.cube
+    state = {}
+
+    def slice_():
+        dashboard.clear_caches(snapshot)
+        state["slice"] = dashboard.get_slice(snapshot, filters)
+
+    def totals():
+        state["totals"] = {
+            dimension: dashboard.compute_totals(snapshot, filters, dimension)
+            for dimension in dashboard.AGGREGATE_DIMENSIONS
+        }
+
+    def figures():
+        state["figures"] = [
+            dashboard.render_panel(snapshot, filters, dimension)[0]
+            for dimension in dashboard.AGGREGATE_DIMENSIONS
+        ]
+
+    def serialize():
+        # Serialização da resposta, como o Dash faz ao devolver as figuras, e a compressão do servidor
+        payload = to_json_plotly(state["figures"]).encode()
+        state["payload"] = len(payload)
+        state["payload_gzip"] = len(gzip.compress(payload, compresslevel=dashboard.compression_level or 6))
+
+    def trend():
+        dashboard.render_trend(snapshot, (None, *filters[1:]), "Hospital", "Valor")
+
+    def filter_options():
+        cube.filter_options(filters)
+
+    def pdf():
+        state["pdf"] = len(build_pdf(filters, dashboard.compute_aggregates(snapshot, filters)))
+
+    return [
+        ("slice", slice_), ("totals", totals), ("figure", figures), ("serialize", serialize),
+        ("trend", trend), ("filter_options", filter_options), ("pdf", pdf),
+    ], state
+
+
+def measure(stages, memory):
+    """Rodar as etapas em sequência; com memory, devolve o pico de cada uma (em bytes)."""
+    results = {}
+    for name, function in stages:
+        gc.collect()
+        if memory:
+            tracemalloc.start()
+            function()
+            results[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            function()
+            results[name] = time.perf_counter() - start
+    return results
+
+
+def summarize(timings, peaks):
+    return {
+        name: {
+            "median_s": statistics.median(values),
+            "min_s": min(values),
+            "max_s": max(values),
+            "peak_bytes": peaks.get(name),
+        }
+        for name, values in timings.items()
+    }
+
+
+def run_size(rows, repeat, seed):
+    logging.getLogger().info("Gerando planilha sintética com %d linhas", rows)
+    raw = synthetic_sheet(rows, seed)
+    state = {}
+
+    def ingest_():
+        state["df"] = ingest(raw)
+
+    def cube_():
+        state["snapshot"] = Snapshot(1, state["df"])
+
+    def cooccurrence():
+        state["snapshot"].cube.cooccurrence
+
+    load_stages = [("ingest", ingest_), ("cube", cube_), ("cooccurrence", cooccurrence)]
+    timings = {name: [] for name, _ in load_stages}
+    for _ in range(repeat):
+        for name, seconds in measure(load_stages, memory=False).items():
+            timings[name].append(seconds)
+    peaks = measure(load_stages, memory=True)
+    result = {"rows": rows, "ingested_rows": len(state["df"]), "cells": len(state["snapshot"].cube)}
+    result["load"] = summarize(timings, peaks)
+
+    result["scenarios"] = {}
+    for scenario, filters in scenarios(state["snapshot"].cube).items():
+        stages, stage_state = callback_stages(state["snapshot"], filters)
+        timings = {name: [] for name, _ in stages}
+        for _ in range(repeat):
+            for name, seconds in measure(stages, memory=False).items():
+                timings[name].append(seconds)
+        peaks = measure(stages, memory=True)
+        result["scenarios"][scenario] = {
+            "stages": summarize(timings, peaks),
+            "payload_bytes": stage_state["payload"],
+            "payload_gzip_bytes": stage_state["payload_gzip"],
+            "pdf_bytes": stage_state["pdf"],
+        }
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(current, baseline):
+    # Razão entre as medianas (atual / referência) de cada etapa presente nos dois arquivos
+    previous = {result["rows"]: result for result in baseline["results"]}
+    lines = []
+    for result in current["results"]:
+        old = previous.get(result["rows"])
+        if old is None:
+            continue
+        pairs = [("load", name, stats, old["load"].get(name)) for name, stats in result["load"].items()]
+        for scenario, data in result["scenarios"].items():
+            old_stages = old["scenarios"].get(scenario, {}).get("stages", {})
+            pairs += [(scenario, name, stats, old_stages.get(name)) for name, stats in data["stages"].items()]
+        for group, name, stats, old_stats in pairs:
+            if old_stats:
+                ratio = stats["median_s"] / old_stats["median_s"] if old_stats["median_s"] else float("inf")
+                lines.append(f"{result['rows']:>10} {group:<12} {name:<16} {old_stats['median_s']:>10.4f}s {stats['median_s']:>10.4f}s {ratio:>7.2f}x")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="tamanhos das planilhas sintéticas")
+    parser.add_argument("--repeat", type=int, default=3, help="repetições do passe de tempo")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json", help="arquivo JSON com os resultados")
+    parser.add_argument("--compare", help="resultado de outra versão para comparar as medianas")
+    args = parser.parse_args(argv)
+
+    report = {"environment": environment(), "repeat": args.repeat, "seed": args.seed, "results": []}
+    for rows in args.rows:
+        report["results"].append(run_size(rows, args.repeat, args.seed))
+        # Pico de memória residente do processo até aqui (em bytes no Linux: ru_maxrss vem em KB)
+        report["results"][-1]["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        # Gravar a cada tamanho, para não perder as medições já feitas
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        logging.getLogger().info("Resultados gravados em %s", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(report, json.load(f)))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+from ingestion import format_month
+
+# Dimensões do cubo, na ordem da chave da tabela fato
+DIMENSIONS = ["Data", "Hospital", "Centro de Custo", "Categoria", "Subcategoria"]
+
+# Filtros do dashboard mapeados para as dimensões do cubo
+FILTER_DIMENSIONS = ["Data", "Hospital", "Centro de Custo", "Categoria"]
+
+# Colunas da série mensal (CubeSlice.monthly)
+MONTH_COLUMN = "Mês"
+MONTH_OVER_MONTH = "Variação Mensal (%)"
+YEAR_OVER_YEAR = "Variação Anual (%)"
+
+# Rótulo dos itens agrupados fora dos maiores (seguido da quantidade, como em "Outros (12)")
+OTHERS_LABEL = "Outros"
+
+
+def _smallest_code_dtype(n_values):
+    # Menor inteiro capaz de representar todos os códigos da dimensão
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_values < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _encode(column):
+    # Códigos (ordem de primeira aparição, como em unique()), rótulos e chaves de ordenação
+    codes, uniques = pd.factorize(column, sort=False, use_na_sentinel=False)
+    uniques = pd.Index(uniques)
+    if isinstance(uniques, pd.PeriodIndex):
+        # Meses: rótulo Mês/Ano, ordenados cronologicamente
+        return codes, pd.Index(format_month(uniques), dtype=object), uniques.asi8
+    # Demais dimensões: rótulos em texto, em ordem alfabética (mesma ordem do groupby)
+    labels = pd.Index(np.asarray(uniques, dtype=object))
+    return codes, labels, labels.to_numpy()
+
+
+class SpendCube:
+    """Cubo OLAP pré-agregado dos gastos.
+
+    Guarda uma tabela fato somada por (Data, Hospital, Centro de Custo,
+    Categoria, Subcategoria), com cada dimensão codificada como inteiro. Os
+    filtros e os totais do dashboard passam a custar proporcionalmente ao
+    número de combinações distintas, e não ao número de linhas da planilha.
+    """
+
+    def __init__(self, df):
+        self.categories = {}
+        self._sort_keys = {}
+        self._sorted_positions = {}
+        codes = {}
+
+        # Codificar cada dimensão
+        for dimension in DIMENSIONS:
+            codes[dimension], self.categories[dimension], self._sort_keys[dimension] = _encode(df[dimension])
+            self._sorted_positions[dimension] = np.argsort(self._sort_keys[dimension], kind="stable")
+
+        # Somar o Valor por combinação distinta das dimensões
+        fact = pd.DataFrame(codes)
+        fact["Valor"] = df["Valor"].to_numpy(dtype="float64")
+        grouped = fact.groupby(DIMENSIONS, sort=False)
+
+        # Célula da tabela fato de cada linha original (para recuperar as linhas de um recorte)
+        self.row_cells = grouped.ngroup().to_numpy(dtype=np.int32)
+        fact = grouped["Valor"].agg(["sum", "size"]).reset_index()
+
+        self.codes = {
+            dimension: fact[dimension].to_numpy(
+                dtype=_smallest_code_dtype(len(self.categories[dimension]))
+            )
+            for dimension in DIMENSIONS
+        }
+        self.values = fact["sum"].to_numpy(dtype="float64")
+        # Linhas originais por célula (uma célula pode ficar vazia depois de um merge)
+        self.counts = fact["size"].to_numpy(dtype=np.int64)
+
+    def to_arrays(self):
+        """Arrays que definem o cubo, para gravá-lo em disco e lê-lo sem recalcular.
+
+        labels/<dimensão> são os rótulos na ordem dos códigos e months o
+        ordinal (meses desde 01/1970) de cada código de Data.
+        """
+        arrays = {
+            "values": self.values,
+            "counts": self.counts,
+            "row_cells": self.row_cells,
+            "months": np.asarray(self._sort_keys["Data"], dtype=np.int64),
+        }
+        for dimension in DIMENSIONS:
+            arrays[f"codes/{dimension}"] = self.codes[dimension]
+            arrays[f"labels/{dimension}"] = self.categories[dimension].to_numpy(dtype=object)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        # Cubo a partir de to_arrays(); os arrays são usados como estão (por exemplo, mapeados
+        # de um arquivo, somente leitura), e só os rótulos e a sua ordem são montados aqui
+        cube = cls.__new__(cls)
+        cube.categories, cube._sort_keys, cube._sorted_positions = {}, {}, {}
+        for dimension in DIMENSIONS:
+            cube.categories[dimension] = pd.Index(arrays[f"labels/{dimension}"], dtype=object)
+            if dimension == "Data":
+                cube._sort_keys[dimension] = arrays["months"]
+            else:
+                cube._sort_keys[dimension] = cube.categories[dimension].to_numpy()
+            cube._sorted_positions[dimension] = np.argsort(cube._sort_keys[dimension], kind="stable")
+        cube.codes = {dimension: arrays[f"codes/{dimension}"] for dimension in DIMENSIONS}
+        cube.values = arrays["values"]
+        cube.counts = arrays["counts"]
+        cube.row_cells = arrays["row_cells"]
+        return cube
+
+    def merge(self, new_df, keep=None, old_values=None):
+        """Novo cubo com as linhas de new_df acrescentadas, sem recalcular as demais.
+
+        Rótulos novos entram no final de cada dimensão e combinações novas no
+        final da tabela fato, de modo que os códigos e as células existentes
+        continuam valendo; só as células tocadas são somadas. Com keep (máscara
+        sobre as linhas atuais), as linhas descartadas são subtraídas das suas
+        células, usando old_values (o Valor de cada linha atual). As linhas do
+        novo cubo seguem a ordem: linhas mantidas e depois as de new_df.
+        """
+        cube = SpendCube.__new__(SpendCube)
+        values = self.values.copy()
+        counts = self.counts.copy()
+        row_cells = self.row_cells
+
+        if keep is not None and not keep.all():
+            removed = self.row_cells[~keep]
+            values -= np.bincount(removed, weights=old_values[~keep], minlength=len(values))
+            counts -= np.bincount(removed, minlength=len(counts))
+            values[counts == 0] = 0.0
+            row_cells = self.row_cells[keep]
+
+        # Traduzir os códigos das linhas novas para os códigos do cubo atual
+        cube.categories, cube._sort_keys, cube._sorted_positions = {}, {}, {}
+        new_codes = {}
+        for dimension in DIMENSIONS:
+            codes, labels, sort_keys = _encode(new_df[dimension])
+            positions = self.categories[dimension].get_indexer(labels)
+            unseen = positions < 0
+            cube.categories[dimension] = self.categories[dimension]
+            cube._sort_keys[dimension] = self._sort_keys[dimension]
+            cube._sorted_positions[dimension] = self._sorted_positions[dimension]
+            if unseen.any():
+                positions[unseen] = len(cube.categories[dimension]) + np.arange(unseen.sum())
+                cube.categories[dimension] = cube.categories[dimension].append(labels[unseen])
+                cube._sort_keys[dimension] = np.concatenate([cube._sort_keys[dimension], sort_keys[unseen]])
+                cube._sorted_positions[dimension] = np.argsort(cube._sort_keys[dimension], kind="stable")
+            new_codes[dimension] = positions[codes]
+
+        # Somar as linhas novas por combinação e localizar as células já existentes
+        fact = pd.DataFrame(new_codes)
+        fact["Valor"] = new_df["Valor"].to_numpy(dtype="float64")
+        grouped = fact.groupby(DIMENSIONS, sort=False)
+        groups = grouped.ngroup().to_numpy()
+        fact = grouped["Valor"].agg(["sum", "size"]).reset_index()
+
+        existing = pd.MultiIndex.from_arrays([self.codes[dimension] for dimension in DIMENSIONS])
+        cells = existing.get_indexer(pd.MultiIndex.from_frame(fact[DIMENSIONS]))
+        unseen = cells < 0
+        cells[unseen] = len(values) + np.arange(unseen.sum())
+
+        values = np.concatenate([values, np.zeros(unseen.sum())])
+        counts = np.concatenate([counts, np.zeros(unseen.sum(), dtype=np.int64)])
+        values[cells] += fact["sum"].to_numpy(dtype="float64")
+        counts[cells] += fact["size"].to_numpy(dtype=np.int64)
+
+        cube.codes = {
+            dimension: np.concatenate([
+                self.codes[dimension], fact[dimension].to_numpy()[unseen],
+            ]).astype(_smallest_code_dtype(len(cube.categories[dimension])))
+            for dimension in DIMENSIONS
+        }
+        cube.values = values
+        cube.counts = counts
+        cube.row_cells = np.concatenate([row_cells, cells[groups]]).astype(np.int32)
+        return cube
+
+    def __len__(self):
+        return len(self.values)
+
+    def options(self, dimension):
+        # Valores distintos da dimensão, na ordem em que aparecem na planilha
+        # (sem os que só existiam em linhas já removidas por um merge)
+        categories = self.categories[dimension]
+        present = np.bincount(self.codes[dimension], weights=self.counts, minlength=len(categories)) > 0
+        return [label for label, keep in zip(categories, present) if keep]
+
+    @functools.cached_property
+    def month_axis(self):
+        # Meses consecutivos do primeiro ao último (inclusive os sem lançamentos) e a
+        # posição de cada código de Data nesse eixo; calculado uma vez por cubo
+        ordinals = np.asarray(self._sort_keys["Data"], dtype=np.int64)
+        if len(ordinals) == 0:
+            return pd.PeriodIndex([], freq="M"), np.empty(0, dtype=np.int64)
+        first = ordinals.min()
+        months = pd.period_range(pd.Period(ordinal=first, freq="M"), periods=ordinals.max() - first + 1, freq="M")
+        return months, ordinals - first
+
+    @functools.cached_property
+    def cell_index(self):
+        # Índice invertido de row_cells: as linhas de cada célula ficam contíguas em order,
+        # entre offsets[célula] e offsets[célula + 1]; montado no primeiro uso
+        order = np.argsort(self.row_cells, kind="stable")
+        offsets = np.zeros(len(self.values) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.row_cells, minlength=len(self.values)), out=offsets[1:])
+        return order, offsets
+
+    @functools.cached_property
+    def cooccurrence(self):
+        # Índice de coocorrência dos filtros, montado uma vez por cubo (no primeiro uso)
+        return CooccurrenceIndex(self)
+
+    def filter_options(self, selections):
+        # Opções de cada filtro compatíveis com as seleções dos demais (ordem de options())
+        valid = self.cooccurrence.valid(selections)
+        return [
+            [label for label, keep in zip(self.categories[dimension], valid[dimension]) if keep]
+            for dimension in FILTER_DIMENSIONS
+        ]
+
+    def _lookup(self, dimension, selected):
+        # Tabela booleana indexada pelo código: True para os valores selecionados
+        lookup = np.zeros(len(self.categories[dimension]), dtype=bool)
+        if selected:
+            positions = self.categories[dimension].get_indexer(list(selected))
+            lookup[positions[positions >= 0]] = True
+        return lookup
+
+    def to_dict(self):
+        # Versão compacta para o navegador: rótulos de cada dimensão uma única vez e
+        # a tabela fato em colunas de códigos inteiros (só as células com linhas); months é o
+        # ordinal (meses desde 01/1970) de cada código de Data
+        live = self.counts > 0
+        return {
+            "dimensions": DIMENSIONS,
+            "labels": {dimension: self.categories[dimension].tolist() for dimension in DIMENSIONS},
+            "months": np.asarray(self._sort_keys["Data"], dtype=np.int64).tolist(),
+            "order": {dimension: self._sorted_positions[dimension].tolist() for dimension in DIMENSIONS},
+            "codes": {dimension: self.codes[dimension][live].tolist() for dimension in DIMENSIONS},
+            "values": self.values[live].tolist(),
+        }
+
+    def slice(self, dates, hospitals, cost_centers, categories):
+        # Aplicar os quatro filtros do dashboard sobre a tabela fato (None: sem filtro)
+        mask = np.ones(len(self.values), dtype=bool)
+        for dimension, selected in zip(FILTER_DIMENSIONS, (dates, hospitals, cost_centers, categories)):
+            if selected is None:
+                continue
+            mask &= self._lookup(dimension, selected)[self.codes[dimension]]
+        return CubeSlice(self, mask)
+
+
+class CooccurrenceIndex:
+    """Índice de coocorrência entre os valores dos filtros.
+
+    A tabela fato é projetada nas dimensões dos filtros (combinações
+    distintas que têm linhas) e cada valor de cada dimensão guarda um bitset
+    das combinações em que aparece. As opções válidas de um filtro, dadas as
+    seleções dos demais, saem de operações OR/AND entre bitsets, sem passar
+    pelas células do cubo. Só as palavras de 64 bits não nulas do contexto
+    são conferidas, em blocos, sem matrizes temporárias do tamanho do índice.
+    """
+
+    # Palavras de 64 bits por bloco na busca das opções válidas
+    CHUNK_WORDS = 2048
+
+    def __init__(self, cube):
+        live = cube.counts > 0
+        combos = pd.DataFrame({
+            dimension: cube.codes[dimension][live] for dimension in FILTER_DIMENSIONS
+        }).drop_duplicates()
+        positions = np.arange(len(combos))
+        # Bitsets em palavras de 64 bits inteiras (o bit mais alto de cada byte primeiro, como no packbits)
+        n_bytes = (len(combos) + 63) // 64 * 8
+        masks = (0x80 >> (positions & 7)).astype(np.uint8)
+
+        self.bits = {}
+        self._codes = {}
+        self._present = {}
+        for dimension in FILTER_DIMENSIONS:
+            codes = combos[dimension].to_numpy()
+            self._codes[dimension] = {label: code for code, label in enumerate(cube.categories[dimension])}
+            self._present[dimension] = np.bincount(codes, minlength=len(cube.categories[dimension])) > 0
+            bits = np.zeros((len(cube.categories[dimension]), n_bytes), dtype=np.uint8)
+            np.bitwise_or.at(bits, (codes, positions >> 3), masks)
+            self.bits[dimension] = bits.view(np.uint64)
+        self._all = np.zeros(n_bytes, dtype=np.uint8)
+        self._all[:(len(combos) + 7) // 8] = np.packbits(np.ones(len(combos), dtype=bool))
+        self._all = self._all.view(np.uint64)
+
+    def _union(self, dimension, codes):
+        # OR dos bitsets dos valores, acumulado sem cópias
+        bits = self.bits[dimension]
+        union = np.zeros_like(self._all)
+        for code in codes:
+            np.bitwise_or(union, bits[code], out=union)
+        return union
+
+    def _selected(self, dimension, selected):
+        # Combinações com algum dos valores selecionados (None: sem seleção, ou todos os valores)
+        if not selected:
+            return None
+        codes = self._codes[dimension]
+        chosen = np.zeros(len(self._present[dimension]), dtype=bool)
+        chosen[[codes[value] for value in selected if value in codes]] = True
+        chosen &= self._present[dimension]
+        rest = self._present[dimension] & ~chosen
+        if not rest.any():
+            return None
+        # Cada combinação tem um único valor por dimensão: com mais da metade dos valores
+        # selecionada, basta tirar do total as combinações dos demais
+        if chosen.sum() <= rest.sum():
+            return self._union(dimension, np.flatnonzero(chosen))
+        return self._all & ~self._union(dimension, np.flatnonzero(rest))
+
+    def _matching(self, dimension, context):
+        # Valores da dimensão com alguma combinação em context: só as palavras não nulas de
+        # context são conferidas, em blocos, e a busca para assim que todos os valores apareceram
+        bits = self.bits[dimension]
+        valid = np.zeros(len(self._present[dimension]), dtype=bool)
+        candidates = np.flatnonzero(self._present[dimension])
+        words = np.flatnonzero(context)
+        for start in range(0, len(words), self.CHUNK_WORDS):
+            chunk = words[start:start + self.CHUNK_WORDS]
+            hit = (bits[np.ix_(candidates, chunk)] & context[chunk]).any(axis=1)
+            valid[candidates[hit]] = True
+            candidates = candidates[~hit]
+            if len(candidates) == 0:
+                break
+        return valid
+
+    def valid(self, selections):
+        """Valores de cada filtro que coexistem com as seleções dos outros três.
+
+        selections segue a ordem de FILTER_DIMENSIONS; um filtro sem seleção
+        não restringe os demais. Devolve, por dimensão, uma máscara booleana
+        indexada pelo código do valor.
+        """
+        selected = [
+            self._selected(dimension, values) for dimension, values in zip(FILTER_DIMENSIONS, selections)
+        ]
+        valid = {}
+        for position, dimension in enumerate(FILTER_DIMENSIONS):
+            others = [bits for other, bits in enumerate(selected) if other != position and bits is not None]
+            if not others:
+                valid[dimension] = self._present[dimension].copy()
+                continue
+            context = others[0]
+            for bits in others[1:]:
+                context = context & bits
+            valid[dimension] = self._matching(dimension, context)
+        return valid
+
+
+class CubeSlice:
+    """Recorte filtrado de um SpendCube."""
+
+    def __init__(self, cube, mask):
+        self.cube = cube
+        self.mask = mask
+        self.values = cube.values[mask]
+        self.counts = cube.counts[mask]
+
+    @property
+    def empty(self):
+        return not self.counts.any()
+
+    def row_mask(self):
+        # Linhas do DataFrame original que pertencem ao recorte
+        return self.mask[self.cube.row_cells]
+
+    def rows(self, dimension=None, label=None):
+        # Posições (em ordem crescente) das linhas originais do recorte, opcionalmente só as
+        # de um valor da dimensão; custa o número de linhas devolvidas, não o total
+        mask = self.mask
+        if dimension is not None:
+            code = self.cube.categories[dimension].get_indexer([label])[0]
+            mask = mask & (self.cube.codes[dimension] == code)
+        cells = np.flatnonzero(mask)
+        order, offsets = self.cube.cell_index
+        starts = offsets[cells]
+        lengths = offsets[cells + 1] - starts
+        first = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - first, lengths) + np.arange(lengths.sum())
+        return np.sort(order[positions])
+
+    def total(self):
+        return float(self.values.sum())
+
+    def totals(self, dimension):
+        # Equivalente a filtered_df.groupby(dimension)["Valor"].sum().reset_index()
+        categories = self.cube.categories[dimension]
+        codes = self.cube.codes[dimension][self.mask]
+        sums = np.bincount(codes, weights=self.values, minlength=len(categories))
+        present = np.bincount(codes, weights=self.counts, minlength=len(categories)) > 0
+
+        positions = self.cube._sorted_positions[dimension]
+        positions = positions[present[positions]]
+        return pd.DataFrame({
+            dimension: categories.take(positions),
+            "Valor": sums[positions],
+        })
+
+    def monthly(self, dimension, limit=None):
+        """Série mensal dos gastos por valor da dimensão, com as variações (ver monthly_frame).
+
+        As células do recorte são somadas numa matriz mês x valor, de modo que
+        o custo depende do número de células (como em totals) e não dos meses
+        de histórico.
+        """
+        months, month_positions = self.cube.month_axis
+        categories = self.cube.categories[dimension]
+        codes = self.cube.codes[dimension][self.mask]
+        rows = month_positions[self.cube.codes["Data"][self.mask]]
+
+        sums = np.bincount(
+            rows * len(categories) + codes, weights=self.values, minlength=len(months) * len(categories),
+        ).reshape(len(months), len(categories))
+        present = np.bincount(codes, weights=self.counts, minlength=len(categories)) > 0
+        positions = self.cube._sorted_positions[dimension]
+        positions = positions[present[positions]]
+        month_counts = np.bincount(rows, weights=self.counts, minlength=len(months))
+        return monthly_frame(
+            months, categories.take(positions).to_numpy(), sums[:, positions], month_counts, dimension, limit,
+        )
+
+
+def monthly_frame(months, labels, sums, month_counts, dimension, limit=None):
+    """Série mensal a partir da matriz mês x valor da dimensão.
+
+    months são meses consecutivos (as linhas de sums), labels os valores da
+    dimensão (as colunas de sums, na ordem de exibição) e month_counts as
+    linhas de cada mês. A variação mensal compara com o mês anterior e a
+    anual com o mesmo mês do ano anterior (vazias quando a base é zero). Com
+    limit, só os limit valores de maior gasto no período têm série própria;
+    os demais são somados numa série OTHERS_LABEL, no final. A série vai do
+    primeiro ao último mês com lançamentos.
+    """
+    sums = np.asarray(sums, dtype="float64")  # O bincount de um recorte vazio é inteiro
+    if limit and len(labels) > limit + 1:
+        keep = np.zeros(len(labels), dtype=bool)
+        keep[np.argsort(-sums.sum(axis=0), kind="stable")[:limit]] = True
+        sums = np.column_stack([sums[:, keep], sums[:, ~keep].sum(axis=1)])
+        labels = np.append(labels[keep], f"{OTHERS_LABEL} ({(~keep).sum()})")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        month_over_month = np.full_like(sums, np.nan)
+        month_over_month[1:] = (sums[1:] - sums[:-1]) / sums[:-1] * 100
+        year_over_year = np.full_like(sums, np.nan)
+        year_over_year[12:] = (sums[12:] - sums[:-12]) / sums[:-12] * 100
+    month_over_month[~np.isfinite(month_over_month)] = np.nan
+    year_over_year[~np.isfinite(year_over_year)] = np.nan
+
+    with_rows = np.flatnonzero(month_counts)
+    span = slice(with_rows[0], with_rows[-1] + 1) if len(with_rows) else slice(0, 0)
+    months = months[span]
+    return pd.DataFrame({
+        MONTH_COLUMN: np.repeat(months.to_timestamp(), len(labels)),
+        dimension: np.tile(labels, len(months)),
+        "Valor": sums[span].ravel(),
+        MONTH_OVER_MONTH: month_over_month[span].ravel(),
+        YEAR_OVER_YEAR: year_over_year[span].ravel(),
+    })
@@ -1,163 +1,365 @@
-import pandas as pd
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output, State
+from dash import dash_table, dcc, html, Patch
+from dash.dependencies import ClientsideFunction, Input, Output, State
 import plotly.express as px
-from fpdf import FPDF
-import io
+import plotly.io as pio
 import base64
-from flask import send_file, Flask
-import os
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from flask import send_file, Flask, Response, abort, g, jsonify, request, stream_with_context
+import cProfile
+import functools
+import gzip
+import hmac
 import json
+import logging
+import os
+import time
+import pandas as pd
+from cube import OTHERS_LABEL, MONTH_COLUMN, MONTH_OVER_MONTH, YEAR_OVER_YEAR
+from data_source import DataSource, FederatedSource, LocalFileSource, SheetsSource, SnapshotCache
+from drilldown import PAGE_SIZE, filter_rows, page_count, page_records, sort_rows
+from exports import iter_aggregates_csv, iter_row_chunks, iter_rows_csv, iter_xlsx
+from lru_cache import LRUCache
+from metrics import REGISTRY, STAGE_SECONDS, Counter, Gauge, finish_trace, observe_size, stage, start_trace
+from reports import ReportQueue, build_pdf, report_key
+from sql_store import SqlStore
+
+# Logs da aplicação (carga e ingestão dos dados, relatórios)
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
 
 # Inicializa o servidor Flask
 server = Flask(__name__)
 app = dash.Dash(__name__, server=server)
 
-# Configurar o acesso ao Google Sheets
-def load_data_from_sheets(sheet_url):
-    # Escopo da API
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+# URL da planilha no Google Sheets
+sheet_url = "https://docs.google.com/spreadsheets/d/1xpIBGZibAYcOjrs5yR0lBggW8OBziMzPnJb-5Vfef38/edit?usp=sharing"
 
-    # Credenciais da conta de serviço
-    credentials = ServiceAccountCredentials.from_json_keyfile_dict(
-        json.loads(os.environ["GOOGLE_SHEETS_CREDENTIALS"]), scope
-    )
+# Intervalos (em segundos) de atualização dos dados e de verificação de nova versão pelo navegador
+refresh_interval = int(os.environ.get("DATA_REFRESH_INTERVAL", 300))
+snapshot_poll_interval = int(os.environ.get("SNAPSHOT_POLL_INTERVAL", 30))
 
-    # Autenticar e acessar o Google Sheets
-    client = gspread.authorize(credentials)
+# Modo de filtragem no navegador: o cubo vai uma vez por snapshot e as interações não chamam o servidor
+clientside_filtering = os.environ.get("CLIENTSIDE_FILTERING", "0") == "1"
 
-    # Abrir a planilha pelo URL
-    sheet = client.open_by_url(sheet_url)
+# Arquivo local (xlsx/CSV) opcional no lugar do Google Sheets, e cache local em Parquet
+data_file = os.environ.get("DATA_SOURCE_FILE")
+cache_path = os.environ.get("DATA_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "apura-sus.parquet"))
 
-    # Selecionar a primeira aba da planilha
-    worksheet = sheet.get_worksheet(0)
+# Sincronização incremental do Google Sheets (só as linhas novas ou alteradas são baixadas)
+incremental_sync = os.environ.get("SHEETS_INCREMENTAL_SYNC", "0") == "1"
 
-    # Obter os dados como uma lista de listas
-    data = worksheet.get_all_records()
+# Backend das consultas dos filtros: pandas (cubo em memória, padrão), sqlite ou duckdb (banco local em disco)
+query_backend = os.environ.get("QUERY_BACKEND", "pandas")
+sql_path = os.environ.get("SQL_DATABASE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", f"apura-sus.{query_backend}"))
 
-    # Converter para um DataFrame do Pandas
-    df = pd.DataFrame(data)
+# Várias fontes (abas, planilhas e arquivos locais) unidas em um snapshot: lista em JSON,
+# direto na variável ou em um arquivo .json
+data_sources = os.environ.get("DATA_SOURCES")
+data_source_workers = int(os.environ.get("DATA_SOURCE_WORKERS", 0)) or None
 
-    return df
+def configured_source():
+    if data_sources:
+        if os.path.isfile(data_sources):
+            with open(data_sources) as f:
+                entries = json.load(f)
+        else:
+            entries = json.loads(data_sources)
+        return FederatedSource.from_config(entries, max_workers=data_source_workers)
+    if data_file:
+        return LocalFileSource(data_file)
+    return SheetsSource(sheet_url, incremental=incremental_sync)
 
-# URL da planilha no Google Sheets
-sheet_url = "https://docs.google.com/spreadsheets/d/1xpIBGZibAYcOjrs5yR0lBggW8OBziMzPnJb-5Vfef38/edit?usp=sharing"
+# Fonte de dados atualizada em segundo plano (a carga não bloqueia a inicialização)
+data_source = DataSource(
+    configured_source(),
+    refresh_interval=refresh_interval,
+    cache=SnapshotCache(cache_path) if cache_path else None,
+    follow_interval=snapshot_poll_interval,
+)
+
+# Banco SQL local com cada snapshot, consultado no lugar do cubo e do DataFrame em memória por
+# todas as consultas do dashboard (filtros, totais, gráficos, detalhes e exportações)
+sql_store = SqlStore(sql_path, engine=query_backend) if query_backend != "pandas" else None
+if sql_store is not None and not cache_path:
+    logging.getLogger(__name__).warning(
+        "QUERY_BACKEND=%s sem DATA_CACHE_PATH: cada processo mantém o DataFrame e o cubo em memória", query_backend,
+    )
+if sql_store is not None and clientside_filtering:
+    # O navegador filtraria o cubo, que o backend SQL não carrega
+    logging.getLogger(__name__).warning("CLIENTSIDE_FILTERING=1 ignorado com QUERY_BACKEND=%s", query_backend)
+    clientside_filtering = False
+
+def prepare_sql_store(snapshot):
+    # Montar o banco do snapshot antes da publicação, a partir de uma leitura avulsa do DataFrame
+    # (nada a fazer se outro processo já o montou)
+    if sql_store is None or snapshot.fingerprint is None or sql_store.exists(snapshot.fingerprint):
+        return
+    with stage("data_load", "sql_build"):
+        sql_store.build(snapshot.read_frame(), snapshot.fingerprint)
 
-# Substitua a função de carregamento de dados local
-df = load_data_from_sheets(sheet_url)
+data_source.prepare(prepare_sql_store)
 
-# Tratar a coluna 'Data' como texto
-df['Data'] = df['Data'].astype(str).str.strip()  # Converter para texto e remover espaços extras
-print("Valores únicos na coluna 'Data':", df['Data'].unique())  # Verificar valores únicos
+# Com o backend SQL, as consultas de um snapshot vão ao banco (o snapshot vazio da inicialização,
+# sem impressão digital, não tem banco e usa o cubo vazio)
+def use_sql(snapshot):
+    return sql_store is not None and snapshot.fingerprint is not None
 
-# Tratar a coluna 'Valor' como numérico
-df['Valor'] = pd.to_numeric(df['Valor'].str.replace(',', '').str.strip(), errors='coerce')
+def sql_reader(snapshot):
+    reader = sql_store.reader(snapshot.fingerprint)
+    if reader is None:
+        # Banco apagado depois da publicação (por exemplo, por dois snapshots mais novos)
+        prepare_sql_store(snapshot)
+        reader = sql_store.reader(snapshot.fingerprint)
+    return reader
 
-# Garantir que a coluna 'Valor' seja numérica no DataFrame original
-df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
+# Valores distintos de uma dimensão e opções válidas de cada filtro no contexto dos demais
+def dimension_options(snapshot, dimension):
+    if use_sql(snapshot):
+        return sql_reader(snapshot).options(dimension)
+    return snapshot.cube.options(dimension)
 
-# Verificar valores inválidos na coluna 'Valor'
-if df['Valor'].isna().any():
-    print("Valores inválidos encontrados na coluna 'Valor':")
-    print(df[df['Valor'].isna()])
-    df = df.dropna(subset=['Valor'])  # Remover linhas com valores inválidos (opcional)
+def filter_options(snapshot, selections):
+    if use_sql(snapshot):
+        return sql_reader(snapshot).filter_options(selections)
+    return snapshot.cube.filter_options(selections)
 
-# Pré-visualizar os dados processados
-print("Pré-visualização dos dados processados após o tratamento:")
-print(df.head())
+# Dimensões e medidas do gráfico de evolução mensal
+TREND_DIMENSIONS = ["Hospital", "Categoria", "Centro de Custo", "Subcategoria"]
+TREND_METRICS = {
+    "Valor": "Valor (R$)",
+    MONTH_OVER_MONTH: "Variação mensal (%)",
+    YEAR_OVER_YEAR: "Variação anual (%)",
+}
 
 # Valor inicial para os filtros
-initial_date = df['Data'].unique()[0] if df['Data'].nunique() > 0 else "Sem Dados"
-initial_hospital = df['Hospital'].unique()[0] if df['Hospital'].nunique() > 0 else "Sem Dados"
-initial_cost_center = df['Centro de Custo'].unique()[0] if df['Centro de Custo'].nunique() > 0 else "Sem Dados"
-initial_category = df['Categoria'].unique()[0] if df['Categoria'].nunique() > 0 else "Sem Dados"
-
-# Layout do Dashboard
-app.layout = html.Div(
-    children=[
-
-        html.Img(
-            src="/assets/logoses.png",  # Caminho para a logo
-            className="logo",  # Classe CSS para posicionar a logo
-            style={"width": "100px", "height": "auto", "position": "absolute", "top": "10px", "left": "10px"}
-        ),
-        
-        # Botão para Modo Daltonismo
-        html.Button(
-            "Modo Daltonismo", 
-            id="color-mode-button",  # ID do botão
-            n_clicks=0,  # Contador de cliques
-            style={
-                'position': 'absolute',
-                'top': '10px',
-                'right': '10px',
-                'padding': '10px 20px',
-                'backgroundColor': '#007bff',
-                'color': 'white',
-                'border': 'none',
-                'borderRadius': '5px',
-                'cursor': 'pointer',
-                'fontSize': '14px'
-            }
-        ),
+def initial_value(options):
+    return options[0] if len(options) > 0 else "Sem Dados"
 
-        html.Button(
-            "Gerar Relatório (PDF)", 
-            id="generate-pdf-button",  # ID do botão
-            n_clicks=0,  # Contador de cliques
-            style={
-                'position': 'absolute',
-                'top': '10px',
-                'right': '10px',
-                'padding': '10px 20px',
-                'backgroundColor': '#28a745',
-                'color': 'white',
-                'border': 'none',
-                'borderRadius': '5px',
-                'cursor': 'pointer',
-                'fontSize': '14px'
-            }
-        ),
-        dcc.Download(id="download-pdf"),  # Componente para gerenciar o download
-        
-        html.H1(
-            "Apura-SUS",
-            className="custom-title"  # Classe CSS para o título
-        ),
+# Layout do Dashboard (gerado a cada carregamento de página a partir do snapshot atual)
+def serve_layout():
+    snapshot = data_source.current()
+
+    date_options = dimension_options(snapshot, 'Data')
+    hospital_options = dimension_options(snapshot, 'Hospital')
+    cost_center_options = dimension_options(snapshot, 'Centro de Custo')
+    category_options = dimension_options(snapshot, 'Categoria')
+
+    return html.Div(
+        children=[
+
+            html.Img(
+                src="/assets/logoses.png",  # Caminho para a logo
+                className="logo",  # Classe CSS para posicionar a logo
+                style={"width": "100px", "height": "auto", "position": "absolute", "top": "10px", "left": "10px"}
+            ),
         
-        # Filtros
-        html.Div([
-            html.Label("Filtrar por Data (Mês/Ano):"),
-            dcc.Dropdown(
-                id="date-filter",
-                options=[{"label": date, "value": date} for date in df['Data'].unique()],
-                value=[initial_date],  # Valor inicial como lista
-                multi=True  # Permitir múltiplas seleções
+            # Botão para Modo Daltonismo
+            html.Button(
+                "Modo Daltonismo", 
+                id="color-mode-button",  # ID do botão
+                n_clicks=0,  # Contador de cliques
+                style={
+                    'position': 'absolute',
+                    'top': '10px',
+                    'right': '10px',
+                    'padding': '10px 20px',
+                    'backgroundColor': '#007bff',
+                    'color': 'white',
+                    'border': 'none',
+                    'borderRadius': '5px',
+                    'cursor': 'pointer',
+                    'fontSize': '14px'
+                }
+            ),
+
+            html.Button(
+                "Gerar Relatório (PDF)", 
+                id="generate-pdf-button",  # ID do botão
+                n_clicks=0,  # Contador de cliques
+                style={
+                    'position': 'absolute',
+                    'top': '10px',
+                    'right': '10px',
+                    'padding': '10px 20px',
+                    'backgroundColor': '#28a745',
+                    'color': 'white',
+                    'border': 'none',
+                    'borderRadius': '5px',
+                    'cursor': 'pointer',
+                    'fontSize': '14px'
+                }
             ),
-            html.Label("Filtrar por Hospital:"),
-            dcc.Dropdown(
-                id="hospital-filter",
-                options=[{"label": hospital, "value": hospital} for hospital in df['Hospital'].unique()],
-                value=[initial_hospital],  # Valor inicial como lista
-                multi=True  # Permitir múltiplas seleções
+            dcc.Download(id="download-pdf"),  # Componente para gerenciar o download
+
+            # Andamento do relatório em PDF gerado em segundo plano
+            dcc.Store(id="pdf-job"),
+            dcc.Interval(id="pdf-poll", interval=1000, disabled=True),
+            html.Div(
+                id="pdf-status",
+                style={
+                    'position': 'absolute',
+                    'top': '55px',
+                    'right': '10px',
+                    'color': 'white',
+                    'fontSize': '14px'
+                }
             ),
-            html.Label("Filtrar por Centro de Custo:"),
+
+            # Identificação do snapshot exibido (a mesma em todos os workers) e verificação
+            # periódica de nova versão
+            dcc.Store(id="data-version", data=snapshot.token),
+            dcc.Interval(id="snapshot-poll", interval=snapshot_poll_interval * 1000),
+            *([dcc.Store(id="cube-store")] if clientside_filtering else []),
+        
+            html.H1(
+                "Apura-SUS",
+                className="custom-title"  # Classe CSS para o título
+            ),
+        
+            # Filtros
             html.Div([
+                html.Label("Filtrar por Data (Mês/Ano):"),
+                dcc.Dropdown(
+                    id="date-filter",
+                    options=[{"label": date, "value": date} for date in date_options],
+                    value=[initial_value(date_options)],  # Valor inicial como lista
+                    multi=True  # Permitir múltiplas seleções
+                ),
+                html.Label("Filtrar por Hospital:"),
                 dcc.Dropdown(
-                    id="cost-center-filter",
-                    options=[{"label": cost_center, "value": cost_center} for cost_center in df['Centro de Custo'].unique()],
-                    value=[initial_cost_center],  # Apenas o primeiro valor selecionado inicialmente
+                    id="hospital-filter",
+                    options=[{"label": hospital, "value": hospital} for hospital in hospital_options],
+                    value=[initial_value(hospital_options)],  # Valor inicial como lista
                     multi=True  # Permitir múltiplas seleções
                 ),
+                html.Label("Filtrar por Centro de Custo:"),
+                html.Div([
+                    dcc.Dropdown(
+                        id="cost-center-filter",
+                        options=[{"label": cost_center, "value": cost_center} for cost_center in cost_center_options],
+                        value=[initial_value(cost_center_options)],  # Apenas o primeiro valor selecionado inicialmente
+                        multi=True  # Permitir múltiplas seleções
+                    ),
+                    html.Button(
+                        "Selecionar Todos", 
+                        id="select-all-cost-centers",  # ID do botão
+                        n_clicks=0,  # Contador de cliques
+                        style={
+                            'marginTop': '10px',
+                            'padding': '10px 20px',
+                            'backgroundColor': '#007bff',
+                            'color': 'white',
+                            'border': 'none',
+                            'borderRadius': '5px',
+                            'cursor': 'pointer',
+                            'fontSize': '14px'
+                        }
+                    )
+                ]),
+                html.Label("Filtrar por Categoria:"),
+                dcc.Dropdown(
+                    id="category-filter",
+                    options=[{"label": category, "value": category} for category in category_options],
+                    value=[initial_value(category_options)],  # Valor inicial como lista
+                    multi=True  # Permitir múltiplas seleções
+                ),
+                # Valor Total logo abaixo dos filtros
+                html.H3(
+                    id="total-value",
+                    className="total-value",  # Classe CSS para o valor total
+                    style={
+                        'marginTop': '20px',  # Espaçamento superior
+                        'color': 'white',  # Cor branca para o texto
+                        'textAlign': 'center'  # Centralizar o texto
+                    }
+                ),
+                # Exportação dos dados filtrados (enviada por formulário e baixada em partes)
+                html.Form([
+                    dcc.Input(id="export-filters", name="filters", type="hidden"),
+                    html.Button("Exportar Linhas (CSV)", name="kind", value="linhas.csv", type="submit", style={
+                            'marginTop': '10px',
+                            'marginRight': '10px',
+                            'padding': '10px 20px',
+                            'backgroundColor': '#28a745',
+                            'color': 'white',
+                            'border': 'none',
+                            'borderRadius': '5px',
+                            'cursor': 'pointer',
+                            'fontSize': '14px'
+                        }),
+                    html.Button("Exportar Totais (CSV)", name="kind", value="totais.csv", type="submit", style={
+                            'marginTop': '10px',
+                            'marginRight': '10px',
+                            'padding': '10px 20px',
+                            'backgroundColor': '#28a745',
+                            'color': 'white',
+                            'border': 'none',
+                            'borderRadius': '5px',
+                            'cursor': 'pointer',
+                            'fontSize': '14px'
+                        }),
+                    html.Button("Exportar Tudo (XLSX)", name="kind", value="relatorio.xlsx", type="submit", style={
+                            'marginTop': '10px',
+                            'marginRight': '10px',
+                            'padding': '10px 20px',
+                            'backgroundColor': '#28a745',
+                            'color': 'white',
+                            'border': 'none',
+                            'borderRadius': '5px',
+                            'cursor': 'pointer',
+                            'fontSize': '14px'
+                        }),
+                ], action="/export", method="POST", style={'textAlign': 'center'}),
+            ], className="custom-card"),  # Classe CSS para o card dos filtros
+        
+            # Informações sobre os gastos por hospital, categorias e centro de custo
+            html.Div([
+                html.H3(
+                    "Informações sobre os Gastos por Hospital, Categorias e Centro de Custo",
+                    style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'marginBottom': '20px'
+                    }
+                ),
+                # Informações por Categoria
+                html.Div([
+                    html.H4("Gastos por Categoria:", style={'color': 'white'}),
+                    html.Div(id="category-info", style={'color': 'white', 'fontSize': '16px'})
+                ], className="custom-card"),
+                # Informações por Subcategoria
+                html.Div([
+                    html.H4("Gastos por Subcategoria:", style={'color': 'white'}),
+                    html.Div(id="subcategory-info", style={'color': 'white', 'fontSize': '16px'})
+                ], className="custom-card"),
+                # Informações por Hospital
+                html.Div([
+                    html.H4("Gastos por Hospital:", style={'color': 'white'}),
+                    html.Div(id="hospital-info", style={'color': 'white', 'fontSize': '16px'})
+                ], className="custom-card"),
+            ], className="custom-card"),
+        
+            # Gráficos
+            html.Div([
+                dcc.Graph(id="category-bar-chart"),  # Gráfico de barras para categorias
+                dcc.Graph(id="subcategory-bar-chart"),  # Gráfico de barras para subcategorias
+                dcc.Graph(id="hospital-bar-chart"),  # Gráfico de barras para hospitais
+                dcc.Graph(id="cost-center-bar-chart"),  # Gráfico de barras para centro de custo
+            ], className="custom-card"),  # Classe CSS para o card dos gráficos
+
+            # Detalhes da barra clicada: linhas da planilha, paginadas, ordenadas e filtradas no servidor
+            dcc.Store(id="drilldown-target"),
+            dcc.Store(id="drilldown-filters"),  # Filtros repassados à tabela enquanto ela está aberta
+            html.Div([
+                html.H3(id="drilldown-title", style={'color': 'white'}),
                 html.Button(
-                    "Selecionar Todos", 
-                    id="select-all-cost-centers",  # ID do botão
-                    n_clicks=0,  # Contador de cliques
+                    "Fechar",
+                    id="drilldown-close",
+                    n_clicks=0,
                     style={
-                        'marginTop': '10px',
+                        'marginBottom': '10px',
                         'padding': '10px 20px',
                         'backgroundColor': '#007bff',
                         'color': 'white',
@@ -166,317 +368,896 @@ app.layout = html.Div(
                         'cursor': 'pointer',
                         'fontSize': '14px'
                     }
-                )
-            ]),
-            html.Label("Filtrar por Categoria:"),
-            dcc.Dropdown(
-                id="category-filter",
-                options=[{"label": category, "value": category} for category in df['Categoria'].unique()],
-                value=[initial_category],  # Valor inicial como lista
-                multi=True  # Permitir múltiplas seleções
-            ),
-            # Valor Total logo abaixo dos filtros
-            html.H3(
-                id="total-value",
-                className="total-value",  # Classe CSS para o valor total
-                style={
-                    'marginTop': '20px',  # Espaçamento superior
-                    'color': 'white',  # Cor branca para o texto
-                    'textAlign': 'center'  # Centralizar o texto
-                }
-            ),
-        ], className="custom-card"),  # Classe CSS para o card dos filtros
-        
-        # Informações sobre os gastos por hospital, categorias e centro de custo
-        html.Div([
-            html.H3(
-                "Informações sobre os Gastos por Hospital, Categorias e Centro de Custo",
-                style={
-                    'textAlign': 'center',
-                    'color': 'white',
-                    'marginBottom': '20px'
-                }
-            ),
-            # Informações por Categoria
-            html.Div([
-                html.H4("Gastos por Categoria:", style={'color': 'white'}),
-                html.Div(id="category-info", style={'color': 'white', 'fontSize': '16px'})
-            ], className="custom-card"),
-            # Informações por Subcategoria
-            html.Div([
-                html.H4("Gastos por Subcategoria:", style={'color': 'white'}),
-                html.Div(id="subcategory-info", style={'color': 'white', 'fontSize': '16px'})
-            ], className="custom-card"),
-            # Informações por Hospital
+                ),
+                dash_table.DataTable(
+                    id="drilldown-table",
+                    columns=[
+                        {"name": column, "id": column, "type": "numeric", "format": dash_table.FormatTemplate.money(2)}
+                        if column == "Valor" else {"name": column, "id": column}
+                        for column in snapshot.columns
+                    ],
+                    page_current=0,
+                    page_size=PAGE_SIZE,
+                    page_action="custom",
+                    sort_action="custom",
+                    sort_mode="multi",
+                    filter_action="custom",
+                    filter_query="",
+                    style_table={'overflowX': 'auto'}
+                ),
+            ], id="drilldown-card", className="custom-card", style={'display': 'none'}),
+
+            # Evolução mensal (todos os meses, com os demais filtros aplicados)
             html.Div([
-                html.H4("Gastos por Hospital:", style={'color': 'white'}),
-                html.Div(id="hospital-info", style={'color': 'white', 'fontSize': '16px'})
+                html.Label("Evolução mensal por:"),
+                dcc.RadioItems(
+                    id="trend-dimension",
+                    options=[{"label": dimension, "value": dimension} for dimension in TREND_DIMENSIONS],
+                    value="Hospital",
+                    inline=True
+                ),
+                dcc.RadioItems(
+                    id="trend-metric",
+                    options=[{"label": label, "value": metric} for metric, label in TREND_METRICS.items()],
+                    value="Valor",
+                    inline=True
+                ),
+                dcc.Graph(id="trend-chart"),  # Gráfico de linhas mês a mês
             ], className="custom-card"),
-        ], className="custom-card"),
-        
-        # Gráficos
-        html.Div([
-            dcc.Graph(id="category-bar-chart"),  # Gráfico de barras para categorias
-            dcc.Graph(id="subcategory-bar-chart"),  # Gráfico de barras para subcategorias
-            dcc.Graph(id="hospital-bar-chart"),  # Gráfico de barras para hospitais
-            dcc.Graph(id="cost-center-bar-chart"),  # Gráfico de barras para centro de custo
-        ], className="custom-card"),  # Classe CSS para o card dos gráficos
-    ]
-)
+        ]
+    )
 
-# Callback para atualizar os gráficos e o valor total com base nos filtros
-@app.callback(
-    [Output("category-bar-chart", "figure"),
-     Output("subcategory-bar-chart", "figure"),
-     Output("hospital-bar-chart", "figure"),
-     Output("cost-center-bar-chart", "figure"),
-     Output("total-value", "children"),
-     Output("category-info", "children"),  # Informações por Categoria
-     Output("subcategory-info", "children"),  # Informações por Subcategoria
-     Output("hospital-info", "children"),  # Informações por Hospital
-     Output("color-mode-button", "children")],  # Atualiza o texto do botão
-    [Input("date-filter", "value"),
-     Input("hospital-filter", "value"),
-     Input("cost-center-filter", "value"),
-     Input("category-filter", "value"),
-     Input("color-mode-button", "n_clicks")]  # Número de cliques no botão
-)
-def update_dashboard(dates, hospitals, cost_centers, categories, n_clicks):
-    # Determinar o modo com base no número de cliques
-    is_daltonic_mode = n_clicks % 2 == 1  # Alterna entre True e False
-    
-    # Cores para o modo normal e daltônico
-    normal_colors = px.colors.qualitative.Plotly
-    daltonic_colors = px.colors.qualitative.Safe  # Paleta amigável para Deuteranopia
-    
-    # Escolher as cores com base no modo
-    colors = daltonic_colors if is_daltonic_mode else normal_colors
-    
-    # Garantir que a coluna 'Valor' seja numérica no DataFrame original
-    df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
-    
-    # Filtrar os dados com base nos filtros selecionados
-    filtered_df = df[
-        (df['Data'].isin(dates)) &
-        (df['Hospital'].isin(hospitals)) &
-        (df['Centro de Custo'].isin(cost_centers)) &
-        (df['Categoria'].isin(categories))
-    ]
-    
-    # Garantir que a coluna 'Valor' seja numérica no DataFrame filtrado
-    filtered_df['Valor'] = pd.to_numeric(filtered_df['Valor'], errors='coerce')
-    
-    # Verificar se há dados filtrados
-    if filtered_df.empty:
-        return {}, {}, {}, {}, "Nenhum dado encontrado para os filtros selecionados.", "Nenhum dado encontrado para os filtros selecionados.", "Nenhum dado encontrado para os filtros selecionados.", "Nenhum dado encontrado para os filtros selecionados.", "Modo Daltonismo" if is_daltonic_mode else "Modo Normal"
-    
-    # Calcular o valor total
-    total_value = f"Valor Total: R$ {filtered_df['Valor'].sum():,.2f}"
-    
-    # Gráfico de barras para categorias
-    category_totals = filtered_df.groupby("Categoria")["Valor"].sum().reset_index()
-    category_totals["Percentual"] = (category_totals["Valor"] / category_totals["Valor"].sum()) * 100
-    category_bar_chart = px.bar(
-        category_totals,
-        x="Categoria",
+app.layout = serve_layout
+
+# Caches das agregações (por filtros) e das figuras já serializadas (por filtros e dimensão)
+figure_cache_size = int(os.environ.get("FIGURE_CACHE_SIZE", 128))
+aggregate_cache = LRUCache(maxsize=figure_cache_size)
+figure_cache = LRUCache(maxsize=figure_cache_size)
+
+# Um novo snapshot invalida tudo o que foi calculado com o anterior
+def clear_caches(snapshot):
+    aggregate_cache.clear()
+    figure_cache.clear()
+
+data_source.subscribe(clear_caches)
+
+# Mensagem exibida quando os filtros não retornam dados
+NO_DATA_MESSAGE = "Nenhum dado encontrado para os filtros selecionados."
+
+# Dimensões agregadas pelo dashboard
+AGGREGATE_DIMENSIONS = ["Categoria", "Subcategoria", "Hospital", "Centro de Custo"]
+
+# Itens exibidos por gráfico e lista de informações; os demais são somados em "Outros" (0: todos)
+chart_top_n = int(os.environ.get("CHART_TOP_N", 0))
+
+# Cores para o modo normal e daltônico (paleta amigável para Deuteranopia)
+def palette(n_clicks):
+    is_daltonic_mode = (n_clicks or 0) % 2 == 1  # Alterna entre True e False
+    return px.colors.qualitative.Safe if is_daltonic_mode else px.colors.qualitative.Plotly
+
+# Normalizar a seleção dos filtros (a ordem dos valores não altera o resultado)
+def normalize_filters(dates, hospitals, cost_centers, categories):
+    return tuple(
+        tuple(sorted(set(selected or []), key=str))
+        for selected in (dates, hospitals, cost_centers, categories)
+    )
+
+# Recorte do cubo para os filtros (compartilhado entre os callbacks)
+def get_slice(snapshot, filters):
+    def compute():
+        with stage("update_dashboard", "slice"):
+            return snapshot.cube.slice(*filters)
+
+    return aggregate_cache.get_or_compute((snapshot.version, filters), compute)
+
+# Somas por combinação de dimensões consultadas no banco (uma consulta por seleção de filtros)
+def get_sql_cells(snapshot, filters, reader):
+    def compute():
+        with stage("update_dashboard", "sql"):
+            return reader.cells(filters)
+
+    return aggregate_cache.get_or_compute((snapshot.version, filters, "sql"), compute)
+
+# Valor total para os filtros (None quando não há dados)
+def compute_total(snapshot, filters):
+    if use_sql(snapshot):
+        cells = get_sql_cells(snapshot, filters, sql_reader(snapshot))
+        return float(cells["Valor"].sum()) if len(cells) else None
+    cube_slice = get_slice(snapshot, filters)
+    return None if cube_slice.empty else cube_slice.total()
+
+# Totais de uma dimensão (com percentual) para os filtros
+def compute_totals(snapshot, filters, dimension):
+    def compute():
+        if use_sql(snapshot):
+            cells = get_sql_cells(snapshot, filters, sql_reader(snapshot))
+            with stage("update_dashboard", "totals"):
+                totals = cells.groupby(dimension, sort=True)["Valor"].sum().reset_index()
+        else:
+            cube_slice = get_slice(snapshot, filters)
+            with stage("update_dashboard", "totals"):
+                totals = cube_slice.totals(dimension)
+        totals["Percentual"] = (totals["Valor"] / totals["Valor"].sum()) * 100
+        return totals
+
+    return aggregate_cache.get_or_compute((snapshot.version, filters, dimension), compute)
+
+# Valor total e totais de todas as dimensões (None quando não há dados)
+def compute_aggregates(snapshot, filters):
+    total = compute_total(snapshot, filters)
+    if total is None:
+        return None
+    aggregates = {"total": total}
+    for dimension in AGGREGATE_DIMENSIONS:
+        aggregates[dimension] = compute_totals(snapshot, filters, dimension)
+    return aggregates
+
+# Maiores itens de uma dimensão (na ordem original) e os demais somados em um item "Outros (n)"
+def top_n(totals, dimension, limit=None):
+    limit = chart_top_n if limit is None else limit
+    if not limit or len(totals) <= limit + 1:
+        return totals
+    keep = totals.index.isin(totals["Valor"].nlargest(limit).index)
+    rest = totals[~keep]
+    others = pd.DataFrame({
+        dimension: [f"{OTHERS_LABEL} ({len(rest)})"],
+        "Valor": [rest["Valor"].sum()],
+        "Percentual": [rest["Percentual"].sum()],
+    })
+    return pd.concat([totals[keep], others], ignore_index=True)
+
+# Chaves do layout do template padrão usadas pelos gráficos cartesianos (as demais são de mapas, 3D etc.)
+TEMPLATE_LAYOUT_KEYS = {
+    "autotypenumbers", "colorway", "font", "hovermode", "hoverlabel", "paper_bgcolor", "plot_bgcolor",
+    "xaxis", "yaxis", "title", "annotationdefaults", "shapedefaults",
+}
+
+# Atributos próprios de cada trace (os demais, quando iguais em todas, vão para o template)
+TRACE_DATA_KEYS = {"type", "name", "x", "y", "text", "customdata"}
+
+def _merge(base, override):
+    merged = dict(base)
+    for key, value in override.items():
+        merged[key] = _merge(merged[key], value) if isinstance(value, dict) and isinstance(merged.get(key), dict) else value
+    return merged
+
+# Template padrão reduzido ao layout cartesiano e aos padrões de um tipo de trace (calculado uma vez)
+@functools.lru_cache(maxsize=None)
+def compact_template(trace_type):
+    template = pio.templates[pio.templates.default].to_plotly_json()
+    return {
+        "layout": {key: value for key, value in template["layout"].items() if key in TEMPLATE_LAYOUT_KEYS},
+        "data": {trace_type: template["data"].get(trace_type, [{}])},
+    }
+
+# Figura do plotly express sem as repetições: o template padrão completo vai só com o que os
+# gráficos usam, e os atributos repetidos em cada trace (estilo, textos, hovertemplate) passam
+# a ser definidos uma vez, nos padrões do template
+def compact_figure(figure):
+    data = figure["data"]
+    if not data:
+        return figure
+    trace_type = data[0].get("type", "scatter")
+    shared = {
+        key: value for key, value in data[0].items()
+        if key not in TRACE_DATA_KEYS and all(trace.get(key) == value for trace in data[1:])
+    }
+    traces = []
+    for trace in data:
+        trace = {key: value for key, value in trace.items() if key not in shared}
+        # O plotly express repete o nome da trace nos grupos (uma trace por valor da dimensão)
+        for key in ("legendgroup", "offsetgroup"):
+            if key in trace and trace[key] == trace.get("name"):
+                del trace[key]
+        traces.append(trace)
+    template = compact_template(trace_type)
+    defaults = _merge(template["data"][trace_type][0], shared)
+    return {
+        "data": traces,
+        "layout": {**figure["layout"], "template": {"layout": template["layout"], "data": {trace_type: [defaults]}}},
+    }
+
+# Gráfico de barras de uma dimensão
+def build_bar_chart(totals, dimension):
+    # Centavos e percentuais com duas casas, como são exibidos
+    totals = totals.round({"Valor": 2, "Percentual": 2})
+    bar_chart = px.bar(
+        totals,
+        x=dimension,
         y="Valor",
         text="Percentual",  # Adiciona os percentuais como rótulos
-        title="Gastos por Categoria",
-        color="Categoria",
-        color_discrete_sequence=colors
+        title=f"Gastos por {dimension}",
+        color=dimension
     )
-    category_bar_chart.update_traces(texttemplate='%{text:.2f}%', textposition='outside')  # Formata os rótulos
-    category_bar_chart.update_layout(
+    # As cores vêm do colorway do layout, para que a paleta possa ser trocada sem refazer o gráfico
+    bar_chart.update_traces(texttemplate='%{text:.2f}%', textposition='outside', marker_color=None)
+    bar_chart.update_layout(
         plot_bgcolor='#C0C0C0',
         paper_bgcolor='#C0C0C0',
         font=dict(color='#333'),
-        xaxis_title="Categoria",
+        xaxis_title=dimension,
         yaxis_title="Valor (R$)",
         title_font=dict(size=18, color='#333'),
         legend_title=dict(font=dict(size=12))
     )
-    
-    # Gráfico de barras para subcategorias
-    subcategory_totals = filtered_df.groupby("Subcategoria")["Valor"].sum().reset_index()
-    subcategory_totals["Percentual"] = (subcategory_totals["Valor"] / subcategory_totals["Valor"].sum()) * 100
-    subcategory_bar_chart = px.bar(
-        subcategory_totals,
-        x="Subcategoria",
-        y="Valor",
-        text="Percentual",  # Adiciona os percentuais como rótulos
-        title="Gastos por Subcategoria",
-        color="Subcategoria",
-        color_discrete_sequence=colors
+    return compact_figure(bar_chart.to_plotly_json())
+
+# Gráfico de linhas com a evolução mensal de uma dimensão
+def build_trend_chart(monthly, dimension, metric):
+    # Meses como "AAAA-MM" e valores com duas casas, para reduzir o JSON de cada ponto
+    monthly = monthly.round({"Valor": 2, MONTH_OVER_MONTH: 2, YEAR_OVER_YEAR: 2})
+    monthly[MONTH_COLUMN] = monthly[MONTH_COLUMN].dt.strftime("%Y-%m")
+    trend_chart = px.line(
+        monthly,
+        x=MONTH_COLUMN,
+        y=metric,
+        color=dimension,
+        markers=True,
+        custom_data=["Valor", MONTH_OVER_MONTH, YEAR_OVER_YEAR],
+        title=f"Evolução Mensal por {dimension}"
+    )
+    # Valor e as duas variações no tooltip; as cores vêm do colorway, como nos gráficos de barras
+    trend_chart.update_traces(
+        hovertemplate=(
+            "%{x|%m/%Y}<br>R$ %{customdata[0]:,.2f}"
+            "<br>Mês anterior: %{customdata[1]:+.2f}%"
+            "<br>Ano anterior: %{customdata[2]:+.2f}%<extra>%{fullData.name}</extra>"
+        ),
+        line_color=None,
+        marker_color=None
     )
-    subcategory_bar_chart.update_traces(texttemplate='%{text:.2f}%', textposition='outside')  # Formata os rótulos
-    subcategory_bar_chart.update_layout(
+    trend_chart.update_layout(
         plot_bgcolor='#C0C0C0',
         paper_bgcolor='#C0C0C0',
         font=dict(color='#333'),
-        xaxis_title="Subcategoria",
-        yaxis_title="Valor (R$)",
+        xaxis_title="Mês",
+        xaxis_type="date",
+        xaxis_tickformat="%m/%Y",
+        yaxis_title=TREND_METRICS[metric],
         title_font=dict(size=18, color='#333'),
         legend_title=dict(font=dict(size=12))
     )
-    
-    # Gráfico de barras para hospitais
-    hospital_totals = filtered_df.groupby("Hospital")["Valor"].sum().reset_index()
-    hospital_totals["Percentual"] = (hospital_totals["Valor"] / hospital_totals["Valor"].sum()) * 100
-    hospital_bar_chart = px.bar(
-        hospital_totals,
-        x="Hospital",
-        y="Valor",
-        text="Percentual",  # Adiciona os percentuais como rótulos
-        title="Gastos por Hospital",
-        color="Hospital",
-        color_discrete_sequence=colors
+    return compact_figure(trend_chart.to_plotly_json())
+
+# Informações sobre os gastos de uma dimensão
+def build_info(totals, dimension):
+    return [
+        html.Div(f"{label}: R$ {value:,.2f} ({percent:.2f}%)")
+        for label, value, percent in zip(totals[dimension], totals["Valor"], totals["Percentual"])
+    ]
+
+# Gráfico e informações de uma dimensão, sem a paleta (memorizados por filtros)
+def render_panel(snapshot, filters, dimension):
+    def render():
+        if compute_total(snapshot, filters) is None:
+            return {}, NO_DATA_MESSAGE
+        totals = top_n(compute_totals(snapshot, filters, dimension), dimension)
+        with stage("update_dashboard", "figure"):
+            figure = build_bar_chart(totals, dimension)
+        with stage("update_dashboard", "info"):
+            info = build_info(totals, dimension)
+        return figure, info
+
+    return figure_cache.get_or_compute((snapshot.version, filters, dimension), render)
+
+# Série mensal de uma dimensão para os filtros
+def compute_monthly(snapshot, filters, dimension):
+    with stage("update_dashboard", "monthly"):
+        if use_sql(snapshot):
+            return sql_reader(snapshot).monthly(filters, dimension, limit=chart_top_n)
+        return get_slice(snapshot, filters).monthly(dimension, limit=chart_top_n)
+
+# Gráfico de evolução mensal (memorizado por filtros, dimensão e medida)
+def render_trend(snapshot, filters, dimension, metric):
+    def render():
+        if compute_total(snapshot, filters) is None:
+            return {}
+        monthly = compute_monthly(snapshot, filters, dimension)
+        with stage("update_dashboard", "trend_figure"):
+            return build_trend_chart(monthly, dimension, metric)
+
+    return figure_cache.get_or_compute((snapshot.version, filters, "trend", dimension, metric), render)
+
+# Aplicar a paleta a uma figura memorizada sem alterá-la
+def with_palette(figure, colors):
+    if not figure:
+        return figure
+    return {**figure, "layout": {**figure["layout"], "colorway": colors}}
+
+# Entradas comuns aos callbacks que dependem dos filtros
+FILTER_INPUTS = [
+    Input("date-filter", "value"),
+    Input("hospital-filter", "value"),
+    Input("cost-center-filter", "value"),
+    Input("category-filter", "value"),
+    Input("data-version", "data"),  # Identificação do snapshot de dados
+]
+
+# Callbacks independentes para cada gráfico (e a sua lista de informações)
+def register_panel_callback(dimension, chart_id, info_id=None):
+    outputs = [Output(chart_id, "figure")]
+    if info_id is not None:
+        outputs.append(Output(info_id, "children"))
+
+    @app.callback(outputs, FILTER_INPUTS, State("color-mode-button", "n_clicks"))
+    def update_panel(dates, hospitals, cost_centers, categories, version, n_clicks):
+        snapshot = data_source.current()
+        filters = normalize_filters(dates, hospitals, cost_centers, categories)
+        figure, info = render_panel(snapshot, filters, dimension)
+        figure = with_palette(figure, palette(n_clicks))
+        return [figure, info] if info_id is not None else [figure]
+
+    return update_panel
+
+if clientside_filtering:
+    # Enviar ao navegador o cubo compacto do snapshot atual (uma vez por versão)
+    @app.callback(Output("cube-store", "data"), Input("data-version", "data"))
+    def ship_cube(version):
+        snapshot = data_source.current()
+
+        def build_payload():
+            with stage("update_dashboard", "cube_payload"):
+                payload = snapshot.cube.to_dict()
+            payload["version"] = snapshot.token
+            payload["template"] = compact_template("bar")
+            payload["trend_template"] = compact_template("scatter")
+            payload["trend_metrics"] = TREND_METRICS
+            payload["top_n"] = chart_top_n
+            return payload
+
+        return aggregate_cache.get_or_compute((snapshot.version, "cube-payload"), build_payload)
+
+    # Filtros, totais, gráficos e paleta calculados no navegador (assets/clientside.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace="apura", function_name="update_dashboard"),
+        [Output("category-bar-chart", "figure"),
+         Output("subcategory-bar-chart", "figure"),
+         Output("hospital-bar-chart", "figure"),
+         Output("cost-center-bar-chart", "figure"),
+         Output("total-value", "children"),
+         Output("category-info", "children"),
+         Output("subcategory-info", "children"),
+         Output("hospital-info", "children"),
+         Output("color-mode-button", "children")],
+        [Input("date-filter", "value"),
+         Input("hospital-filter", "value"),
+         Input("cost-center-filter", "value"),
+         Input("category-filter", "value"),
+         Input("color-mode-button", "n_clicks"),
+         Input("cube-store", "data")]
     )
-    hospital_bar_chart.update_traces(texttemplate='%{text:.2f}%', textposition='outside')  # Formata os rótulos
-    hospital_bar_chart.update_layout(
-        plot_bgcolor='#C0C0C0',
-        paper_bgcolor='#C0C0C0',
-        font=dict(color='#333'),
-        xaxis_title="Hospital",
-        yaxis_title="Valor (R$)",
-        title_font=dict(size=18, color='#333'),
-        legend_title=dict(font=dict(size=12))
+else:
+    update_category_panel = register_panel_callback("Categoria", "category-bar-chart", "category-info")
+    update_subcategory_panel = register_panel_callback("Subcategoria", "subcategory-bar-chart", "subcategory-info")
+    update_hospital_panel = register_panel_callback("Hospital", "hospital-bar-chart", "hospital-info")
+    update_cost_center_panel = register_panel_callback("Centro de Custo", "cost-center-bar-chart")
+
+    # Callback para atualizar o valor total com base nos filtros
+    @app.callback(Output("total-value", "children"), FILTER_INPUTS)
+    def update_total_value(dates, hospitals, cost_centers, categories, version):
+        total = compute_total(data_source.current(), normalize_filters(dates, hospitals, cost_centers, categories))
+        if total is None:
+            return NO_DATA_MESSAGE
+        return f"Valor Total: R$ {total:,.2f}"
+
+    # Alternar a paleta apenas reestiliza os gráficos existentes (sem recalcular os dados)
+    @app.callback(
+        [Output("category-bar-chart", "figure", allow_duplicate=True),
+         Output("subcategory-bar-chart", "figure", allow_duplicate=True),
+         Output("hospital-bar-chart", "figure", allow_duplicate=True),
+         Output("cost-center-bar-chart", "figure", allow_duplicate=True),
+         Output("color-mode-button", "children")],  # Atualiza o texto do botão
+        Input("color-mode-button", "n_clicks"),  # Número de cliques no botão
+        prevent_initial_call=True
     )
-    
-    # Gráfico de barras para centro de custo
-    cost_center_totals = filtered_df.groupby("Centro de Custo")["Valor"].sum().reset_index()
-    cost_center_totals["Percentual"] = (cost_center_totals["Valor"] / cost_center_totals["Valor"].sum()) * 100
-    cost_center_bar_chart = px.bar(
-        cost_center_totals,
-        x="Centro de Custo",
-        y="Valor",
-        text="Percentual",  # Adiciona os percentuais como rótulos
-        title="Gastos por Centro de Custo",
-        color="Centro de Custo",
-        color_discrete_sequence=colors
+    def toggle_color_mode(n_clicks):
+        colors = palette(n_clicks)
+        patches = []
+        for _ in range(4):
+            patch = Patch()
+            patch["layout"]["colorway"] = colors
+            patches.append(patch)
+
+        # Atualizar o texto do botão
+        button_text = "Modo Normal" if n_clicks % 2 == 1 else "Modo Daltonismo"
+
+        return (*patches, button_text)
+
+# Evolução mensal: todos os meses do snapshot, com os filtros de hospital, centro de custo e
+# categoria (no modo de filtragem no navegador, calculada a partir do mesmo cubo)
+if clientside_filtering:
+    app.clientside_callback(
+        ClientsideFunction(namespace="apura", function_name="update_trend"),
+        Output("trend-chart", "figure"),
+        [Input("hospital-filter", "value"),
+         Input("cost-center-filter", "value"),
+         Input("category-filter", "value"),
+         Input("trend-dimension", "value"),
+         Input("trend-metric", "value"),
+         Input("color-mode-button", "n_clicks"),
+         Input("cube-store", "data")]
     )
-    cost_center_bar_chart.update_traces(texttemplate='%{text:.2f}%', textposition='outside')  # Formata os rótulos
-    cost_center_bar_chart.update_layout(
-        plot_bgcolor='#C0C0C0',
-        paper_bgcolor='#C0C0C0',
-        font=dict(color='#333'),
-        xaxis_title="Centro de Custo",
-        yaxis_title="Valor (R$)",
-        title_font=dict(size=18, color='#333'),
-        legend_title=dict(font=dict(size=12))
+else:
+    @app.callback(
+        Output("trend-chart", "figure"),
+        [Input("hospital-filter", "value"),
+         Input("cost-center-filter", "value"),
+         Input("category-filter", "value"),
+         Input("data-version", "data"),
+         Input("trend-dimension", "value"),
+         Input("trend-metric", "value"),
+         Input("color-mode-button", "n_clicks")]
     )
-    
-    # Informações sobre os gastos por categoria
-    category_info = [
-        html.Div(f"{row['Categoria']}: R$ {row['Valor']:,.2f} ({row['Percentual']:.2f}%)")
-        for _, row in category_totals.iterrows()
-    ]
-    
-    # Informações sobre os gastos por subcategoria
-    subcategory_info = [
-        html.Div(f"{row['Subcategoria']}: R$ {row['Valor']:,.2f} ({row['Percentual']:.2f}%)")
-        for _, row in subcategory_totals.iterrows()
-    ]
-    
-    # Informações sobre os gastos por hospital
-    hospital_info = [
-        html.Div(f"{row['Hospital']}: R$ {row['Valor']:,.2f} ({row['Percentual']:.2f}%)")
-        for _, row in hospital_totals.iterrows()
-    ]
-    
-    # Atualizar o texto do botão
-    button_text = "Modo Normal" if is_daltonic_mode else "Modo Daltonismo"
-    
-    return category_bar_chart, subcategory_bar_chart, hospital_bar_chart, cost_center_bar_chart, total_value, category_info, subcategory_info, hospital_info, button_text
+    def update_trend(hospitals, cost_centers, categories, version, dimension, metric, n_clicks):
+        snapshot = data_source.current()
+        filters = (None, *normalize_filters(None, hospitals, cost_centers, categories)[1:])
+        return with_palette(render_trend(snapshot, filters, dimension, metric), palette(n_clicks))
+
+# Gráficos de barras que abrem os detalhes ao clicar numa barra, e a dimensão de cada um
+DRILLDOWN_CHARTS = {
+    "category-bar-chart": "Categoria",
+    "subcategory-bar-chart": "Subcategoria",
+    "hospital-bar-chart": "Hospital",
+    "cost-center-bar-chart": "Centro de Custo",
+}
+
+# Cache das linhas selecionadas (posições) por filtros, barra, filtro e ordenação da tabela
+drilldown_cache = LRUCache(maxsize=int(os.environ.get("DRILLDOWN_CACHE_SIZE", 16)))
+data_source.subscribe(lambda snapshot: drilldown_cache.clear())
+
+# Clicar numa barra abre os detalhes daquele valor; "Fechar" esconde a tabela
+@app.callback(
+    [Output("drilldown-target", "data"),
+     Output("drilldown-table", "page_current"),
+     Output("drilldown-table", "filter_query")],
+    [*[Input(chart_id, "clickData") for chart_id in DRILLDOWN_CHARTS],
+     Input("drilldown-close", "n_clicks")],
+    prevent_initial_call=True
+)
+def select_drilldown(*args):
+    triggered = dash.ctx.triggered_id
+    if triggered not in DRILLDOWN_CHARTS:
+        return None, 0, ""
+    click = dash.ctx.triggered[0]["value"]
+    if not click or not click.get("points"):
+        return dash.no_update, dash.no_update, dash.no_update
+    dimension, value = DRILLDOWN_CHARTS[triggered], click["points"][0]["x"]
+    # A barra "Outros" soma vários itens e não tem detalhes próprios
+    if value not in dimension_options(data_source.current(), dimension):
+        return dash.no_update, dash.no_update, dash.no_update
+    return {"dimension": dimension, "value": value}, 0, ""
+
+# Posições das linhas da tabela de detalhes (filtradas e ordenadas), memorizadas para a paginação
+def drilldown_rows(snapshot, filters, target, filter_query, sort_by):
+    sort_key = tuple((item["column_id"], item["direction"]) for item in sort_by or [])
+    key = (snapshot.version, filters, target["dimension"], target["value"], filter_query or "", sort_key)
+
+    def compute():
+        with stage("drilldown", "rows"):
+            positions = get_slice(snapshot, filters).rows(target["dimension"], target["value"])
+        with stage("drilldown", "filter"):
+            positions = filter_rows(snapshot.df, positions, filter_query)
+        with stage("drilldown", "sort"):
+            return sort_rows(snapshot.df, positions, sort_by)
+
+    return drilldown_cache.get_or_compute(key, compute)
+
+# Linhas da página atual da tabela de detalhes e o total de linhas selecionadas; com o backend SQL,
+# cada página é uma consulta ordenada e paginada no banco, e só a contagem é memorizada
+def drilldown_page(snapshot, filters, target, filter_query, sort_by, page_current, page_size):
+    if not use_sql(snapshot):
+        positions = drilldown_rows(snapshot, filters, target, filter_query, sort_by)
+        with stage("drilldown", "page"):
+            return page_records(snapshot.df, positions, page_current, page_size), len(positions)
+
+    reader = sql_reader(snapshot)
+    dimension, value = target["dimension"], target["value"]
+    key = (snapshot.version, filters, dimension, value, filter_query or "", "count")
+
+    def count():
+        with stage("drilldown", "rows"):
+            return reader.row_count(filters, dimension, value, filter_query)
+
+    rows = drilldown_cache.get_or_compute(key, count)
+    with stage("drilldown", "page"):
+        page = reader.rows(
+            filters, dimension, value, filter_query, sort_by, offset=(page_current or 0) * page_size, limit=page_size,
+        )
+    return page.to_dict("records"), rows
+
+# Os filtros só chegam à tabela de detalhes enquanto ela está aberta: com a tabela fechada,
+# mudar os filtros não gera uma requisição ao servidor
+app.clientside_callback(
+    ClientsideFunction(namespace="apura", function_name="drilldown_filters"),
+    Output("drilldown-filters", "data"),
+    [*FILTER_INPUTS, Input("drilldown-target", "data")]
+)
+
+@app.callback(
+    [Output("drilldown-table", "data"),
+     Output("drilldown-table", "page_count"),
+     Output("drilldown-title", "children"),
+     Output("drilldown-card", "style")],
+    [Input("drilldown-target", "data"),
+     Input("drilldown-table", "page_current"),
+     Input("drilldown-table", "page_size"),
+     Input("drilldown-table", "sort_by"),
+     Input("drilldown-table", "filter_query"),
+     Input("drilldown-filters", "data")]
+)
+def update_drilldown(target, page_current, page_size, sort_by, filter_query, selections):
+    if not target or not selections:
+        return [], 1, "", {'display': 'none'}
+    snapshot = data_source.current()
+    filters = normalize_filters(*selections["filters"])
+    try:
+        records, rows = drilldown_page(snapshot, filters, target, filter_query, sort_by, page_current, page_size)
+    except ValueError as error:
+        # Filtro digitado na tabela em um formato que ela não gera
+        return [], 1, f"Detalhes - {target['dimension']}: {target['value']} ({error})", {'display': 'block'}
+    title = f"Detalhes - {target['dimension']}: {target['value']} ({rows:,} linhas)"
+    return records, page_count(rows, page_size), title, {'display': 'block'}
+
+# Verificar periodicamente se há um snapshot de dados mais novo
+@app.callback(
+    Output("data-version", "data"),
+    Input("snapshot-poll", "n_intervals"),
+    State("data-version", "data"),
+    prevent_initial_call=True
+)
+def poll_data_version(n_intervals, token):
+    snapshot = data_source.current()
+    if snapshot.token == token:
+        return dash.no_update  # Nada mudou: não dispara os demais callbacks
+    if not data_source.is_latest(snapshot):
+        # Worker ainda com o snapshot anterior: não anunciar uma versão que outro já trocou
+        return dash.no_update
+    return snapshot.token
+
+# Opções de um filtro: as válidas no contexto dos demais, mais as que já estão selecionadas
+# (para que a seleção atual não suma do dropdown)
+def build_filter_options(valid, selected):
+    available = set(valid)
+    extra = [value for value in (selected or []) if value not in available]
+    return [{"label": value, "value": value} for value in valid + extra]
+
+# Opções em cascata: cada filtro mostra apenas os valores que têm dados com as seleções dos demais
+if clientside_filtering:
+    app.clientside_callback(
+        ClientsideFunction(namespace="apura", function_name="filter_options"),
+        [Output("date-filter", "options"),
+         Output("hospital-filter", "options"),
+         Output("cost-center-filter", "options"),
+         Output("category-filter", "options")],
+        [Input("date-filter", "value"),
+         Input("hospital-filter", "value"),
+         Input("cost-center-filter", "value"),
+         Input("category-filter", "value"),
+         Input("cube-store", "data")]
+    )
+else:
+    @app.callback(
+        [Output("date-filter", "options"),
+         Output("hospital-filter", "options"),
+         Output("cost-center-filter", "options"),
+         Output("category-filter", "options")],
+        FILTER_INPUTS
+    )
+    def update_filter_options(dates, hospitals, cost_centers, categories, version):
+        selections = (dates, hospitals, cost_centers, categories)
+        valid = filter_options(data_source.current(), selections)
+        return [build_filter_options(options, selected) for options, selected in zip(valid, selections)]
+
+# Manter a seleção dos filtros que ainda existe quando um novo snapshot é carregado
+@app.callback(
+    [Output("date-filter", "value"),
+     Output("hospital-filter", "value"),
+     Output("cost-center-filter", "value", allow_duplicate=True),
+     Output("category-filter", "value")],
+    Input("data-version", "data"),
+    [State("date-filter", "value"),
+     State("hospital-filter", "value"),
+     State("cost-center-filter", "value"),
+     State("category-filter", "value")],
+    prevent_initial_call=True
+)
+def sync_filters_with_snapshot(version, dates, hospitals, cost_centers, categories):
+    snapshot = data_source.current()
+    values = []
+    for dimension, selected in [('Data', dates), ('Hospital', hospitals), ('Centro de Custo', cost_centers), ('Categoria', categories)]:
+        options = dimension_options(snapshot, dimension)
+        available = set(options)
+        kept = [value for value in (selected or []) if value in available]
+        values.append(kept if kept else [initial_value(options)])
+    return values
 
 @app.callback(
     Output("cost-center-filter", "value"),  # Atualiza o valor do dropdown
-    Input("select-all-cost-centers", "n_clicks")  # Entrada do botão
+    Input("select-all-cost-centers", "n_clicks"),  # Entrada do botão
+    [State("date-filter", "value"),  # Contexto dos demais filtros
+     State("hospital-filter", "value"),
+     State("category-filter", "value")]
 )
-def select_all_cost_centers(n_clicks):
+def select_all_cost_centers(n_clicks, dates=None, hospitals=None, categories=None):
     if n_clicks > 0:  # Se o botão for clicado
-        return [cost_center for cost_center in df['Centro de Custo'].unique()]  # Seleciona todas as opções
+        # Seleciona todos os centros de custo com dados para as datas, hospitais e categorias atuais
+        cost_centers = filter_options(data_source.current(), (dates, hospitals, None, categories))[2]
+        return cost_centers if cost_centers else dash.no_update
     return dash.no_update  # Não atualiza se o botão não for clicado
 
+# Fila de relatórios em PDF (gerados em segundo plano e guardados em disco por impressão digital)
+report_cache_dir = os.environ.get("REPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "reports"))
+report_queue = ReportQueue(
+    report_cache_dir,
+    max_workers=int(os.environ.get("REPORT_WORKERS", 2)),
+    max_files=int(os.environ.get("REPORT_CACHE_SIZE", 64)),
+    stale_after=int(os.environ.get("REPORT_STALE_AFTER", 600)),
+)
+
+# Enviar o relatório pronto para download
+def send_report(key):
+    return dcc.send_bytes(
+        report_queue.read(key),  # Conteúdo do PDF
+        filename="relatorio.pdf"  # Nome do arquivo para download
+    )
+
 @app.callback(
-    Output("download-pdf", "data"),  # Vincula o download ao componente dcc.Download
-    [Input("generate-pdf-button", "n_clicks")],  # Dispara o download ao clicar no botão
+    [Output("download-pdf", "data"),  # Vincula o download ao componente dcc.Download
+     Output("pdf-job", "data"),  # Relatório em andamento
+     Output("pdf-poll", "disabled"),  # Acompanhar o andamento enquanto não fica pronto
+     Output("pdf-status", "children")],
+    [Input("generate-pdf-button", "n_clicks")],  # Dispara a geração ao clicar no botão
     [State("date-filter", "value"),  # Filtros aplicados no dashboard
      State("hospital-filter", "value"),
      State("cost-center-filter", "value"),
-     State("category-filter", "value")],
+     State("category-filter", "value"),
+     State("color-mode-button", "n_clicks")],  # Paleta usada nos gráficos do relatório
     prevent_initial_call=True  # Evita que o callback seja executado ao carregar a página
 )
-def generate_pdf(n_clicks, dates, hospitals, cost_centers, categories):
-    # Filtrar os dados com base nos filtros selecionados
-    filtered_df = df[
-        (df['Data'].isin(dates)) &
-        (df['Hospital'].isin(hospitals)) &
-        (df['Centro de Custo'].isin(cost_centers)) &
-        (df['Categoria'].isin(categories))
-    ]
+def generate_pdf(n_clicks, dates, hospitals, cost_centers, categories, color_clicks=0):
+    snapshot = data_source.current()
+    filters = normalize_filters(dates, hospitals, cost_centers, categories)
+    colors = palette(color_clicks)
+    key = report_key(snapshot, filters, colors)
 
-    # Criar o PDF
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-
-    # Adicionar a logo
-    pdf.image("assets/logoses.png", x=10, y=8, w=30)  # Ajuste o tamanho conforme necessário
-    pdf.ln(20)  # Espaçamento após a imagem
-
-    # Adicionar título principal
-    pdf.set_font("Arial", style="B", size=16)
-    pdf.cell(200, 10, txt="Relatório de Gastos - Apura SUS", ln=True, align='C')
-    pdf.ln(10)
-
-    # Adicionar informações filtradas
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt=f"Datas Selecionadas: {', '.join(dates)}", ln=True)
-    pdf.cell(200, 10, txt=f"Hospitais Selecionados: {', '.join(hospitals)}", ln=True)
-    pdf.cell(200, 10, txt=f"Centros de Custo Selecionados: {', '.join(cost_centers)}", ln=True)
-    pdf.cell(200, 10, txt=f"Categorias Selecionadas: {', '.join(categories)}", ln=True)
-    pdf.ln(10)
-
-    # Adicionar tabela de gastos por categoria
-    pdf.set_font("Arial", style="B", size=14)
-    pdf.cell(200, 10, txt="Gastos por Categoria:", ln=True)
-    pdf.set_font("Arial", size=12)
-    category_totals = filtered_df.groupby("Categoria")["Valor"].sum().reset_index()
-    for _, row in category_totals.iterrows():
-        pdf.cell(200, 10, txt=f"- {row['Categoria']}: R$ {row['Valor']:,.2f}", ln=True)
-    pdf.ln(10)
-
-    # Adicionar tabela de gastos por hospital
-    pdf.set_font("Arial", style="B", size=14)
-    pdf.cell(200, 10, txt="Gastos por Hospital:", ln=True)
-    pdf.set_font("Arial", size=12)
-    hospital_totals = filtered_df.groupby("Hospital")["Valor"].sum().reset_index()
-    for _, row in hospital_totals.iterrows():
-        pdf.cell(200, 10, txt=f"- {row['Hospital']}: R$ {row['Valor']:,.2f}", ln=True)
-    pdf.ln(10)
-
-    # Adicionar tabela de gastos por centro de custo
-    pdf.set_font("Arial", style="B", size=14)
-    pdf.cell(200, 10, txt="Gastos por Centro de Custo:", ln=True)
-    pdf.set_font("Arial", size=12)
-    cost_center_totals = filtered_df.groupby("Centro de Custo")["Valor"].sum().reset_index()
-    for _, row in cost_center_totals.iterrows():
-        pdf.cell(200, 10, txt=f"- {row['Centro de Custo']}: R$ {row['Valor']:,.2f}", ln=True)
-    pdf.ln(10)
-
-    # Salvar o PDF em memória
-    pdf_output = io.BytesIO()
-    pdf_bytes = pdf.output(dest='S').encode('latin1')
-    pdf_output.write(pdf_bytes)
-    pdf_output.seek(0)
-
-    # Retornar o PDF para download
-    return dcc.send_bytes(
-        pdf_output.getvalue(),  # Conteúdo do PDF
-        filename="relatorio.pdf"  # Nome do arquivo para download
+    # Reaproveitar as agregações já calculadas pelo dashboard para os mesmos filtros
+    def build(progress):
+        with stage("generate_pdf", "aggregate"):
+            aggregates = compute_aggregates(snapshot, filters)
+        content = build_pdf(filters, aggregates, progress, colors)
+        observe_size("generate_pdf", len(content))
+        return content
+
+    # Relatório idêntico já gerado: entregar direto do cache
+    if report_queue.submit(key, build) == "ready":
+        return send_report(key), None, True, "Relatório pronto."
+    return dash.no_update, key, False, "Gerando relatório..."
+
+# Acompanhar a geração do relatório e entregá-lo quando ficar pronto
+@app.callback(
+    [Output("download-pdf", "data", allow_duplicate=True),
+     Output("pdf-poll", "disabled", allow_duplicate=True),
+     Output("pdf-status", "children", allow_duplicate=True)],
+    Input("pdf-poll", "n_intervals"),
+    State("pdf-job", "data"),
+    prevent_initial_call=True
+)
+def poll_pdf_job(n_intervals, key):
+    if key is None:
+        return dash.no_update, True, dash.no_update
+    status, progress = report_queue.status(key)
+    if status == "ready":
+        return send_report(key), True, "Relatório pronto."
+    if status == "error":
+        return dash.no_update, True, "Não foi possível gerar o relatório."
+    return dash.no_update, False, f"Gerando relatório... {progress:.0%}"
+
+# Copiar os filtros atuais para o formulário de exportação (no navegador, sem chamar o servidor)
+app.clientside_callback(
+    ClientsideFunction(namespace="apura", function_name="export_filters"),
+    Output("export-filters", "value"),
+    [Input("date-filter", "value"),
+     Input("hospital-filter", "value"),
+     Input("cost-center-filter", "value"),
+     Input("category-filter", "value")]
+)
+
+# Colunas e blocos de linhas exportados para os filtros (lidos do banco com o backend SQL)
+def export_rows(snapshot, filters):
+    if use_sql(snapshot):
+        reader = sql_reader(snapshot)
+        return reader.columns, reader.iter_rows(filters)
+    return snapshot.columns, iter_row_chunks(snapshot.df, get_slice(snapshot, filters).row_mask())
+
+# Exportações em CSV e XLSX, enviadas em partes a partir das mesmas agregações do dashboard
+@server.route("/export", methods=["POST"])
+def export():
+    kind = request.form.get("kind")
+    try:
+        selections = json.loads(request.form.get("filters") or "[[], [], [], []]")
+        filters = normalize_filters(*selections)
+    except (TypeError, ValueError):
+        abort(400)
+
+    snapshot = data_source.current()
+
+    # Os totais só entram nas exportações que os usam
+    if kind == "linhas.csv":
+        content = iter_rows_csv(*export_rows(snapshot, filters))
+        mimetype = "text/csv"
+    elif kind == "totais.csv":
+        content = iter_aggregates_csv(compute_aggregates(snapshot, filters))
+        mimetype = "text/csv"
+    elif kind == "relatorio.xlsx":
+        content = iter_xlsx(*export_rows(snapshot, filters), compute_aggregates(snapshot, filters))
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        abort(404)
+
+    return Response(
+        stream_with_context(content),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={kind}"},
     )
 
-# Rodar o App
+# Estatísticas dos caches (acertos e faltas)
+@server.route("/cache-stats")
+def cache_stats():
+    return jsonify({
+        "aggregates": aggregate_cache.stats(),
+        "figures": figure_cache.stats(),
+        "drilldown": drilldown_cache.stats(),
+    })
+
+# Métricas no formato do Prometheus: etapas medidas, tamanho das respostas, caches e snapshot
+def cache_metric(field):
+    def collect():
+        return {
+            (name,): cache.stats()[field]
+            for name, cache in (("aggregates", aggregate_cache), ("figures", figure_cache), ("drilldown", drilldown_cache))
+        }
+    return collect
+
+REGISTRY.register(Gauge("apura_cache_entries", "Entradas em cada cache do dashboard.", ["cache"], collect=cache_metric("size")))
+REGISTRY.register(Counter("apura_cache_hits_total", "Acertos de cada cache do dashboard.", ["cache"], collect=cache_metric("hits")))
+REGISTRY.register(Counter("apura_cache_misses_total", "Faltas de cada cache do dashboard.", ["cache"], collect=cache_metric("misses")))
+REGISTRY.register(Gauge("apura_snapshot_version", "Versão do snapshot de dados atual.", collect=lambda: {(): data_source.version}))
+REGISTRY.register(Gauge("apura_snapshot_rows", "Linhas do snapshot de dados atual.", collect=lambda: {(): data_source.current().rows}))
+if sql_store is None:
+    # Com o backend SQL, o cubo não é carregado
+    REGISTRY.register(Gauge("apura_snapshot_cells", "Células do cubo do snapshot atual.", collect=lambda: {(): len(data_source.current().cube)}))
+REGISTRY.register(Gauge(
+    "apura_snapshot_age_seconds", "Segundos desde a carga do snapshot atual.",
+    collect=lambda: {(): time.time() - data_source.current().loaded_at},
+))
+
+@server.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+# Perfil por requisição (cProfile e cabeçalho Server-Timing), permitido com PROFILING_ENABLED=1 e
+# PROFILING_TOKEN, e ativado pelo cabeçalho X-Apura-Profile com o token ou pelo cookie definido em
+# /profiling?enabled=1&token=...; só os PROFILE_MAX_FILES perfis mais recentes ficam em disco
+profiling_token = os.environ.get("PROFILING_TOKEN", "")
+profiling_enabled = os.environ.get("PROFILING_ENABLED", "0") == "1" and bool(profiling_token)
+if os.environ.get("PROFILING_ENABLED", "0") == "1" and not profiling_token:
+    logging.getLogger(__name__).warning("PROFILING_ENABLED=1 sem PROFILING_TOKEN: perfil desativado")
+profile_dir = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "profiles"))
+profile_max_files = int(os.environ.get("PROFILE_MAX_FILES", 50))
+PROFILE_COOKIE = "apura_profile"
+
+def valid_profiling_token(value):
+    return bool(value) and hmac.compare_digest(value.encode(), profiling_token.encode())
+
+def prune_profiles():
+    # Apagar os perfis mais antigos além de profile_max_files
+    profiles = []
+    for name in os.listdir(profile_dir):
+        path = os.path.join(profile_dir, name)
+        if name.endswith(".prof"):
+            try:
+                profiles.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+    profiles.sort(reverse=True)
+    for _, path in profiles[profile_max_files:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Nome da requisição nas métricas: o primeiro componente de saída dos callbacks do Dash ou a rota
+def request_label():
+    if request.path.endswith("/_dash-update-component"):
+        body = request.get_json(silent=True) or {}
+        return "callback", str(body.get("output", "")).strip(".").split(".")[0]
+    return "http", request.url_rule.rule if request.url_rule is not None else "unknown"
+
+@server.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    if profiling_enabled and valid_profiling_token(request.headers.get("X-Apura-Profile") or request.cookies.get(PROFILE_COOKIE)):
+        start_trace()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@server.after_request
+def record_request_timing(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+    start = g.pop("request_start", None)
+    if start is None:
+        return response
+
+    operation, label = request_label()
+    elapsed = time.perf_counter() - start
+    STAGE_SECONDS.observe(elapsed, operation=operation, stage=label)
+    if not response.is_streamed:
+        # Tamanho da resposta antes e depois da compressão, por callback ou rota
+        wire_size = response.calculate_content_length() or 0
+        observe_size(f"{operation}:{label}", g.pop("uncompressed_size", wire_size), wire_size)
+
+    if profiler is not None:
+        stages = finish_trace() + [(f"{operation}.{label}", elapsed)]
+        response.headers["Server-Timing"] = ", ".join(
+            f'{name.replace(" ", "_")};dur={seconds * 1000:.2f}' for name, seconds in stages
+        )
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label.strip('/').replace('/', '_') or 'root'}.prof")
+        profiler.dump_stats(path)
+        prune_profiles()
+        response.headers["X-Apura-Profile"] = os.path.basename(path)
+    return response
+
+# Compressão gzip das respostas (callbacks, layout, páginas e scripts do Dash); 0 desativa.
+# Registrada depois da medição para rodar antes dela (o Flask chama os after_request em ordem inversa)
+compression_level = int(os.environ.get("COMPRESSION_LEVEL", 6))
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "text/")
+COMPRESSION_MIN_SIZE = 500
+
+@server.after_request
+def compress_response(response):
+    if (
+        not compression_level
+        or response.direct_passthrough
+        or response.is_streamed
+        or not 200 <= response.status_code < 300
+        or "Content-Encoding" in response.headers
+        or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if not request.accept_encodings["gzip"]:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+    g.uncompressed_size = len(data)
+    response.set_data(gzip.compress(data, compresslevel=compression_level))
+    response.headers["Content-Encoding"] = "gzip"
+    response.headers["X-Uncompressed-Length"] = str(len(data))
+    return response
+
+@server.route("/profiling")
+def toggle_profiling():
+    if not profiling_enabled:
+        abort(404)
+    if not valid_profiling_token(request.args.get("token")):
+        abort(403)
+    enabled = request.args.get("enabled", "1") == "1"
+    response = jsonify({"profiling": enabled, "directory": profile_dir})
+    if enabled:
+        response.set_cookie(PROFILE_COOKIE, profiling_token, httponly=True, secure=request.is_secure, samesite="Lax")
+    else:
+        response.delete_cookie(PROFILE_COOKIE)
+    return response
+
+# Rodar o App (servidor de desenvolvimento; em produção use wsgi.py com o gunicorn)
 if __name__ == "__main__":
+    # Iniciar a carga dos dados (cache local e atualização em segundo plano)
+    data_source.start()
+
     port = int(os.environ.get("PORT", 8050))  # Use a porta fornecida pelo Render ou 8050 como padrão
     app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,658 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import gspread
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from oauth2client.service_account import ServiceAccountCredentials
+
+from cube import SpendCube
+from ingestion import empty_frame, ingest, merge_frames, normalize_frame
+from metrics import STAGE_SECONDS, stage
+from sheets_sync import SheetSync
+
+logger = logging.getLogger(__name__)
+
+# Configurar o acesso ao Google Sheets
+def authorize_sheets_client():
+    # Escopo da API
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+    # Credenciais da conta de serviço
+    credentials = ServiceAccountCredentials.from_json_keyfile_dict(
+        json.loads(os.environ["GOOGLE_SHEETS_CREDENTIALS"]), scope
+    )
+
+    # Autenticar no Google Sheets
+    return gspread.authorize(credentials)
+
+
+def open_worksheet(sheet, worksheet=0):
+    # Aba pela posição (a partir de 0) ou pelo título
+    if isinstance(worksheet, int):
+        return sheet.get_worksheet(worksheet)
+    return sheet.worksheet(worksheet)
+
+
+def load_data_from_sheets(sheet_url, client=None, worksheet=0):
+    # Autenticar e acessar o Google Sheets (ou usar um cliente já autenticado)
+    if client is None:
+        client = authorize_sheets_client()
+
+    # Abrir a planilha pelo URL
+    sheet = client.open_by_url(sheet_url)
+
+    # Selecionar a aba (por padrão, a primeira)
+    worksheet = open_worksheet(sheet, worksheet)
+
+    # Obter os dados como uma lista de listas
+    data = worksheet.get_all_records()
+
+    # Converter para um DataFrame do Pandas
+    df = pd.DataFrame(data)
+
+    return df
+
+
+class SheetsSource:
+    """Fonte de dados no Google Sheets.
+
+    A impressão digital é a data de modificação da planilha no Drive, o que
+    permite saber se houve mudança sem baixar as linhas. O cliente pode ser
+    injetado (por exemplo, um substituto local em testes). worksheet é a
+    posição ou o título da aba. Com incremental, as mudanças são trazidas por
+    SheetSync (só as linhas novas ou os blocos alterados) em vez de baixar a
+    aba inteira.
+    """
+
+    def __init__(self, sheet_url, client=None, incremental=False, worksheet=0):
+        self.sheet_url = sheet_url
+        self.worksheet = worksheet
+        self._client = client
+        self._injected_client = client is not None
+        self.sync_state = SheetSync() if incremental else None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = authorize_sheets_client()
+        return self._client
+
+    def fingerprint(self):
+        try:
+            modified = self.client.open_by_url(self.sheet_url).get_lastUpdateTime()
+        except Exception:
+            logger.warning("Não foi possível obter a data de modificação da planilha", exc_info=True)
+            return None
+        return f"sheets:{modified}"
+
+    def load(self):
+        return load_data_from_sheets(self.sheet_url, client=self.client, worksheet=self.worksheet)
+
+    def sync(self):
+        worksheet = open_worksheet(self.client.open_by_url(self.sheet_url), self.worksheet)
+        return self.sync_state.sync(worksheet)
+
+    def reset_after_fork(self):
+        # A sessão HTTP (conexões e estado SSL) do cliente não pode ser dividida com o processo pai
+        if not self._injected_client:
+            self._client = None
+
+
+class LocalFileSource:
+    """Fonte de dados em um arquivo local (xlsx ou CSV) com o mesmo layout da planilha.
+
+    sheet é a aba do xlsx (posição ou título; por padrão, a primeira).
+    """
+
+    def __init__(self, path, sheet=0):
+        self.path = path
+        self.sheet = sheet
+
+    def fingerprint(self):
+        # Hash do conteúdo do arquivo
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return f"sha256:{digest.hexdigest()}"
+
+    def load(self):
+        if self.path.lower().endswith(".csv"):
+            # Ler tudo como texto, como o get_all_records faria
+            return pd.read_csv(self.path, dtype=str, keep_default_na=False)
+        return pd.read_excel(self.path, sheet_name=self.sheet)
+
+
+def _load_source(name, source, origin_column):
+    # Baixar e normalizar uma fonte (numa thread ou, para um arquivo local, em outro processo),
+    # devolvendo também a duração, medida onde a carga acontece
+    start = time.perf_counter()
+    try:
+        raw = source.load()
+    except Exception as exc:
+        raise RuntimeError(f"Falha ao carregar a fonte {name}") from exc
+    return normalize_frame(raw, name, origin_column=origin_column), time.perf_counter() - start
+
+
+class FederatedSource:
+    """Várias fontes (abas, planilhas e arquivos locais) unidas em um único snapshot.
+
+    sources é uma lista de pares (origem, fonte). As fontes são carregadas
+    ao mesmo tempo, de modo que a carga dura perto do tempo da fonte mais
+    lenta: as do Google Sheets em um pool de threads (o tempo delas é de
+    espera pela rede, sem o GIL) e, havendo mais de um, os arquivos locais
+    em um pool de processos (ler um xlsx e converter as colunas ocupa a CPU
+    e, em threads, um arquivo esperaria o outro pelo GIL). Cada fonte tem a
+    data e o valor convertidos separadamente (um xlsx traz datas e números,
+    o Google Sheets traz texto), fica só com as colunas do esquema e recebe
+    a coluna ORIGIN_COLUMN com a sua origem. A falha de qualquer fonte
+    interrompe a carga (o snapshot anterior continua valendo). A impressão
+    digital combina as das fontes.
+    """
+
+    ORIGIN_COLUMN = "Origem"
+
+    def __init__(self, sources, max_workers=None):
+        if not sources:
+            raise ValueError("Nenhuma fonte de dados configurada")
+        self.sources = list(sources)
+        self.max_workers = max_workers or min(8, len(self.sources))
+
+    @classmethod
+    def from_config(cls, entries, client=None, max_workers=None):
+        """Criar as fontes a partir da configuração (lista de dicionários).
+
+        Cada item tem "url" (Google Sheets, com "worksheet" opcional: posição
+        ou título da aba) ou "file" (xlsx ou CSV, com "sheet" opcional), e
+        "name" opcional com a origem exibida (padrão: o título da aba ou o
+        nome do arquivo).
+        """
+        sources = []
+        for entry in entries:
+            if "file" in entry:
+                sheet = entry.get("sheet", 0)
+                source = LocalFileSource(entry["file"], sheet=sheet)
+                default_name = os.path.basename(entry["file"]) + (f" ({sheet})" if sheet != 0 else "")
+            elif "url" in entry:
+                worksheet = entry.get("worksheet", 0)
+                source = SheetsSource(entry["url"], client=client, worksheet=worksheet)
+                default_name = str(worksheet) if isinstance(worksheet, str) else f"{entry['url']} (aba {worksheet})"
+            else:
+                raise ValueError(f"Fonte sem 'url' nem 'file': {entry}")
+            sources.append((entry.get("name", default_name), source))
+        return cls(sources, max_workers=max_workers)
+
+    def _map(self, function):
+        # Aplicar function a cada fonte em paralelo, na ordem da configuração
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="data-source") as pool:
+            futures = [pool.submit(function, name, source) for name, source in self.sources]
+            return [future.result() for future in futures]
+
+    def fingerprint(self):
+        fingerprints = self._map(lambda name, source: source.fingerprint())
+        if any(fingerprint is None for fingerprint in fingerprints):
+            return None
+        digest = hashlib.sha256()
+        for (name, _), fingerprint in zip(self.sources, fingerprints):
+            digest.update(f"{name}\x1f{fingerprint}\x1e".encode())
+        return f"federated:{digest.hexdigest()}"
+
+    def reset_after_fork(self):
+        for _, source in self.sources:
+            if hasattr(source, "reset_after_fork"):
+                source.reset_after_fork()
+
+    def _process_pool(self):
+        # Pool de processos para os arquivos locais (None com menos de dois). Os processos são
+        # iniciados do zero (spawn): o fork de um processo com threads pode herdar locks presos
+        files = sum(isinstance(source, LocalFileSource) for _, source in self.sources)
+        if files < 2:
+            return None
+        return ProcessPoolExecutor(
+            max_workers=min(self.max_workers, files), mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def load(self):
+        processes = self._process_pool()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="data-source") as threads:
+                futures = [
+                    (processes if processes is not None and isinstance(source, LocalFileSource) else threads).submit(
+                        _load_source, name, source, self.ORIGIN_COLUMN,
+                    )
+                    for name, source in self.sources
+                ]
+                frames = []
+                for (name, _), future in zip(self.sources, futures):
+                    frame, elapsed = future.result()
+                    STAGE_SECONDS.observe(elapsed, operation="data_source", stage=name)
+                    frames.append(frame)
+        finally:
+            if processes is not None:
+                processes.shutdown(cancel_futures=True)
+
+        raw = pd.concat(frames, ignore_index=True)
+        raw[self.ORIGIN_COLUMN] = pd.Categorical(
+            raw[self.ORIGIN_COLUMN], categories=list(dict.fromkeys(name for name, _ in self.sources)),
+        )
+        logger.info(
+            "Fontes carregadas: %s",
+            ", ".join(f"{name} ({len(frame)} linhas)" for (name, _), frame in zip(self.sources, frames)),
+        )
+        return raw
+
+
+def content_fingerprint(df):
+    # Impressão digital do conteúdo, quando a fonte não informa a sua versão
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return f"content:{hashlib.sha256(hashes.tobytes()).hexdigest()}"
+
+
+def _write_arrays(path, arrays, metadata):
+    # Arrays de tamanhos diferentes num único arquivo Arrow IPC: cada um é uma coluna com uma
+    # lista só, cujos valores ficam contíguos e alinhados no arquivo
+    columns = {}
+    for name, values in arrays.items():
+        child = pa.array(values, type=pa.string() if values.dtype == object else None)
+        columns[name] = pa.LargeListArray.from_arrays(pa.array([0, len(child)], type=pa.int64()), child)
+    table = pa.table(columns).replace_schema_metadata(metadata)
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_arrays(reader):
+    # Arrays gravados por _write_arrays: os numéricos apontam direto para o arquivo mapeado
+    # (somente leitura, sem cópia); os rótulos viram arrays de objetos
+    batch = reader.get_batch(0)
+    arrays = {}
+    for name, column in zip(batch.schema.names, batch.columns):
+        values = column.flatten()
+        if pa.types.is_string(values.type):
+            arrays[name] = np.array(values.to_pylist(), dtype=object)
+        else:
+            arrays[name] = values.to_numpy(zero_copy_only=True)
+    return arrays
+
+
+class SnapshotCache:
+    """Cache local do snapshot já tratado: o DataFrame em Parquet e o cubo em Arrow IPC.
+
+    A impressão digital da fonte fica nos metadados dos dois arquivos, de
+    modo que é possível validá-la lendo apenas os esquemas. O cubo fica em
+    cube_path, ao lado do Parquet, e é lido com memory map e sem cópia: abrir
+    o cache custa o mesmo para qualquer tamanho de planilha, e os processos
+    que abrem o mesmo arquivo compartilham as páginas do cubo. O DataFrame
+    só é decodificado no primeiro uso. Um cache gravado com outro formato
+    (outra versão do esquema de ingestão ou do cubo) é ignorado.
+    """
+
+    FINGERPRINT_KEY = b"apura_sus.fingerprint"
+    FORMAT_KEY = b"apura_sus.format"
+    FORMAT_VERSION = b"3"
+
+    def __init__(self, path):
+        self.path = path
+        self.cube_path = f"{os.path.splitext(path)[0]}.cube.arrow"
+        self.lock_path = f"{path}.lock"
+        self._lock_file = None
+
+    def try_lock(self):
+        """Tentar ser o único processo que grava o cache (sem esperar).
+
+        O lock fica com o processo enquanto ele viver: se ele terminar, o
+        sistema o libera e outro processo pode obtê-lo. Deve ser chamado
+        depois do fork (um descritor herdado dividiria o lock com o pai).
+        """
+        import fcntl
+
+        if self._lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.exists(self.cube_path)
+
+    def _fingerprint(self, metadata):
+        metadata = metadata or {}
+        fingerprint = metadata.get(self.FINGERPRINT_KEY)
+        if fingerprint is None or metadata.get(self.FORMAT_KEY) != self.FORMAT_VERSION:
+            return None
+        return fingerprint.decode()
+
+    def fingerprint(self):
+        # Impressão digital do cache, ou None se ele falta, é de outro formato ou está pela
+        # metade (os dois arquivos de cargas diferentes)
+        if not self.exists():
+            return None
+        fingerprint = self._fingerprint(pq.read_schema(self.path).metadata)
+        with pa.memory_map(self.cube_path) as source:
+            cube_fingerprint = self._fingerprint(pa.ipc.open_file(source).schema.metadata)
+        return fingerprint if fingerprint == cube_fingerprint else None
+
+    def open(self, version, source_rows=None):
+        """Snapshot lido do cache, sem decodificar o DataFrame nem ler o cubo.
+
+        Os dois arquivos ficam abertos pelo snapshot: o DataFrame e o cubo
+        continuam legíveis mesmo depois que um cache mais novo os substitui.
+        """
+        parquet = pq.ParquetFile(pa.memory_map(self.path))
+        reader = pa.ipc.open_file(pa.memory_map(self.cube_path))
+        fingerprint = self._fingerprint(parquet.schema_arrow.metadata)
+        if fingerprint is None:
+            raise ValueError(f"Cache local em formato antigo: {self.path}")
+        if self._fingerprint(reader.schema.metadata) != fingerprint:
+            raise ValueError(f"Cubo do cache local não corresponde ao DataFrame: {self.cube_path}")
+        return Snapshot(
+            version,
+            lambda: parquet.read().to_pandas(),
+            fingerprint=fingerprint,
+            cube=lambda: SpendCube.from_arrays(_read_arrays(reader)),
+            source_rows=source_rows,
+            columns=parquet.schema_arrow.names,
+            rows=parquet.metadata.num_rows,
+        )
+
+    def save(self, df, cube, fingerprint):
+        metadata = {self.FINGERPRINT_KEY: fingerprint.encode(), self.FORMAT_KEY: self.FORMAT_VERSION}
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+        # Escrever em arquivos temporários e trocar de uma vez: primeiro o cubo, depois o
+        # Parquet, cuja troca completa a gravação (até lá as impressões digitais não batem)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        _write_arrays(f"{self.cube_path}.tmp", cube.to_arrays(), metadata)
+        os.replace(f"{self.cube_path}.tmp", self.cube_path)
+        pq.write_table(table, f"{self.path}.tmp")
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class Snapshot:
+    """Versão imutável dos dados já tratados, com o cubo correspondente.
+
+    df e cube podem ser funções que devolvem o DataFrame e o cubo, chamadas
+    no primeiro uso (um snapshot lido do cache local só decodifica as linhas
+    e lê o cubo quando alguma consulta precisa deles; com o backend SQL,
+    nenhum dos dois chega a ser carregado); com df em uma função, cube,
+    columns e rows são obrigatórios. source_rows guarda, quando conhecida, a
+    posição na planilha de cada linha do DataFrame (usada pela sincronização
+    incremental).
+    """
+
+    def __init__(
+        self, version, df, fingerprint=None, loaded_at=None, cube=None, source_rows=None, columns=None, rows=None,
+    ):
+        self.version = version
+        self._df = df
+        self._cube = cube if cube is not None else SpendCube(df)
+        self._load_lock = threading.Lock()
+        self.fingerprint = fingerprint
+        self.columns = list(columns if columns is not None else df.columns)
+        self.rows = rows if rows is not None else len(df)
+        self.source_rows = source_rows
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+
+    def _load(self, attribute, stage_name):
+        # Valor guardado em attribute, calculado uma única vez no primeiro uso
+        value = getattr(self, attribute)
+        if callable(value):
+            with self._load_lock:
+                value = getattr(self, attribute)
+                if callable(value):
+                    with stage("data_load", stage_name):
+                        value = value()
+                    setattr(self, attribute, value)
+        return value
+
+    @property
+    def df(self):
+        return self._load("_df", "frame_load")
+
+    @property
+    def cube(self):
+        return self._load("_cube", "cube_load")
+
+    def read_frame(self):
+        # DataFrame do snapshot sem guardá-lo no snapshot (decodificado a cada chamada, se ainda
+        # não foi carregado), para quem só precisa das linhas uma vez
+        return self._df() if callable(self._df) else self._df
+
+    @property
+    def empty(self):
+        return self.rows == 0
+
+    @property
+    def token(self):
+        # Identificação dos dados igual em todos os processos (a versão é contada em cada um)
+        return self.fingerprint or f"version:{self.version}"
+
+
+def empty_snapshot():
+    # Snapshot usado enquanto a primeira carga ainda não terminou
+    return Snapshot(0, empty_frame(), loaded_at=0.0)
+
+
+class DataSource:
+    """Mantém o snapshot atual dos dados e o atualiza em segundo plano.
+
+    O DataFrame é baixado e tratado fora do caminho das requisições; só
+    depois de pronto o novo snapshot substitui o anterior (uma única
+    atribuição), de modo que os callbacks nunca veem dados pela metade nem
+    esperam pelo Google Sheets. Com um cache local, a inicialização usa o
+    último snapshot salvo e a fonte só é baixada de novo quando a sua
+    impressão digital muda. Com follow_cache, o processo acompanha o cache
+    local atualizado por outro processo, verificando-o a cada follow_interval
+    segundos, e passa a atualizá-lo ele mesmo quando obtém o lock do cache
+    (os workers do servidor WSGI elegem assim um único processo que baixa a
+    fonte, substituído por outro se ele terminar). As funções registradas
+    com prepare() preparam cada snapshot antes da publicação (e, numa carga
+    nova, antes da gravação do cache local, de modo que os processos que o
+    acompanham já encontram o que foi preparado); se uma delas falha, o
+    snapshot não é publicado e o anterior continua valendo.
+    """
+
+    def __init__(self, source, refresh_interval=300, cache=None, follow_cache=False, follow_interval=30):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.follow_interval = follow_interval
+        self.cache = cache
+        self.follow_cache = follow_cache
+        self._snapshot = empty_snapshot()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+        self._preparers = []
+
+    def prepare(self, preparer):
+        # Registrar uma função chamada com cada novo snapshot antes da sua publicação
+        self._preparers.append(preparer)
+
+    def _prepare(self, snapshot):
+        for preparer in self._preparers:
+            preparer(snapshot)
+        return snapshot
+
+    def subscribe(self, listener):
+        # Registrar uma função chamada a cada novo snapshot publicado
+        self._listeners.append(listener)
+
+    def current(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def is_latest(self, snapshot):
+        # Com follow_cache, o snapshot pode estar atrás do cache local já atualizado por
+        # outro processo (até o próximo ciclo deste); basta ler os metadados dos arquivos
+        if not self.follow_cache:
+            return True
+        fingerprint = self.cache.fingerprint()
+        return fingerprint is None or fingerprint == snapshot.fingerprint
+
+    def _publish(self, snapshot):
+        self._snapshot = snapshot
+        logger.info("Snapshot %d carregado (%d linhas)", snapshot.version, snapshot.rows)
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Falha ao notificar a publicação do snapshot %d", snapshot.version)
+        return snapshot
+
+    def _open_cache(self, source_rows=None):
+        # Snapshot lido do cache local (cubo mapeado do arquivo e DataFrame decodificado só no primeiro
+        # uso) e já preparado para a publicação
+        with stage("data_load", "cache_load"):
+            snapshot = self.cache.open(self._snapshot.version + 1, source_rows=source_rows)
+        return self._prepare(snapshot)
+
+    def _commit(self, df, fingerprint, cube=None, source_rows=None):
+        # Publicar uma nova carga; com o cache local, ela é salva e relida dele, de modo que o
+        # processo mantém só o cubo mapeado (compartilhado com os demais) e não o DataFrame
+        with stage("data_load", "cube"):
+            snapshot = Snapshot(
+                self._snapshot.version + 1, df, fingerprint=fingerprint, cube=cube, source_rows=source_rows,
+            )
+        self._prepare(snapshot)
+        if self.cache is not None:
+            try:
+                with stage("data_load", "cache_save"):
+                    self.cache.save(df, snapshot.cube, fingerprint)
+                snapshot = self._open_cache(source_rows=source_rows)
+            except Exception:
+                logger.warning("Não foi possível salvar o cache local em %s", self.cache.path, exc_info=True)
+        return self._publish(snapshot)
+
+    def load_cached(self):
+        # Publicar o snapshot salvo localmente, sem acessar a fonte
+        if self.cache is None or not self.cache.exists():
+            return None
+        with self._refresh_lock:
+            try:
+                snapshot = self._open_cache()
+            except Exception:
+                logger.warning("Cache local inválido em %s; ignorando", self.cache.path, exc_info=True)
+                return None
+            return self._publish(snapshot)
+
+    def refresh(self):
+        # Evita duas cargas simultâneas; o snapshot atual continua valendo
+        with self._refresh_lock:
+            current = self._snapshot
+            if self.follow_cache and self.cache.try_lock():
+                logger.info("Processo %d passa a atualizar os dados", os.getpid())
+                self.follow_cache = False
+            if self.follow_cache:
+                return self._follow_cache(current)
+
+            with stage("data_load", "fingerprint"):
+                fingerprint = self.source.fingerprint()
+            if fingerprint is not None and fingerprint == current.fingerprint:
+                return current  # Fonte inalterada
+
+            # Fonte inalterada em relação ao cache local: não precisa baixar
+            if fingerprint is not None and self.cache is not None and self.cache.fingerprint() == fingerprint:
+                return self._publish(self._open_cache())
+
+            if getattr(self.source, "sync_state", None) is not None:
+                return self._sync(current, fingerprint)
+
+            with stage("data_load", "fetch"):
+                raw = self.source.load()
+            if fingerprint is None:
+                fingerprint = content_fingerprint(raw)
+                if fingerprint == current.fingerprint:
+                    return current
+
+            with stage("data_load", "ingest"):
+                df = ingest(raw)
+            return self._commit(df, fingerprint)
+
+    def _sync(self, current, fingerprint):
+        # Sincronização incremental: só as linhas novas ou alteradas são tratadas,
+        # e o DataFrame e o cubo do snapshot atual são atualizados sem recalcular tudo
+        if current.source_rows is None:
+            # Snapshot sem a posição das linhas (por exemplo, lido do cache local)
+            self.source.sync_state.reset()
+        with stage("data_load", "fetch"):
+            result = self.source.sync()
+
+        if result.full:
+            with stage("data_load", "ingest"):
+                df = ingest(result.rows, keep_index=True)
+            source_rows = df.index.to_numpy(dtype=np.int64)
+            df = df.reset_index(drop=True)
+            return self._commit(df, fingerprint or content_fingerprint(df), source_rows=source_rows)
+
+        if result.unchanged:
+            return current
+
+        with stage("data_load", "ingest"):
+            new_df = ingest(result.rows, keep_index=True)
+            keep = ~np.isin(current.source_rows, result.replaced)
+            source_rows = np.concatenate([current.source_rows[keep], new_df.index.to_numpy(dtype=np.int64)])
+            new_df = new_df.reset_index(drop=True)
+            df = merge_frames(current.df, new_df, keep=keep)
+        with stage("data_load", "merge"):
+            cube = current.cube.merge(new_df, keep=keep, old_values=current.df["Valor"].to_numpy())
+        return self._commit(df, fingerprint or content_fingerprint(df), cube=cube, source_rows=source_rows)
+
+    def _follow_cache(self, current):
+        # Recarregar do cache local somente quando outro processo o atualizou
+        fingerprint = self.cache.fingerprint()
+        if fingerprint is None or fingerprint == current.fingerprint:
+            return current
+        return self._publish(self._open_cache())
+
+    def reset_after_fork(self, follow_cache=False):
+        # Threads, locks e conexões não sobrevivem ao fork: recriá-los no processo filho
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.follow_cache = follow_cache
+        if hasattr(self.source, "reset_after_fork"):
+            self.source.reset_after_fork()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # Mantém o último snapshot válido e tenta de novo no próximo ciclo
+                logger.exception("Falha ao atualizar os dados; mantendo o snapshot %d", self.version)
+            self._stop.wait(self.follow_interval if self.follow_cache else self.refresh_interval)
+
+    def start(self):
+        # Inicia a thread de atualização (idempotente)
+        if self._snapshot.empty:
+            self.load_cached()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="data-source-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
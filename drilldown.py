@@ -0,0 +1,141 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from ingestion import format_month
+
+# Linhas por página da tabela de detalhes
+PAGE_SIZE = 20
+
+# Condição do filter_query da DataTable, por exemplo "{Valor} >= 1000" ou "{Hospital} icontains 'x'"
+CONDITION_PATTERN = re.compile(
+    r"^\s*\{(?P<column>[^}]+)\}\s+"
+    r"(?:(?P<case>[si]?)(?P<operator>contains|datestartswith|eq|ne|lt|le|gt|ge)|(?P<symbol>[<>]=?|!=|=))\s+"
+    r"(?P<value>\"[^\"]*\"|'[^']*'|`[^`]*`|[^{}]+?)\s*$"
+)
+
+# Operadores simbólicos equivalentes
+OPERATOR_ALIASES = {"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+
+
+def parse_filter_query(filter_query):
+    """Converter o filter_query da DataTable em [(coluna, operador, valor, caso)].
+
+    Entende as condições geradas pelos filtros das colunas, unidas por
+    "&&"; caso indica se o texto diferencia maiúsculas de minúsculas
+    (operadores com prefixo "i" não diferenciam). Uma condição em outro
+    formato levanta ValueError.
+    """
+    conditions = []
+    for part in (filter_query or "").split(" && "):
+        if not part.strip():
+            continue
+        match = CONDITION_PATTERN.match(part)
+        if match is None:
+            raise ValueError(f"Condição inválida no filtro da tabela: {part.strip()}")
+        operator = match["operator"] or OPERATOR_ALIASES[match["symbol"]]
+        case_sensitive = match["case"] != "i"
+        value = match["value"]
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'`":
+            value = value[1:-1]
+        conditions.append((match["column"], operator, value, case_sensitive))
+    return conditions
+
+
+def _column_values(df, column, positions):
+    # Valores da coluna nas linhas selecionadas; os meses viram categorias Mês/Ano, como na
+    # tabela (formatando cada mês distinto uma única vez)
+    series = df[column].iloc[positions]
+    if isinstance(series.dtype, pd.PeriodDtype):
+        codes, months = pd.factorize(series)
+        return pd.Series(pd.Categorical.from_codes(codes, categories=format_month(months)), index=series.index)
+    return series
+
+
+def parse_number(column, value):
+    # Valor numérico digitado no filtro da coluna, com vírgula ou ponto decimal
+    try:
+        return float(value.replace(",", "."))
+    except ValueError:
+        raise ValueError(f"Valor não numérico no filtro da coluna {column}: {value}") from None
+
+
+def text_condition(text, operator, value, case_sensitive):
+    # Máscara das linhas de text (Series de texto) que atendem à condição (None: operador sem efeito)
+    if not case_sensitive:
+        text, value = text.str.lower(), value.lower()
+    keep = {
+        "contains": lambda: text.str.contains(value, regex=False),
+        "datestartswith": lambda: text.str.startswith(value),
+        "eq": lambda: text == value, "ne": lambda: text != value,
+        "lt": lambda: text < value, "le": lambda: text <= value,
+        "gt": lambda: text > value, "ge": lambda: text >= value,
+    }.get(operator)
+    return keep().to_numpy(dtype=bool) if keep is not None else None
+
+
+def filter_rows(df, positions, filter_query):
+    # Aplicar as condições da tabela às linhas selecionadas (ValueError se alguma for inválida)
+    for column, operator, value, case_sensitive in parse_filter_query(filter_query):
+        if column not in df.columns or len(positions) == 0:
+            continue
+        values = _column_values(df, column, positions)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Avaliar a condição uma vez por categoria e levar o resultado às linhas pelos códigos
+            matches = text_condition(pd.Series(values.cat.categories.astype(str)), operator, value, case_sensitive)
+            codes = values.cat.codes.to_numpy()
+            keep = None if matches is None else np.append(matches, False)[codes]
+        elif pd.api.types.is_numeric_dtype(values) and operator != "contains":
+            number = parse_number(column, value)
+            keep = {
+                "eq": values == number, "ne": values != number,
+                "lt": values < number, "le": values <= number,
+                "gt": values > number, "ge": values >= number,
+            }.get(operator)
+            keep = keep.to_numpy(dtype=bool) if keep is not None else None
+        else:
+            keep = text_condition(values.astype(str), operator, value, case_sensitive)
+        if keep is not None:
+            positions = positions[keep]
+    return positions
+
+
+def _sort_key(values):
+    # Chave inteira de ordenação de uma coluna (na ordem crescente dos valores)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # As categorias da ingestão ficam em ordem alfabética: ordenar pelos códigos
+        return values.cat.codes.to_numpy().astype(np.int64)
+    if isinstance(values.dtype, pd.PeriodDtype):
+        return values.array.asi8
+    codes, _ = pd.factorize(values, sort=True)
+    return codes.astype(np.int64)
+
+
+def sort_rows(df, positions, sort_by):
+    # Ordenação estável pelas colunas escolhidas na tabela (sort_by da DataTable, modo multi:
+    # a primeira coluna decide e as seguintes desempatam)
+    keys = []
+    for item in sort_by or []:
+        if item["column_id"] not in df.columns:
+            continue
+        key = _sort_key(df[item["column_id"]].iloc[positions])
+        keys.append(-key if item["direction"] == "desc" else key)
+    if not keys:
+        return positions
+    # np.lexsort usa a última chave como a principal
+    return positions[np.lexsort(keys[::-1])]
+
+
+def page_records(df, positions, page_current, page_size=PAGE_SIZE):
+    # Apenas as linhas da página atual são convertidas e enviadas ao navegador
+    start = (page_current or 0) * page_size
+    page = df.iloc[positions[start:start + page_size]]
+    periods = [column for column in page.columns if isinstance(page[column].dtype, pd.PeriodDtype)]
+    page = page.assign(**{column: format_month(page[column].dt) for column in periods})
+    return page.to_dict("records")
+
+
+def page_count(rows, page_size=PAGE_SIZE):
+    # Páginas da tabela para o número de linhas selecionadas (ao menos uma, mesmo vazia)
+    return max(1, -(-rows // page_size))
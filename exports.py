@@ -0,0 +1,135 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from ingestion import MONTH_FORMAT
+
+# Linhas escritas por vez nas exportações (o arquivo nunca é montado inteiro em memória)
+CHUNK_SIZE = 5000
+
+# Dimensões exportadas nas tabelas de totais
+AGGREGATE_DIMENSIONS = ["Categoria", "Subcategoria", "Hospital", "Centro de Custo"]
+
+# Limite de linhas de uma aba do Excel (com o cabeçalho); as linhas excedentes seguem em novas abas
+XLSX_MAX_ROWS = 1_048_576
+
+# BOM para que o Excel reconheça o CSV como UTF-8
+CSV_BOM = "\ufeff"
+
+
+def _for_export(chunk):
+    # Meses no formato Mês/Ano, como nos filtros do dashboard
+    periods = [column for column in chunk.columns if isinstance(chunk[column].dtype, pd.PeriodDtype)]
+    if not periods:
+        return chunk
+    return chunk.assign(**{column: chunk[column].dt.strftime(MONTH_FORMAT) for column in periods})
+
+
+def iter_row_chunks(df, row_mask, chunk_size=CHUNK_SIZE):
+    # Linhas filtradas em blocos, sem copiar o recorte inteiro de uma vez
+    positions = np.flatnonzero(row_mask)
+    for start in range(0, len(positions), chunk_size):
+        yield _for_export(df.iloc[positions[start:start + chunk_size]])
+
+
+def aggregates_frame(aggregates):
+    # Totais de todas as dimensões em formato longo (uma tabela só)
+    frames = []
+    for dimension in AGGREGATE_DIMENSIONS:
+        totals = aggregates[dimension]
+        frames.append(pd.DataFrame({
+            "Dimensão": dimension,
+            "Item": totals[dimension].to_numpy(),
+            "Valor": totals["Valor"].to_numpy(),
+            "Percentual": totals["Percentual"].to_numpy(),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def iter_rows_csv(columns, chunks):
+    # columns é o cabeçalho e chunks os blocos de linhas (de iter_row_chunks ou do banco SQL)
+    yield CSV_BOM + pd.DataFrame(columns=columns).to_csv(index=False)
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=False)
+
+
+def iter_aggregates_csv(aggregates):
+    yield CSV_BOM
+    if aggregates is None:
+        yield "Dimensão,Item,Valor,Percentual\n"
+        return
+    yield aggregates_frame(aggregates).to_csv(index=False)
+
+
+class _FileStream:
+    """Arquivo temporário enviado em blocos.
+
+    O arquivo é aberto e logo apagado do diretório: o espaço em disco volta
+    quando ele é fechado (ao fim da leitura, por close() ou pelo coletor de
+    lixo), mesmo que a resposta seja interrompida antes do primeiro bloco.
+    """
+
+    def __init__(self, path, chunk_size=1 << 16):
+        self._file = open(path, "rb")
+        os.remove(path)
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        block = self._file.read(self.chunk_size)
+        if not block:
+            self.close()
+            raise StopIteration
+        return block
+
+    def close(self):
+        self._file.close()
+
+
+def iter_xlsx(columns, chunks, aggregates, max_rows=None):
+    # columns é o cabeçalho e chunks os blocos de linhas, como em iter_rows_csv. O
+    # modo write_only do openpyxl grava as linhas em disco à medida que são
+    # adicionadas; o arquivo final é enviado em blocos. Acima do limite de linhas
+    # do Excel (max_rows, por padrão XLSX_MAX_ROWS), as linhas continuam nas abas
+    # "Linhas (2)", "Linhas (3)" etc.
+    max_rows = max_rows or XLSX_MAX_ROWS
+    workbook = Workbook(write_only=True)
+
+    summary = workbook.create_sheet("Resumo")
+    summary.append(["Valor Total", float(aggregates["total"]) if aggregates is not None else 0.0])
+
+    header = list(columns)
+    rows = workbook.create_sheet("Linhas")
+    rows.append(header)
+    sheets, written = 1, 1
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False, name=None):
+            if written == max_rows:
+                sheets += 1
+                rows = workbook.create_sheet(f"Linhas ({sheets})")
+                rows.append(header)
+                written = 1
+            rows.append(list(row))
+            written += 1
+
+    if aggregates is not None:
+        for dimension in AGGREGATE_DIMENSIONS:
+            sheet = workbook.create_sheet(f"Por {dimension}"[:31])
+            sheet.append([dimension, "Valor", "Percentual"])
+            totals = aggregates[dimension]
+            for label, value, percent in zip(totals[dimension], totals["Valor"], totals["Percentual"]):
+                sheet.append([label, float(value), float(percent)])
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return _FileStream(path)
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+
+# Endereço e porta (o Render informa a porta pela variável PORT)
+bind = f"0.0.0.0:{os.environ.get('PORT', 8050)}"
+
+# Poucos processos (ou o valor de WEB_CONCURRENCY), com threads para os callbacks: o cubo é
+# compartilhado entre os workers, mas cada um decodifica as linhas do snapshot quando o
+# detalhamento ou uma exportação precisa delas, então o padrão cabe numa instância pequena (512 MB)
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Importar o app (e o snapshot) no processo mestre antes do fork, para que os workers
+# comecem com os dados já carregados. O mestre não inicia nenhuma thread: um lock ou uma
+# conexão em uso por uma thread no momento do fork ficaria inutilizável nos workers
+preload_app = True
+
+# O jemalloc do pyarrow inicia uma thread em segundo plano ao ser importado; sem ela, o
+# mestre continua sem threads ao fazer o fork
+os.environ.setdefault("JE_ARROW_MALLOC_CONF", "background_thread:false")
+
+# Cada processo grava as suas métricas neste diretório, e o /metrics de qualquer worker
+# mostra as de todos (vazio: cada worker mostra só as suas)
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"apura-sus-metrics-{os.environ.get('PORT', 8050)}"))
+
+
+def on_starting(server):
+    # Descartar as métricas de uma execução anterior do servidor
+    if os.environ["METRICS_DIR"]:
+        shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+
+def when_ready(server):
+    # Medições da carga inicial feita pelo mestre (as medidas instantâneas ficam com os workers)
+    from metrics import REGISTRY
+
+    REGISTRY.flush(gauges=False)
+
+
+def post_fork(server, worker):
+    from dashboard import data_source
+    from metrics import REGISTRY
+
+    # As métricas herdadas do mestre já estão no arquivo dele
+    REGISTRY.reset()
+    REGISTRY.start_flushing()
+
+    # Com o cache local, os workers acompanham o cache e um só deles (o que obtém o lock do
+    # cache) baixa a fonte e o atualiza; sem ele, cada worker atualiza os dados por conta própria
+    data_source.reset_after_fork(follow_cache=data_source.cache is not None)
+    data_source.start()
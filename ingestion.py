@@ -0,0 +1,251 @@
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Esquema declarado da planilha: coluna -> tipo
+SCHEMA = {
+    "Data": "month",
+    "Hospital": "category",
+    "Tipo de Custo": "category",
+    "Centro de Custo": "category",
+    "Categoria": "category",
+    "Subcategoria": "category",
+    "Valor": "currency",
+}
+
+# Formato dos meses exibidos nos filtros e nas exportações (Mês/Ano)
+MONTH_FORMAT = "%m/%Y"
+
+# Formatos de data aceitos na coluna 'Data', na ordem em que são tentados
+DATE_FORMATS = ["%m/%Y", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y", "%Y-%m", "%m-%Y", "%m/%y"]
+
+# Nomes dos meses em português (abreviados ou por extenso), como em "set/2024"
+MONTH_NAMES = {
+    "jan": "01", "fev": "02", "mar": "03", "abr": "04", "mai": "05", "jun": "06",
+    "jul": "07", "ago": "08", "set": "09", "out": "10", "nov": "11", "dez": "12",
+}
+MONTH_NAME_PATTERN = r"^(" + "|".join(MONTH_NAMES) + r")[a-zç]*"
+
+# Origem das datas seriais do Google Sheets / Excel
+SERIAL_DATE_ORIGIN = "1899-12-30"
+
+
+def format_month(periods):
+    # Rótulo Mês/Ano de um PeriodIndex (ou Series de períodos)
+    return periods.strftime(MONTH_FORMAT)
+
+
+def _parse_unique(series, parse):
+    # Converter só os valores distintos (uma planilha grande repete os mesmos meses, rótulos e,
+    # em boa parte, valores) e espalhar o resultado pelas linhas através dos códigos
+    codes, uniques = pd.factorize(series)
+    parsed = parse(pd.Series(uniques, dtype=object))
+    return pd.Series(
+        pd.api.extensions.take(parsed.values, codes, allow_fill=True), index=series.index, name=series.name,
+    )
+
+
+def parse_currency(series):
+    # Valores já numéricos (por exemplo, vindos do xlsx) não precisam de tratamento
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype("float64")
+    return _parse_unique(series, _parse_currency_values)
+
+
+def _parse_currency_values(series):
+    is_text = series.map(type) == str
+    values = pd.to_numeric(series.where(~is_text), errors="coerce").astype("float64")
+    if not is_text.any():
+        return values
+
+    # Remover "R$" e espaços (inclusive os não separáveis)
+    text = series[is_text].str.replace(r"[R$\s]", "", regex=True)
+    negative = text.str.startswith("(") & text.str.endswith(")")
+    text = text.str.strip("()")
+
+    # Formato brasileiro ("1.234,56" ou "1.234") x formato com ponto decimal ("1,234.56")
+    last_comma = text.str.rfind(",")
+    last_dot = text.str.rfind(".")
+    us_thousands = text.str.fullmatch(r"-?\d{1,3}(,\d{3})+").fillna(False)
+    br_thousands = (last_comma < 0) & text.str.fullmatch(r"-?\d{1,3}(\.\d{3})+").fillna(False)
+    brazilian = ((last_comma > last_dot) & ~us_thousands) | br_thousands
+
+    normalized = text.where(
+        ~brazilian,
+        text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False),
+    )
+    normalized = normalized.where(brazilian, normalized.str.replace(",", "", regex=False))
+
+    parsed = pd.to_numeric(normalized, errors="coerce")
+    parsed[negative] = -parsed[negative]
+    values[is_text] = parsed
+    return values
+
+
+def parse_month(series):
+    # Datas já convertidas (por exemplo, vindas do xlsx)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.to_period("M")
+    if isinstance(series.dtype, pd.PeriodDtype):
+        return series.dt.asfreq("M")
+    return _parse_unique(series, _parse_month_values)
+
+
+def _parse_month_values(series):
+    months = pd.Series(pd.NaT, index=series.index, dtype="period[M]")
+
+    # Datas seriais (número de dias desde 30/12/1899)
+    serial = pd.to_numeric(series.where(series.map(type) != str), errors="coerce")
+    has_serial = serial.notna()
+    if has_serial.any():
+        dates = pd.to_datetime(serial[has_serial], unit="D", origin=SERIAL_DATE_ORIGIN)
+        months[has_serial] = dates.dt.to_period("M")
+
+    # Textos: trocar o nome do mês pelo número e tentar cada formato
+    text = series[~has_serial].astype(str).str.strip().str.lower()
+    text = text.str.replace(
+        MONTH_NAME_PATTERN, lambda match: MONTH_NAMES[match.group(1)], regex=True
+    )
+    remaining = text.index
+    for date_format in DATE_FORMATS:
+        if len(remaining) == 0:
+            break
+        dates = pd.to_datetime(text[remaining], format=date_format, errors="coerce")
+        parsed = dates.notna()
+        months[parsed[parsed].index] = dates[parsed].dt.to_period("M")
+        remaining = remaining[~parsed.to_numpy()]
+    return months
+
+
+def parse_category(series):
+    # Rótulos sem os espaços nas pontas, como categoria (em ordem alfabética); só os valores
+    # distintos são convertidos para texto, e rótulos que ficam iguais depois disso são unidos
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    labels = pd.Index(uniques).astype(str).str.strip()
+    categories = labels.unique().sort_values()
+    return pd.Series(
+        pd.Categorical.from_codes(categories.get_indexer(labels)[codes], categories),
+        index=series.index, name=series.name,
+    )
+
+
+def empty_frame():
+    # DataFrame vazio já no esquema tipado
+    return pd.DataFrame({
+        column: pd.Series(dtype={
+            "month": "period[M]",
+            "category": "category",
+            "currency": "float64",
+        }[kind])
+        for column, kind in SCHEMA.items()
+    })
+
+
+def normalize_frame(raw, origin, origin_column="Origem"):
+    """Preparar os dados brutos de uma fonte para serem unidos aos de outras.
+
+    Os nomes das colunas perdem os espaços nas pontas, a data e o valor já
+    são convertidos (cada fonte pode trazê-los em um formato diferente) e só
+    as colunas do esquema são mantidas, mais origin_column com a origem.
+    O resultado segue para ingest() junto com o das demais fontes.
+    """
+    raw = raw.rename(columns=lambda column: str(column).strip())
+    missing = [column for column in SCHEMA if column not in raw.columns]
+    if missing:
+        raise ValueError(f"Colunas ausentes na fonte {origin}: {', '.join(missing)}")
+
+    frame = pd.DataFrame(index=raw.index)
+    for column, kind in SCHEMA.items():
+        if kind == "month":
+            frame[column] = parse_month(raw[column])
+        elif kind == "currency":
+            frame[column] = parse_currency(raw[column])
+        else:
+            frame[column] = raw[column]
+    frame[origin_column] = origin
+    return frame
+
+
+def ingest(raw, keep_index=False):
+    """Converter os dados brutos da planilha para o esquema tipado.
+
+    Numa única passada vetorizada: 'Data' vira um período mensal, 'Valor' é
+    convertido do formato de moeda e as dimensões viram categorias. Linhas
+    com data ou valor inválidos são descartadas e registradas no log. Com
+    keep_index, o índice de raw (por exemplo, a linha na planilha) é mantido.
+    """
+    missing = [column for column in SCHEMA if column not in raw.columns]
+    if missing:
+        raise ValueError(f"Colunas ausentes na planilha: {', '.join(missing)}")
+
+    df = pd.DataFrame(index=raw.index)
+    for column, kind in SCHEMA.items():
+        if kind == "month":
+            df[column] = parse_month(raw[column])
+        elif kind == "currency":
+            df[column] = parse_currency(raw[column])
+        else:
+            df[column] = parse_category(raw[column])
+
+    # Colunas extras da planilha são mantidas como estão
+    for column in raw.columns:
+        if column not in SCHEMA:
+            df[column] = raw[column]
+
+    invalid_date = df["Data"].isna().to_numpy()
+    invalid_value = df["Valor"].isna().to_numpy()
+    rejected = invalid_date | invalid_value
+    if rejected.any():
+        rejected_rows = raw.index[rejected]
+        logger.warning(
+            "Linhas rejeitadas na ingestão: %d de %d (data inválida: %d, valor inválido: %d)",
+            rejected.sum(), len(raw), invalid_date.sum(), invalid_value.sum(),
+            extra={
+                "rejected_rows": int(rejected.sum()),
+                "total_rows": len(raw),
+                "invalid_date": int(invalid_date.sum()),
+                "invalid_value": int(invalid_value.sum()),
+                "sample": raw.loc[rejected_rows[:5], ["Data", "Valor"]].astype(str).to_dict("records"),
+            },
+        )
+        df = df[~rejected]
+        # Remover categorias que só existiam nas linhas rejeitadas
+        df = df.assign(**{
+            column: df[column].cat.remove_unused_categories()
+            for column, kind in SCHEMA.items()
+            if kind == "category"
+        })
+
+    if not keep_index:
+        df = df.reset_index(drop=True)
+    logger.info(
+        "Ingestão concluída: %d linhas, %.1f MB",
+        len(df), df.memory_usage(deep=True).sum() / 2**20,
+        extra={"rows": len(df), "months": int(df["Data"].nunique())},
+    )
+    return df
+
+
+def merge_frames(df, new_df, keep=None):
+    """Juntar linhas já ingeridas a um DataFrame tipado, mantendo o esquema.
+
+    As categorias das duas partes são unidas antes da concatenação (senão o
+    pandas converteria as colunas para texto). Com keep, só as linhas
+    marcadas de df são mantidas.
+    """
+    if keep is not None and not keep.all():
+        df = df[keep]
+    categorical = [column for column, kind in SCHEMA.items() if kind == "category"]
+    categories = {
+        column: df[column].cat.categories.union(new_df[column].cat.categories)
+        for column in categorical
+    }
+    merged = pd.concat([
+        part.assign(**{column: part[column].cat.set_categories(categories[column]) for column in categorical})
+        for part in (df, new_df)
+    ], ignore_index=True)
+    if keep is not None and not keep.all():
+        merged = merged.assign(**{column: merged[column].cat.remove_unused_categories() for column in categorical})
+    return merged
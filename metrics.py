@@ -0,0 +1,322 @@
+import atexit
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Limites dos histogramas de latência (segundos) e de tamanho de resposta (bytes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def reset(self):
+        pass
+
+
+class Counter(_Metric):
+    """Contador crescente.
+
+    Com collect, os valores são lidos de uma função no momento da coleta
+    (por exemplo, os acertos de um cache), no mesmo formato de Gauge.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        if self.collect is not None:
+            values = self.collect()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, zip(self.labelnames, key), value
+
+
+class Gauge(_Metric):
+    """Medida instantânea, lida no momento da coleta por uma função.
+
+    collect devolve um dicionário {valores dos rótulos (tupla): valor}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self):
+        for key, value in sorted(self.collect().items()):
+            yield self.name, zip(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}  # rótulos -> [contagens por faixa, soma, total]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][position] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Registry:
+    """Conjunto de métricas do processo, exportadas no formato texto do Prometheus.
+
+    Com directory (vários processos, como os workers do gunicorn), cada
+    processo grava as suas métricas num arquivo próprio desse diretório
+    (flush) e render() junta os arquivos de todos: contadores e histogramas
+    são somados, inclusive os de processos que já terminaram (para que não
+    voltem para trás), e as medidas instantâneas aparecem uma vez por
+    processo vivo, com o rótulo pid.
+    """
+
+    # Intervalo, em segundos, entre duas gravações da thread iniciada por start_flushing
+    FLUSH_INTERVAL = 5.0
+
+    def __init__(self, directory=None):
+        self._metrics = []
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._file = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def reset(self):
+        # Processo novo (depois do fork): zerar as métricas herdadas, com locks novos, e gravar
+        # num arquivo próprio
+        self._lock = threading.Lock()
+        for metric in self._metrics:
+            metric._lock = threading.Lock()
+            metric.reset()
+        self._file = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+
+    def _samples(self, gauges=True):
+        return {
+            metric.name: [[name, list(labels), value] for name, labels, value in metric.samples()]
+            for metric in self._metrics
+            if gauges or metric.kind != "gauge"
+        }
+
+    def flush(self, gauges=True):
+        # Gravar as métricas deste processo (sem as medidas instantâneas, com gauges=False)
+        if self.directory is None:
+            return
+        data = {"pid": os.getpid(), "metrics": self._samples(gauges)}
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self._file)
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(f"{path}.tmp", path)
+
+    def start_flushing(self):
+        # Gravar as métricas deste processo a cada FLUSH_INTERVAL segundos, em segundo plano
+        if self.directory is None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.FLUSH_INTERVAL)
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Falha ao gravar as métricas em %s", self.directory)
+
+        threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+    def _processes(self):
+        # Métricas gravadas por cada processo: (pid, métricas); as medidas instantâneas
+        # dos processos que já terminaram são descartadas
+        processes = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not _alive(data["pid"]):
+                data["metrics"] = {
+                    metric.name: data["metrics"].get(metric.name, [])
+                    for metric in self._metrics
+                    if metric.kind != "gauge"
+                }
+            processes.append((data["pid"], data["metrics"]))
+        return processes
+
+    def render(self):
+        if self.directory is None:
+            processes = [(None, self._samples())]
+        else:
+            self.flush()
+            processes = self._processes()
+
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            # Séries (rótulos sem "le") na ordem em que aparecem, com as amostras somadas
+            series = {}
+            for pid, metrics in processes:
+                for name, labels, value in metrics.get(metric.name, []):
+                    labels = [tuple(label) for label in labels]
+                    if metric.kind == "gauge" and pid is not None:
+                        labels.append(("pid", str(pid)))
+                    samples = series.setdefault(tuple(label for label in labels if label[0] != "le"), {})
+                    key = (name, tuple(labels))
+                    samples[key] = samples.get(key, 0) + value
+            for _, samples in sorted(series.items()):
+                for (name, labels), value in samples.items():
+                    lines.append(f"{name}{_format_labels(list(labels))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+# Diretório das métricas de cada processo (definido pelo gunicorn.conf.py); sem ele, /metrics
+# mostra só as do processo que atende a requisição
+REGISTRY = Registry(os.environ.get("METRICS_DIR") or None)
+atexit.register(REGISTRY.flush)
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "apura_stage_seconds",
+    "Duração de cada etapa das operações do dashboard, em segundos.",
+    ["operation", "stage"],
+))
+PAYLOAD_BYTES = REGISTRY.register(Histogram(
+    "apura_payload_bytes",
+    "Tamanho das respostas e dos relatórios gerados, em bytes.",
+    ["operation"],
+    buckets=SIZE_BUCKETS,
+))
+WIRE_BYTES = REGISTRY.register(Histogram(
+    "apura_wire_bytes",
+    "Tamanho das respostas enviadas pela rede (depois da compressão), em bytes.",
+    ["operation"],
+    buckets=SIZE_BUCKETS,
+))
+
+# Etapas medidas na requisição atual (só quando o perfil da requisição está ativo)
+_trace = threading.local()
+
+
+def start_trace():
+    _trace.stages = []
+
+
+def finish_trace():
+    stages = getattr(_trace, "stages", None)
+    _trace.stages = None
+    return stages or []
+
+
+@contextlib.contextmanager
+def stage(operation, name):
+    """Medir uma etapa de uma operação (por exemplo, ("generate_pdf", "build"))."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, operation=operation, stage=name)
+        stages = getattr(_trace, "stages", None)
+        if stages is not None:
+            stages.append((f"{operation}.{name}", elapsed))
+
+
+def observe_size(operation, size, wire_size=None):
+    # wire_size: tamanho enviado pela rede, para as respostas HTTP (comprimidas ou não)
+    PAYLOAD_BYTES.observe(size, operation=operation)
+    if wire_size is not None:
+        WIRE_BYTES.observe(wire_size, operation=operation)
@@ -0,0 +1,301 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fpdf import FPDF
+from plotly.colors import qualitative
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Logo do relatório
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "logoses.png")
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_image(path):
+    # Decodificar a imagem uma única vez por processo
+    return FPDF()._parsepng(path)
+
+
+def _add_image(pdf, path, **kwargs):
+    # Registrar a imagem já decodificada no documento (o FPDF só a lê do disco
+    # quando ela ainda não está em pdf.images); a cópia é necessária porque o
+    # FPDF altera o dicionário ao gravar o documento
+    if path not in pdf.images:
+        pdf.images[path] = dict(_parse_image(path), i=len(pdf.images) + 1)
+    pdf.image(path, **kwargs)
+
+
+def _parse_color(color):
+    # "#636EFA" ou "rgb(136, 204, 238)" -> (r, g, b)
+    if color.startswith("#"):
+        return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return tuple(int(part) for part in color[color.index("(") + 1:color.index(")")].split(","))
+
+
+def _fit_text(pdf, text, width):
+    # Cortar o texto para caber na largura (em mm) com a fonte atual
+    if pdf.get_string_width(text) <= width:
+        return text
+    while text and pdf.get_string_width(text + "...") > width:
+        text = text[:-1]
+    return text + "..."
+
+
+def _add_bar_chart(pdf, totals, dimension, colors):
+    # Gráfico de barras horizontais desenhado com as primitivas do FPDF
+    pdf.set_font("Arial", style="B", size=12)
+    pdf.cell(200, 8, txt=f"Gastos por {dimension}", ln=True)
+    pdf.set_font("Arial", size=8)
+
+    label_width, bar_width, row_height = 60, 100, 5
+    maximum = max(float(totals["Valor"].max()), 0.0) if len(totals) else 0.0
+    for position, (label, value, percent) in enumerate(zip(totals[dimension], totals["Valor"], totals["Percentual"])):
+        if pdf.get_y() + row_height > pdf.page_break_trigger:
+            pdf.add_page()
+        x, y = pdf.l_margin, pdf.get_y()
+
+        pdf.set_xy(x, y)
+        pdf.cell(label_width, row_height, txt=_fit_text(pdf, str(label), label_width - 2))
+
+        width = bar_width * value / maximum if maximum > 0 and value > 0 else 0
+        if width > 0:
+            pdf.set_fill_color(*_parse_color(colors[position % len(colors)]))
+            pdf.rect(x + label_width, y + 0.5, width, row_height - 1, style="F")
+
+        pdf.set_xy(x + label_width + width + 1, y)
+        pdf.cell(30, row_height, txt=f"{percent:.2f}%")
+        pdf.set_xy(x, y + row_height)
+    pdf.ln(5)
+
+
+def build_pdf(filters, aggregates, progress=None, colors=None):
+    dates, hospitals, cost_centers, categories = filters
+    progress = progress or (lambda fraction: None)
+    colors = colors or qualitative.Plotly
+
+    # Criar o PDF
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    # Adicionar a logo
+    _add_image(pdf, LOGO_PATH, x=10, y=8, w=30)  # Ajuste o tamanho conforme necessário
+    pdf.ln(20)  # Espaçamento após a imagem
+
+    # Adicionar título principal
+    pdf.set_font("Arial", style="B", size=16)
+    pdf.cell(200, 10, txt="Relatório de Gastos - Apura SUS", ln=True, align='C')
+    pdf.ln(10)
+
+    # Adicionar informações filtradas
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt=f"Datas Selecionadas: {', '.join(dates)}", ln=True)
+    pdf.cell(200, 10, txt=f"Hospitais Selecionados: {', '.join(hospitals)}", ln=True)
+    pdf.cell(200, 10, txt=f"Centros de Custo Selecionados: {', '.join(cost_centers)}", ln=True)
+    pdf.cell(200, 10, txt=f"Categorias Selecionadas: {', '.join(categories)}", ln=True)
+    pdf.ln(10)
+    progress(0.1)
+
+    # Adicionar tabelas de gastos por categoria, hospital e centro de custo
+    with stage("generate_pdf", "tables"):
+        sections = ["Categoria", "Hospital", "Centro de Custo"]
+        for position, dimension in enumerate(sections, start=1):
+            pdf.set_font("Arial", style="B", size=14)
+            pdf.cell(200, 10, txt=f"Gastos por {dimension}:", ln=True)
+            pdf.set_font("Arial", size=12)
+            if aggregates is not None:
+                totals = aggregates[dimension]
+                for label, value in zip(totals[dimension], totals["Valor"]):
+                    pdf.cell(200, 10, txt=f"- {label}: R$ {value:,.2f}", ln=True)
+            pdf.ln(10)
+            progress(0.1 + 0.3 * position / len(sections))
+
+    # Adicionar os gráficos de barras, como no dashboard
+    if aggregates is not None:
+        with stage("generate_pdf", "charts"):
+            pdf.add_page()
+            pdf.set_font("Arial", style="B", size=14)
+            pdf.cell(200, 10, txt="Gráficos:", ln=True)
+            charts = ["Categoria", "Subcategoria", "Hospital", "Centro de Custo"]
+            for position, dimension in enumerate(charts, start=1):
+                _add_bar_chart(pdf, aggregates[dimension], dimension, colors)
+                progress(0.4 + 0.55 * position / len(charts))
+
+    # Gerar o PDF em memória
+    with stage("generate_pdf", "output"):
+        return pdf.output(dest='S').encode('latin1')
+
+
+def report_key(snapshot, filters, colors=None):
+    # Impressão digital do relatório: dados do snapshot, filtros normalizados e paleta
+    payload = json.dumps([snapshot.token, filters, colors], ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class ReportQueue:
+    """Fila de geração de relatórios em segundo plano.
+
+    Os relatórios prontos ficam em disco, nomeados pela impressão digital
+    (dados + filtros), de modo que um relatório idêntico é servido direto
+    do cache e qualquer worker do servidor consegue entregá-lo. Um relatório
+    em andamento tem um marcador em disco com o processo responsável e o
+    progresso; se esse processo morre, ou o marcador fica mais de
+    stale_after segundos sem ser atualizado, o relatório é dado como falho.
+    """
+
+    def __init__(self, directory, max_workers=2, max_files=64, stale_after=600):
+        self.directory = directory
+        self.max_files = max_files
+        self.stale_after = stale_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self._jobs = {}  # Relatórios em andamento neste processo -> progresso (0 a 1)
+        self._lock = threading.Lock()
+
+    def _path(self, key, extension="pdf"):
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def _mark_pending(self, key, fraction):
+        # Marcador do relatório em andamento (gravado de uma vez, para ser lido por outros workers)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(key, 'pending')}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"pid": os.getpid(), "progress": fraction}, f)
+        os.replace(tmp_path, self._path(key, "pending"))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def submit(self, key, build):
+        # build recebe uma função de progresso e devolve o conteúdo do relatório
+        if os.path.exists(self._path(key)):
+            return "ready"
+        with self._lock:
+            if key in self._jobs:
+                return "pending"
+            # Em andamento em outro worker; um marcador abandonado é assumido por este processo
+            marker = self._marker(key)
+            if marker is not None and not self._abandoned(marker):
+                return "pending"
+            self._jobs[key] = 0.0
+            self._remove(self._path(key, "error"))
+            self._mark_pending(key, 0.0)
+        self._executor.submit(self._run, key, build)
+        return "pending"
+
+    def _set_progress(self, key, fraction):
+        with self._lock:
+            if key not in self._jobs:
+                return
+            self._jobs[key] = fraction
+        self._mark_pending(key, fraction)
+
+    def _run(self, key, build):
+        error = None
+        try:
+            self._set_progress(key, 0.0)  # Saiu da fila: renovar o marcador
+            content = build(lambda fraction: self._set_progress(key, fraction))
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self._path(key)}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, self._path(key))
+        except Exception as exc:
+            logger.exception("Falha ao gerar o relatório %s", key)
+            error = str(exc)
+        finally:
+            # A falha só aparece junto com o fim do relatório: um novo pedido logo depois
+            # dela gera o relatório de novo em vez de encontrá-lo ainda em andamento
+            with self._lock:
+                if error is not None:
+                    self._fail(key, error)
+                self._jobs.pop(key, None)
+                self._remove(self._path(key, "pending"))
+            self._prune()
+
+    def _fail(self, key, message):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(key, "error"), "w") as f:
+            f.write(message)
+
+    def _prune(self):
+        # Manter apenas os relatórios mais recentes; falhas e marcadores abandonados
+        # só servem para responder ao acompanhamento e expiram com stale_after
+        now = time.time()
+        reports = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                modified = os.path.getmtime(path)
+            except OSError:
+                continue
+            if name.endswith(".pdf"):
+                reports.append((modified, path))
+            elif name.endswith((".error", ".pending", ".tmp")) and now - modified > self.stale_after:
+                self._remove(path)
+        reports.sort(reverse=True)
+        for _, path in reports[self.max_files:]:
+            self._remove(path)
+
+    def _marker(self, key):
+        # Marcador do relatório em andamento ({} enquanto está sendo trocado; None sem marcador)
+        path = self._path(key, "pending")
+        try:
+            modified = os.path.getmtime(path)
+            with open(path) as f:
+                marker = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            return {}
+        return dict(marker, modified=modified)
+
+    def _abandoned(self, marker):
+        # O processo responsável morreu ou o relatório parou de avançar
+        if not marker:
+            return False
+        if time.time() - marker["modified"] > self.stale_after:
+            return True
+        try:
+            os.kill(marker["pid"], 0)
+        except ProcessLookupError:
+            return True
+        except (OSError, KeyError, TypeError):
+            pass
+        return False
+
+    def status(self, key):
+        # Estado ("ready", "error" ou "pending") e progresso do relatório
+        if os.path.exists(self._path(key)):
+            return "ready", 1.0
+        if os.path.exists(self._path(key, "error")):
+            return "error", 0.0
+        with self._lock:
+            if key in self._jobs:
+                return "pending", self._jobs[key]
+
+        # Em andamento em outro worker: acompanhado pelo marcador em disco
+        marker = self._marker(key)
+        if marker is not None and not self._abandoned(marker):
+            return "pending", float(marker.get("progress", 0.0))
+        if os.path.exists(self._path(key)):
+            return "ready", 1.0  # Concluído entre as verificações acima
+        if marker is not None:
+            logger.warning("Relatório %s abandonado pelo processo que o gerava", key)
+            self._fail(key, "Relatório abandonado pelo processo que o gerava")
+            self._remove(self._path(key, "pending"))
+        return "error", 0.0
+
+    def read(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
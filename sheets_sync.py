@@ -0,0 +1,171 @@
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+logger = logging.getLogger(__name__)
+
+# Linhas por bloco da planilha (cada bloco tem a sua soma de verificação)
+BLOCK_SIZE = 500
+
+# Blocos já sincronizados conferidos a cada ciclo, em rodízio, além do último
+VERIFY_BLOCKS = 4
+
+
+def _trim(row):
+    # Linha sem as células vazias do final (a API não as devolve)
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def _checksum(rows, width):
+    # Soma de verificação de um bloco de linhas (completadas até a largura do cabeçalho)
+    digest = hashlib.sha1()
+    for row in rows:
+        cells = list(row[:width]) + [""] * (width - len(row))
+        digest.update("\x1f".join(str(cell) for cell in cells).encode())
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+class SyncResult:
+    """Linhas trazidas por uma sincronização.
+
+    rows é um DataFrame com as colunas do cabeçalho, indexado pela posição
+    (a partir de 0) de cada linha de dados na planilha. Numa sincronização
+    completa, rows é a planilha inteira; numa incremental, são as linhas
+    novas e as dos blocos alterados, e replaced lista as posições cujas
+    linhas anteriores devem ser descartadas.
+    """
+
+    def __init__(self, rows, replaced=None, full=False):
+        self.rows = rows
+        self.replaced = replaced if replaced is not None else np.empty(0, dtype=np.int64)
+        self.full = full
+
+    @property
+    def unchanged(self):
+        return not self.full and self.rows.empty and len(self.replaced) == 0
+
+
+class SheetSync:
+    """Sincronização incremental de uma aba que cresce por linhas acrescentadas.
+
+    Guarda o número de linhas já sincronizadas e uma soma de verificação por
+    bloco de block_size linhas. A cada ciclo, um único batch_get traz o
+    cabeçalho, as linhas após a última sincronizada, o último bloco e alguns
+    blocos anteriores em rodízio; só os blocos cuja soma mudou são
+    substituídos. Mudança no cabeçalho ou linhas removidas levam a uma
+    sincronização completa. A aba só precisa oferecer get_all_values() e
+    batch_get(ranges), como gspread.Worksheet (ou um substituto em testes).
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE, verify_blocks=VERIFY_BLOCKS):
+        self.block_size = block_size
+        self.verify_blocks = verify_blocks
+        self.reset()
+
+    def reset(self):
+        self.header = None
+        self.row_count = 0
+        self.checksums = []
+        self._cursor = 0
+
+    def _frame(self, rows, start):
+        width = len(self.header)
+        rows = [list(row[:width]) + [""] * (width - len(row)) for row in rows]
+        return pd.DataFrame(rows, columns=self.header, index=pd.RangeIndex(start, start + len(rows)))
+
+    def _block_range(self, start, end):
+        # Linhas de dados [start, end) -> intervalo A1 (a linha 1 é o cabeçalho)
+        return f"{rowcol_to_a1(start + 2, 1)}:{rowcol_to_a1(end + 1, len(self.header))}"
+
+    def _update_checksums(self, rows, start):
+        # Recalcular as somas a partir do bloco que contém a linha start
+        width = len(self.header)
+        first_block = start // self.block_size
+        del self.checksums[first_block:]
+        for offset in range(0, len(rows), self.block_size):
+            self.checksums.append(_checksum(rows[offset:offset + self.block_size], width))
+
+    def full_sync(self, worksheet):
+        values = worksheet.get_all_values()
+        self.reset()
+        self.header = list(values[0]) if values else []
+        rows = values[1:]
+        self.row_count = len(rows)
+        self._update_checksums(rows, 0)
+        logger.info("Sincronização completa da planilha: %d linhas", len(rows))
+        return SyncResult(self._frame(rows, 0), full=True)
+
+    def sync(self, worksheet):
+        if not self.header:
+            return self.full_sync(worksheet)
+
+        # Blocos conferidos: o último (onde costumam cair as edições recentes) e alguns em rodízio
+        n_blocks = len(self.checksums)
+        last_block = n_blocks - 1
+        verified = []
+        if n_blocks > 1:
+            for step in range(min(self.verify_blocks, n_blocks - 1)):
+                verified.append((self._cursor + step) % (n_blocks - 1))
+            self._cursor = (self._cursor + len(verified)) % (n_blocks - 1)
+        if last_block >= 0:
+            verified.append(last_block)
+
+        width = len(self.header)
+        # A linha do cabeçalho inteira, para perceber também as colunas acrescentadas à direita
+        ranges = ["1:1"]
+        for block in verified:
+            start = block * self.block_size
+            ranges.append(self._block_range(start, min(start + self.block_size, self.row_count)))
+        # Intervalo aberto: todas as linhas depois da última sincronizada
+        ranges.append(f"{rowcol_to_a1(self.row_count + 2, 1)}:{rowcol_to_a1(1, width)[:-1]}")
+
+        responses = worksheet.batch_get(ranges)
+        header, blocks, appended = responses[0], responses[1:-1], list(responses[-1])
+
+        if not header or _trim(header[0]) != _trim(self.header):
+            logger.info("Cabeçalho da planilha alterado; sincronizando tudo")
+            return self.full_sync(worksheet)
+
+        changed = []
+        for block, rows in zip(verified, blocks):
+            start = block * self.block_size
+            expected = min(start + self.block_size, self.row_count) - start
+            if len(rows) < expected:
+                logger.info("Linhas removidas da planilha; sincronizando tudo")
+                return self.full_sync(worksheet)
+            if _checksum(rows, width) != self.checksums[block]:
+                changed.append((block, start, list(rows)))
+
+        frames = []
+        replaced = []
+        for block, start, rows in changed:
+            self.checksums[block] = _checksum(rows, width)
+            frames.append(self._frame(rows, start))
+            replaced.append(np.arange(start, start + len(rows)))
+
+        if appended:
+            # O último bloco (parcial) passa a incluir as linhas novas
+            tail_start = last_block * self.block_size if last_block >= 0 else 0
+            tail = next((rows for block, rows in zip(verified, blocks) if block == last_block), [])
+            self._update_checksums(list(tail) + appended, tail_start)
+            frames.append(self._frame(appended, self.row_count))
+            self.row_count += len(appended)
+
+        if changed or appended:
+            logger.info(
+                "Sincronização incremental: %d linhas novas, %d blocos alterados",
+                len(appended), len(changed),
+                extra={"appended_rows": len(appended), "changed_blocks": len(changed)},
+            )
+        rows = pd.concat(frames) if frames else self._frame([], self.row_count)
+        return SyncResult(
+            rows,
+            replaced=np.concatenate(replaced) if replaced else None,
+        )
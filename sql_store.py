@@ -0,0 +1,457 @@
+import glob
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cube import DIMENSIONS, FILTER_DIMENSIONS, monthly_frame
+from drilldown import OPERATOR_ALIASES, PAGE_SIZE, parse_filter_query, parse_number, text_condition
+from ingestion import MONTH_FORMAT
+
+try:
+    import duckdb
+except ImportError:  # Opcional: só é necessário com o backend duckdb
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Backends SQL embarcados disponíveis
+ENGINES = ("sqlite", "duckdb")
+
+# Tabela fato (linhas tratadas, com as dimensões codificadas), dicionário dos códigos, colunas da
+# tabela fato e somas por combinação das dimensões do cubo
+TABLE = "gastos"
+DICTIONARY = "dimensoes"
+COLUMNS = "colunas"
+CELLS = "celulas"
+
+# Posição de cada linha no DataFrame tratado (a ordem das exportações e dos empates na tabela)
+ROW_COLUMN = "__linha"
+
+# Dimensões somadas pela consulta dos filtros (todas as do cubo, menos o mês)
+GROUP_DIMENSIONS = [dimension for dimension in DIMENSIONS if dimension != "Data"]
+
+# Linhas gravadas por vez na carga do banco e lidas por vez nas exportações
+CHUNK_SIZE = 50_000
+
+# Comparações numéricas do filtro da tabela de detalhes em SQL
+SQL_OPERATORS = {operator: symbol for symbol, operator in OPERATOR_ALIASES.items()}
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _in(column, codes):
+    return f"{_quote(column)} IN ({', '.join('?' * len(codes))})", list(codes)
+
+
+def _where(clauses):
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+def _is_numeric(series):
+    return pd.api.types.is_float_dtype(series) or pd.api.types.is_integer_dtype(series)
+
+
+def _encode(series):
+    # Códigos inteiros de uma coluna de texto e o dicionário [(código, rótulo, ordem)] dos valores
+    # presentes; os meses usam o ordinal do período (em ordem cronológica) e o rótulo Mês/Ano dos
+    # filtros. A ordem é a posição da primeira linha com o valor (a ordem das opções no cubo)
+    if isinstance(series.dtype, pd.PeriodDtype):
+        codes = series.array.asi8
+        present, first = np.unique(codes, return_index=True)
+        labels = pd.PeriodIndex.from_ordinals(present, freq=series.dtype.freq).strftime(MONTH_FORMAT)
+    else:
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype("category")
+        codes = series.cat.codes.to_numpy(dtype=np.int64)
+        present, first = np.unique(codes, return_index=True)
+        present, first = present[present >= 0], first[present >= 0]  # Sem os valores vazios
+        labels = series.cat.categories.astype(str)[present]
+    return codes, list(zip(present.tolist(), labels, first.tolist()))
+
+
+def _modified(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+class SqlStore:
+    """Banco de dados analítico local (SQLite ou DuckDB) com o snapshot tratado.
+
+    Cada snapshot é gravado em um arquivo próprio, cujo nome deriva da sua
+    impressão digital (e da versão do formato do banco), de modo que um
+    processo só consulta o banco do snapshot que está servindo e os workers
+    do servidor WSGI encontram o banco gravado pelo que atualiza os dados.
+    O arquivo é montado ao lado e trocado de uma vez; dos bancos de
+    snapshots anteriores, só o mais recente é mantido (os workers que
+    acompanham o cache local ainda o consultam até a próxima verificação).
+    As consultas são feitas em disco, sem carregar a tabela em memória.
+    """
+
+    FORMAT_VERSION = "2"
+
+    def __init__(self, path, engine="sqlite"):
+        if engine not in ENGINES:
+            raise ValueError(f"Backend SQL desconhecido: {engine}")
+        if engine == "duckdb" and duckdb is None:
+            raise RuntimeError("O backend duckdb requer o pacote duckdb (pip install duckdb)")
+        self.path = path
+        self.engine = engine
+        self._local = threading.local()
+
+    def database_path(self, fingerprint):
+        root, extension = os.path.splitext(self.path)
+        digest = hashlib.sha1(f"{self.FORMAT_VERSION}:{fingerprint}".encode()).hexdigest()[:16]
+        return f"{root}.{digest}{extension}"
+
+    def exists(self, fingerprint):
+        return os.path.exists(self.database_path(fingerprint))
+
+    def _connect(self, path, read_only):
+        if self.engine == "duckdb":
+            return duckdb.connect(path, read_only=read_only)
+        if read_only:
+            # O arquivo nunca é alterado depois de publicado
+            return sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        return connection
+
+    def build(self, df, fingerprint):
+        """Gravar o DataFrame tratado no banco do snapshot (nada a fazer se já existe)."""
+        path = self.database_path(fingerprint)
+        if os.path.exists(path):
+            return path
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        os.remove(tmp_path)  # O banco cria o arquivo
+        try:
+            connection = self._connect(tmp_path, read_only=False)
+            try:
+                self._load(connection, df)
+            finally:
+                connection.close()
+            os.replace(tmp_path, path)
+        except BaseException:
+            for leftover in glob.glob(f"{tmp_path}*"):
+                os.remove(leftover)
+            raise
+
+        self._remove_old(path)
+        logger.info("Banco %s montado com %d linhas em %s", self.engine, len(df), path)
+        return path
+
+    def _load(self, connection, df):
+        # Colunas de texto viram códigos inteiros (consultas e arquivo menores) e os
+        # rótulos ficam no dicionário
+        numeric = [column for column in df.columns if _is_numeric(df[column])]
+        columns, entries = {}, []
+        for column in df.columns:
+            if column in numeric:
+                columns[column] = df[column].to_numpy()
+            else:
+                columns[column], labels = _encode(df[column])
+                entries.extend((column, code, label, order) for code, label, order in labels)
+
+        # Linhas gravadas na ordem do DataFrame: no SQLite, a posição é a chave da tabela
+        row_type = "INTEGER PRIMARY KEY" if self.engine == "sqlite" else "BIGINT"
+        definitions = ", ".join([f"{_quote(ROW_COLUMN)} {row_type}"] + [
+            f"{_quote(column)} {'DOUBLE' if pd.api.types.is_float_dtype(df[column]) else 'BIGINT'}"
+            for column in df.columns
+        ])
+        connection.execute(f"CREATE TABLE {TABLE} ({definitions})")
+        connection.execute(f"CREATE TABLE {DICTIONARY} (dimensao VARCHAR, codigo BIGINT, rotulo VARCHAR, ordem BIGINT)")
+        connection.executemany(f"INSERT INTO {DICTIONARY} VALUES (?, ?, ?, ?)", entries)
+        connection.execute(f"CREATE TABLE {COLUMNS} (posicao BIGINT, coluna VARCHAR, codificada BIGINT)")
+        connection.executemany(f"INSERT INTO {COLUMNS} VALUES (?, ?, ?)", [
+            (position, column, int(column not in numeric)) for position, column in enumerate(df.columns)
+        ])
+
+        insert = f"INSERT INTO {TABLE} VALUES ({', '.join('?' * (len(df.columns) + 1))})"
+        for start in range(0, len(df), CHUNK_SIZE):
+            chunk = {ROW_COLUMN: np.arange(start, min(start + CHUNK_SIZE, len(df)))}
+            chunk.update((column, values[start:start + CHUNK_SIZE]) for column, values in columns.items())
+            if self.engine == "duckdb":
+                connection.register("chunk", pd.DataFrame(chunk))
+                connection.execute(f"INSERT INTO {TABLE} SELECT * FROM chunk")
+                connection.unregister("chunk")
+            else:
+                connection.executemany(insert, zip(*(values.tolist() for values in chunk.values())))
+
+        # Somas e linhas por combinação das dimensões do cubo: os filtros, os totais e a evolução
+        # mensal são consultados nessa tabela, bem menor que a de linhas
+        dimensions = ", ".join(_quote(dimension) for dimension in DIMENSIONS)
+        connection.execute(
+            f"CREATE TABLE {CELLS} AS SELECT {dimensions}, SUM({_quote('Valor')}) AS {_quote('Valor')}, "
+            f"COUNT(*) AS linhas FROM {TABLE} GROUP BY {dimensions}"
+        )
+        if self.engine == "sqlite":
+            # O DuckDB já descarta blocos pelos mínimos e máximos de cada coluna
+            connection.execute(f"CREATE INDEX {TABLE}_data ON {TABLE} ({_quote('Data')}, {_quote('Hospital')})")
+            connection.execute("ANALYZE")
+        connection.commit()
+
+    def _remove_old(self, current):
+        # Apagar os bancos anteriores, menos o mais recente deles
+        root, extension = os.path.splitext(self.path)
+        old = [path for path in glob.glob(f"{glob.escape(root)}.*{extension}") if path != current]
+        for path in sorted(old, key=_modified, reverse=True)[1:]:
+            try:
+                os.remove(path)
+            except OSError:
+                logger.warning("Não foi possível apagar o banco antigo %s", path, exc_info=True)
+
+    def reader(self, fingerprint):
+        """Consultas ao banco do snapshot (None enquanto ele ainda não foi montado).
+
+        Cada thread mantém a sua conexão, reaberta quando o snapshot muda.
+        """
+        path = self.database_path(fingerprint)
+        current = getattr(self._local, "reader", None)
+        if current is not None and current.path == path:
+            return current
+        if not os.path.exists(path):
+            return None
+        if current is not None:
+            current.close()
+        self._local.reader = SqlReader(self._connect(path, read_only=True), path)
+        return self._local.reader
+
+
+class SqlReader:
+    """Consultas parametrizadas sobre o banco de um snapshot.
+
+    O dicionário dos códigos é lido uma vez, ao abrir o banco: os rótulos
+    dos filtros são traduzidos para códigos antes da consulta, e os códigos
+    do resultado de volta para rótulos. Os filtros seguem a ordem de
+    FILTER_DIMENSIONS (None: sem filtro; vazio: nada selecionado), como em
+    SpendCube.slice, e as respostas são as mesmas do cubo e do DataFrame.
+    """
+
+    def __init__(self, connection, path):
+        self.connection = connection
+        self.path = path
+        self.codes, self.labels = {}, {}
+        rows = connection.execute(f"SELECT dimensao, codigo, rotulo FROM {DICTIONARY} ORDER BY dimensao, ordem").fetchall()
+        for dimension, code, label in rows:
+            self.codes.setdefault(dimension, {})[label] = code
+            self.labels.setdefault(dimension, {})[code] = label
+        rows = connection.execute(f"SELECT coluna, codificada FROM {COLUMNS} ORDER BY posicao").fetchall()
+        self.columns = [column for column, _ in rows]
+        self.coded = {column for column, coded in rows if coded}
+
+    def close(self):
+        self.connection.close()
+
+    def _filters(self, filters):
+        # Cláusulas e parâmetros dos filtros do dashboard (None quando nenhuma linha os atende)
+        clauses, params = [], []
+        for dimension, selected in zip(FILTER_DIMENSIONS, filters):
+            if selected is None:
+                continue
+            codes = self.codes.get(dimension, {})
+            selected = sorted({codes[label] for label in selected if label in codes})
+            if not selected:
+                return None
+            if len(selected) == len(codes):
+                continue  # Todos os valores: a condição não restringe nada
+            clause, values = _in(dimension, selected)
+            clauses.append(clause)
+            params.extend(values)
+        return clauses, params
+
+    def _decode(self, rows, columns):
+        # Linhas do banco com os códigos trocados pelos rótulos (meses como Mês/Ano)
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        for column in columns:
+            if column in self.coded:
+                frame[column] = frame[column].map(self.labels.get(column, {}))
+        return frame
+
+    def options(self, dimension):
+        # Valores distintos da dimensão, na ordem em que aparecem na planilha (como SpendCube.options)
+        return list(self.codes.get(dimension, {}))
+
+    def cells(self, filters):
+        """Soma do Valor por hospital, centro de custo, categoria e subcategoria.
+
+        O resultado tem uma linha por combinação com lançamentos, e os totais
+        de cada dimensão saem dele sem nova consulta.
+        """
+        where = self._filters(filters)
+        rows = []
+        if where is not None:
+            clauses, params = where
+            groups = ", ".join(_quote(dimension) for dimension in GROUP_DIMENSIONS)
+            rows = self.connection.execute(
+                f"SELECT {groups}, SUM({_quote('Valor')}) FROM {CELLS} {_where(clauses)} GROUP BY {groups}", params,
+            ).fetchall()
+        cells = pd.DataFrame(rows, columns=GROUP_DIMENSIONS + ["Valor"])
+        for dimension in GROUP_DIMENSIONS:
+            cells[dimension] = cells[dimension].map(self.labels[dimension])
+        cells["Valor"] = cells["Valor"].astype("float64")
+        return cells
+
+    def filter_options(self, selections):
+        """Opções de cada filtro compatíveis com as seleções dos demais (como SpendCube.filter_options).
+
+        Um filtro sem seleção, ou com todos os valores selecionados, não
+        restringe os demais, e os rótulos desconhecidos são ignorados. Cada
+        filtro custa uma consulta sobre as combinações das dimensões.
+        """
+        restrictions = []
+        for dimension, selected in zip(FILTER_DIMENSIONS, selections):
+            codes = self.codes.get(dimension, {})
+            chosen = sorted({codes[label] for label in selected or [] if label in codes})
+            restrictions.append(None if not selected or len(chosen) == len(codes) else chosen)
+
+        options = []
+        for position, dimension in enumerate(FILTER_DIMENSIONS):
+            others = [
+                (FILTER_DIMENSIONS[other], codes) for other, codes in enumerate(restrictions)
+                if other != position and codes is not None
+            ]
+            if not others:
+                options.append(self.options(dimension))
+                continue
+            if not all(codes for _, codes in others):
+                options.append([])
+                continue
+            clauses, params = [], []
+            for other, codes in others:
+                clause, values = _in(other, codes)
+                clauses.append(clause)
+                params.extend(values)
+            present = {
+                code for code, in self.connection.execute(
+                    f"SELECT DISTINCT {_quote(dimension)} FROM {CELLS} {_where(clauses)}", params,
+                ).fetchall()
+            }
+            options.append([label for label, code in self.codes.get(dimension, {}).items() if code in present])
+        return options
+
+    def monthly(self, filters, dimension, limit=None):
+        # Série mensal por valor da dimensão, com as variações (como CubeSlice.monthly)
+        where = self._filters(filters)
+        rows = []
+        if where is not None:
+            clauses, params = where
+            groups = f"{_quote('Data')}, {_quote(dimension)}"
+            rows = self.connection.execute(
+                f"SELECT {groups}, SUM({_quote('Valor')}), SUM(linhas) FROM {CELLS} {_where(clauses)} GROUP BY {groups}",
+                params,
+            ).fetchall()
+        sums = pd.DataFrame(rows, columns=["Data", "codigo", "Valor", "linhas"])
+        if sums.empty:
+            return monthly_frame(pd.PeriodIndex([], freq="M"), np.empty(0, dtype=object), np.zeros((0, 0)), np.zeros(0), dimension)
+
+        # Matriz mês x valor, do primeiro ao último mês, com os valores em ordem alfabética
+        ordinals = sums["Data"].to_numpy(dtype=np.int64)
+        first = ordinals.min()
+        months = pd.period_range(pd.Period(ordinal=first, freq="M"), periods=ordinals.max() - first + 1, freq="M")
+        codes, uniques = pd.factorize(sums["codigo"])
+        labels = np.array([self.labels[dimension][code] for code in uniques], dtype=object)
+        matrix = np.zeros((len(months), len(labels)))
+        np.add.at(matrix, (ordinals - first, codes), sums["Valor"].to_numpy(dtype="float64"))
+        month_counts = np.bincount(ordinals - first, weights=sums["linhas"].to_numpy(dtype="float64"), minlength=len(months))
+        order = np.argsort(labels, kind="stable")
+        return monthly_frame(months, labels[order], matrix[:, order], month_counts, dimension, limit)
+
+    def _row_filters(self, filters, dimension, value, filter_query):
+        # Cláusulas das linhas de um valor da dimensão com os filtros do dashboard e os da tabela de
+        # detalhes (None quando nenhuma linha as atende; ValueError se o filtro da tabela for inválido)
+        conditions = parse_filter_query(filter_query)
+        where = self._filters(filters)
+        code = self.codes.get(dimension, {}).get(value)
+        if where is None or code is None:
+            return None
+        clauses, params = where
+        clauses.append(f"{_quote(dimension)} = ?")
+        params.append(code)
+
+        for column, operator, text, case_sensitive in conditions:
+            if column not in self.columns:
+                continue
+            if column in self.coded:
+                # Condição avaliada uma vez por rótulo do dicionário, como em filter_rows
+                labels = self.codes.get(column, {})
+                matches = text_condition(pd.Series(list(labels), dtype=object), operator, text, case_sensitive)
+                if matches is None:
+                    continue
+                codes = [code for code, keep in zip(labels.values(), matches) if keep]
+                if not codes:
+                    return None
+                clause, values = _in(column, codes)
+            elif operator != "contains":
+                number = parse_number(column, text)
+                if operator not in SQL_OPERATORS:
+                    continue
+                clause, values = f"{_quote(column)} {SQL_OPERATORS[operator]} ?", [number]
+            else:
+                clause, values = f"instr(CAST({_quote(column)} AS VARCHAR), ?) > 0", [text]
+            clauses.append(clause)
+            params.extend(values)
+        return clauses, params
+
+    def row_count(self, filters, dimension, value, filter_query=None):
+        # Linhas da tabela de detalhes de um valor da dimensão
+        where = self._row_filters(filters, dimension, value, filter_query)
+        if where is None:
+            return 0
+        clauses, params = where
+        return self.connection.execute(f"SELECT COUNT(*) FROM {TABLE} {_where(clauses)}", params).fetchone()[0]
+
+    def rows(self, filters, dimension, value, filter_query=None, sort_by=None, offset=0, limit=PAGE_SIZE):
+        """Página da tabela de detalhes de um valor da dimensão, como em filter_rows e sort_rows.
+
+        As linhas são ordenadas pelas colunas de sort_by (modo multi da
+        DataTable) e, nos empates, pela ordem da planilha; só as limit linhas
+        a partir de offset são lidas.
+        """
+        where = self._row_filters(filters, dimension, value, filter_query)
+        if where is None:
+            return self._decode([], self.columns)
+        clauses, params = where
+        order = [
+            f"{_quote(item['column_id'])} {'DESC' if item['direction'] == 'desc' else 'ASC'}"
+            for item in sort_by or [] if item["column_id"] in self.columns
+        ]
+        order.append(_quote(ROW_COLUMN))
+        rows = self.connection.execute(
+            f"SELECT {', '.join(_quote(column) for column in self.columns)} FROM {TABLE} {_where(clauses)} "
+            f"ORDER BY {', '.join(order)} LIMIT ? OFFSET ?",
+            [*params, limit, offset],
+        ).fetchall()
+        return self._decode(rows, self.columns)
+
+    def iter_rows(self, filters, chunk_size=CHUNK_SIZE):
+        # Linhas dos filtros em blocos, na ordem da planilha (cada bloco continua do último lido)
+        where = self._filters(filters)
+        if where is None:
+            return
+        clauses, params = where
+        columns = ", ".join(_quote(column) for column in [ROW_COLUMN, *self.columns])
+        last = -1
+        while True:
+            rows = self.connection.execute(
+                f"SELECT {columns} FROM {TABLE} {_where([*clauses, f'{_quote(ROW_COLUMN)} > ?'])} "
+                f"ORDER BY {_quote(ROW_COLUMN)} LIMIT ?",
+                [*params, last, chunk_size],
+            ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield self._decode([row[1:] for row in rows], self.columns)
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# Os módulos do projeto ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def raw_sheet():
+    # Linhas no formato em que o Google Sheets as entrega (tudo texto)
+    return pd.DataFrame({
+        "Data": ["01/2024", "01/2024", "02/2024", "set/2024", "03/2024", "03/2024"],
+        "Hospital": ["Hospital A", "Hospital B", "Hospital A", "Hospital C", "Hospital B ", "Hospital A"],
+        "Tipo de Custo": ["Direto", "Indireto", "Direto", "Direto", "Direto", "Indireto"],
+        "Centro de Custo": ["UTI", "UTI", "Farmácia", "UTI", "Farmácia", "Lavanderia"],
+        "Categoria": ["Pessoal", "Material", "Material", "Pessoal", "Material", "Serviços"],
+        "Subcategoria": ["Salários", "Medicamentos", "Medicamentos", "Encargos", "Curativos", "Terceiros"],
+        "Valor": ["R$ 1.234,56", "R$ 100,00", "(R$ 50,25)", "2,500.75", "R$ 10", "R$ 0,99"],
+    })
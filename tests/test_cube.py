@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import FILTER_DIMENSIONS, CooccurrenceIndex, SpendCube
+from ingestion import MONTH_FORMAT, ingest
+
+
+def synthetic_frame(rows=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    return ingest(pd.DataFrame({
+        "Data": rng.choice([f"{month:02d}/2023" for month in range(1, 13)], rows),
+        "Hospital": rng.choice([f"Hospital {i}" for i in range(7)], rows),
+        "Tipo de Custo": rng.choice(["Direto", "Indireto"], rows),
+        "Centro de Custo": rng.choice([f"Centro {i}" for i in range(15)], rows),
+        "Categoria": rng.choice(["Pessoal", "Material", "Serviços"], rows),
+        "Subcategoria": rng.choice([f"Sub {i}" for i in range(9)], rows),
+        "Valor": rng.integers(1, 100_000, rows) / 100,
+    }))
+
+
+def labels(df, dimension):
+    # Rótulos de cada linha como aparecem nos filtros do dashboard
+    if dimension == "Data":
+        return df[dimension].dt.strftime(MONTH_FORMAT)
+    return df[dimension].astype(str)
+
+
+@pytest.mark.parametrize("dimension", ["Categoria", "Subcategoria", "Hospital", "Centro de Custo"])
+def test_totals_match_groupby(dimension):
+    df = synthetic_frame()
+    cube = SpendCube(df)
+    filters = (
+        cube.options("Data")[:4], cube.options("Hospital")[:3], cube.options("Centro de Custo"), None,
+    )
+    cube_slice = cube.slice(*filters)
+
+    mask = np.ones(len(df), dtype=bool)
+    for column, selected in zip(FILTER_DIMENSIONS, filters):
+        if selected is not None:
+            mask &= labels(df, column).isin(selected).to_numpy()
+    expected = df[mask].groupby(dimension, observed=True)["Valor"].sum()
+
+    totals = cube_slice.totals(dimension).set_index(dimension)["Valor"]
+    assert list(totals.index) == sorted(expected.index)
+    np.testing.assert_allclose(totals.to_numpy(), expected.loc[totals.index].to_numpy())
+    assert cube_slice.total() == pytest.approx(df.loc[mask, "Valor"].sum())
+    np.testing.assert_array_equal(cube_slice.row_mask(), mask)
+
+
+def test_empty_selection():
+    cube = SpendCube(synthetic_frame(100))
+    cube_slice = cube.slice([], None, None, None)
+    assert cube_slice.empty
+    assert cube_slice.total() == 0.0
+
+
+def random_selection(rng, options):
+    # Seleções de todos os tipos: vazia, poucos valores, mais da metade (busca pelo
+    # complemento), todos, e valores que não existem no snapshot
+    kind = rng.integers(7)
+    if kind == 0:
+        return None
+    if kind == 1:
+        return []
+    if kind == 2:
+        return list(rng.choice(options, rng.integers(1, len(options) // 2 + 1), replace=False))
+    if kind == 3:
+        return list(rng.choice(options, rng.integers(len(options) // 2 + 1, len(options)), replace=False))
+    if kind == 4:
+        return list(options)
+    if kind == 5:
+        return list(rng.choice(options, rng.integers(1, len(options)), replace=False)) + ["Inexistente"]
+    return ["Inexistente"]
+
+
+def expected_options(row_labels, cube, selections):
+    # Opções de cada filtro calculadas direto nas linhas, com uma máscara do pandas
+    expected = []
+    for position, dimension in enumerate(FILTER_DIMENSIONS):
+        mask = np.ones(len(cube.row_cells), dtype=bool)
+        for other, selected in enumerate(selections):
+            if other != position and selected:
+                mask &= row_labels[FILTER_DIMENSIONS[other]].isin(selected).to_numpy()
+        present = set(row_labels[dimension][mask])
+        expected.append([label for label in cube.categories[dimension] if label in present])
+    return expected
+
+
+def sparse_frame(rows, rng):
+    # Cada hospital tem poucos centros de custo e um período próprio, e cada centro poucas
+    # categorias: as opções de um filtro mudam de fato com as seleções dos demais
+    months = [f"{month:02d}/{year}" for year in (2022, 2023) for month in range(1, 13)]
+    centers = {hospital: rng.choice(40, 5, replace=False) for hospital in range(12)}
+    periods = {hospital: rng.integers(0, 18) for hospital in range(12)}
+    hospitals = rng.integers(0, 12, rows)
+    center = np.array([rng.choice(centers[hospital]) for hospital in hospitals])
+    month = np.array([periods[hospital] + rng.integers(0, 7) for hospital in hospitals])
+    category = (center + rng.integers(0, 2, rows)) % 6
+    return ingest(pd.DataFrame({
+        "Data": np.array(months)[month],
+        "Hospital": [f"Hospital {hospital}" for hospital in hospitals],
+        "Tipo de Custo": "Direto",
+        "Centro de Custo": [f"Centro {value}" for value in center],
+        "Categoria": [f"Categoria {value}" for value in category],
+        "Subcategoria": "Sub",
+        "Valor": rng.integers(1, 100_000, rows) / 100,
+    }))
+
+
+def test_filter_options_match_pandas(monkeypatch):
+    rng = np.random.default_rng(13)
+    # Combinações suficientes para várias palavras de 64 bits nos bitsets
+    df = sparse_frame(4000, rng)
+    cube = SpendCube(df)
+    row_labels = {dimension: labels(df, dimension) for dimension in FILTER_DIMENSIONS}
+    words = len(cube.cooccurrence._all)
+    assert words > 4
+
+    for chunk_words in (1, 2, words - 1, words, words + 1, 2048):
+        monkeypatch.setattr(CooccurrenceIndex, "CHUNK_WORDS", chunk_words)
+        for _ in range(40):
+            selections = [random_selection(rng, cube.options(dimension)) for dimension in FILTER_DIMENSIONS]
+            assert cube.filter_options(selections) == expected_options(row_labels, cube, selections), selections
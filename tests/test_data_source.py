@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import cube
+from data_source import DataSource, FederatedSource, LocalFileSource, SnapshotCache
+
+
+class CountingSource:
+    """Fonte local que conta quantas vezes os dados foram baixados."""
+
+    def __init__(self, source):
+        self.source = source
+        self.loads = 0
+
+    def fingerprint(self):
+        return self.source.fingerprint()
+
+    def load(self):
+        self.loads += 1
+        return self.source.load()
+
+
+@pytest.fixture
+def csv_source(tmp_path, raw_sheet):
+    path = tmp_path / "planilha.csv"
+    raw_sheet.to_csv(path, index=False)
+    return CountingSource(LocalFileSource(str(path)))
+
+
+def test_unchanged_fingerprint_skips_download(csv_source, raw_sheet):
+    data_source = DataSource(csv_source)
+    first = data_source.refresh()
+    assert first.version == 1 and len(first.df) == len(raw_sheet)
+    assert data_source.refresh() is first
+    assert csv_source.loads == 1
+
+    # Arquivo alterado: nova impressão digital e nova carga
+    raw_sheet.loc[0, "Valor"] = "R$ 2,00"
+    raw_sheet.to_csv(csv_source.source.path, index=False)
+    second = data_source.refresh()
+    assert csv_source.loads == 2
+    assert second.fingerprint != first.fingerprint
+
+
+def assert_same_cube(actual, expected):
+    expected_arrays = expected.to_arrays()
+    actual_arrays = actual.to_arrays()
+    assert actual_arrays.keys() == expected_arrays.keys()
+    for name, values in expected_arrays.items():
+        np.testing.assert_array_equal(actual_arrays[name], values, err_msg=name)
+
+
+def test_cache_round_trip(tmp_path, csv_source, monkeypatch):
+    cache = SnapshotCache(str(tmp_path / "cache" / "snapshot.parquet"))
+    snapshot = DataSource(csv_source, cache=cache).refresh()
+    assert cache.fingerprint() == snapshot.fingerprint
+    assert snapshot.rows == len(snapshot.df)
+    assert_same_cube(snapshot.cube, cube.SpendCube(snapshot.df))
+
+    # Um novo processo usa o cache sem baixar a fonte nem recalcular o cubo
+    restarted = DataSource(csv_source, cache=cache)
+    monkeypatch.setattr(cube.SpendCube, "__init__", lambda self, df: pytest.fail("cubo recalculado"))
+    cached = restarted.load_cached()
+    assert cached.fingerprint == snapshot.fingerprint
+    # O cubo e o DataFrame só são lidos do cache no primeiro uso
+    assert callable(cached._cube) and callable(cached._df)
+    assert restarted.refresh() is cached
+    assert csv_source.loads == 1
+    assert_same_cube(cached.cube, snapshot.cube)
+    assert cached.columns == snapshot.columns and cached.rows == snapshot.rows
+    pd.testing.assert_frame_equal(cached.df, snapshot.df)
+
+
+def test_cache_is_invalidated_by_a_new_fingerprint(tmp_path, csv_source, raw_sheet):
+    cache = SnapshotCache(str(tmp_path / "snapshot.parquet"))
+    first = DataSource(csv_source, cache=cache).refresh()
+
+    raw_sheet.loc[0, "Valor"] = "R$ 2,00"
+    raw_sheet.to_csv(csv_source.source.path, index=False)
+    restarted = DataSource(csv_source, cache=cache)
+    restarted.load_cached()
+    second = restarted.refresh()
+    assert csv_source.loads == 2
+    assert second.fingerprint != first.fingerprint
+    assert cache.fingerprint() == second.fingerprint
+    assert second.cube.values.sum() != first.cube.values.sum()
+
+    # O snapshot aberto antes continua lendo os seus próprios arquivos
+    assert first.df.loc[0, "Valor"] != second.df.loc[0, "Valor"]
+
+
+def test_half_written_cache_is_ignored(tmp_path, csv_source, raw_sheet):
+    cache = SnapshotCache(str(tmp_path / "snapshot.parquet"))
+    DataSource(csv_source, cache=cache).refresh()
+    cube_file = open(cache.cube_path, "rb").read()
+
+    raw_sheet.loc[0, "Valor"] = "R$ 2,00"
+    raw_sheet.to_csv(csv_source.source.path, index=False)
+    DataSource(csv_source, cache=cache).refresh()
+
+    # Cubo de uma carga e Parquet de outra
+    with open(cache.cube_path, "wb") as f:
+        f.write(cube_file)
+    assert cache.fingerprint() is None
+    with pytest.raises(ValueError):
+        cache.open(1)
+
+
+def test_cache_with_other_format_is_ignored(tmp_path, csv_source, monkeypatch):
+    cache = SnapshotCache(str(tmp_path / "snapshot.parquet"))
+    DataSource(csv_source, cache=cache).refresh()
+
+    monkeypatch.setattr(SnapshotCache, "FORMAT_VERSION", b"formato-futuro")
+    assert cache.fingerprint() is None
+    with pytest.raises(ValueError):
+        cache.open(1)
+
+    data_source = DataSource(csv_source, cache=cache)
+    assert data_source.load_cached() is None
+    data_source.refresh()
+    assert csv_source.loads == 2
+    assert cache.fingerprint() == data_source.current().fingerprint
+
+
+def test_one_follower_takes_over_the_refresh(tmp_path, csv_source):
+    # Dois workers com o mesmo cache: só o que obtém o lock baixa a fonte
+    path = str(tmp_path / "snapshot.parquet")
+    leader = DataSource(csv_source, cache=SnapshotCache(path), follow_cache=True)
+    follower = DataSource(csv_source, cache=SnapshotCache(path), follow_cache=True)
+    snapshot = leader.refresh()
+    assert not leader.follow_cache and csv_source.loads == 1
+    assert follower.refresh().fingerprint == snapshot.fingerprint
+    assert follower.follow_cache and csv_source.loads == 1
+
+    # O lock é liberado quando o processo que atualiza o cache termina
+    leader.cache._lock_file.close()
+    follower.refresh()
+    assert not follower.follow_cache
+
+
+def test_snapshot_is_prepared_before_the_cache_is_saved(tmp_path, csv_source, raw_sheet):
+    cache = SnapshotCache(str(tmp_path / "snapshot.parquet"))
+    data_source = DataSource(csv_source, cache=cache)
+    prepared = []
+    data_source.prepare(lambda snapshot: prepared.append((snapshot.fingerprint, cache.fingerprint())))
+    snapshot = data_source.refresh()
+    # Preparado antes da gravação do cache e de novo ao ser relido dele
+    assert prepared == [(snapshot.fingerprint, None), (snapshot.fingerprint, snapshot.fingerprint)]
+    assert len(snapshot.read_frame()) == snapshot.rows and callable(snapshot._df)
+
+    # Uma preparação que falha não publica o snapshot nem grava o cache
+    def failing(snapshot):
+        raise RuntimeError("banco indisponível")
+
+    data_source.prepare(failing)
+    raw_sheet.loc[0, "Valor"] = "R$ 2,00"
+    raw_sheet.to_csv(csv_source.source.path, index=False)
+    with pytest.raises(RuntimeError):
+        data_source.refresh()
+    assert data_source.current() is snapshot
+    assert cache.fingerprint() == snapshot.fingerprint
+
+
+class FailingSource:
+    """Fonte que não consegue ser baixada."""
+
+    def fingerprint(self):
+        return "sha256:indisponível"
+
+    def load(self):
+        raise ConnectionError("tempo esgotado")
+
+
+@pytest.fixture
+def csv_files(tmp_path, raw_sheet):
+    # Duas planilhas locais com o mesmo esquema (a segunda só com as três primeiras linhas)
+    paths = [str(tmp_path / "norte.csv"), str(tmp_path / "sul.csv")]
+    raw_sheet.to_csv(paths[0], index=False)
+    raw_sheet.head(3).to_csv(paths[1], index=False)
+    return paths
+
+
+def test_federated_sources_are_merged(csv_files, csv_source, raw_sheet):
+    # Os dois arquivos locais são lidos em processos separados e a fonte contada, em uma thread
+    federated = FederatedSource([
+        ("Sul", LocalFileSource(csv_files[1])),
+        ("Norte", LocalFileSource(csv_files[0])),
+        ("Estadual", csv_source),
+    ])
+    snapshot = DataSource(federated).refresh()
+    df = snapshot.df
+    assert len(df) == 2 * len(raw_sheet) + 3 and csv_source.loads == 1
+
+    # Origem na ordem da configuração, com as linhas de cada fonte
+    origin = df[FederatedSource.ORIGIN_COLUMN]
+    assert list(origin.cat.categories) == ["Sul", "Norte", "Estadual"]
+    assert origin.value_counts().to_dict() == {"Sul": 3, "Norte": len(raw_sheet), "Estadual": len(raw_sheet)}
+    assert list(df.loc[origin == "Sul", "Valor"]) == list(df.loc[origin == "Norte", "Valor"].head(3))
+
+
+@pytest.mark.parametrize("failing", ["thread", "process"])
+def test_failing_federated_source_keeps_the_previous_snapshot(csv_files, tmp_path, failing):
+    sources = [("Norte", LocalFileSource(csv_files[0])), ("Sul", LocalFileSource(csv_files[1]))]
+    data_source = DataSource(FederatedSource(sources))
+    snapshot = data_source.refresh()
+
+    # Uma fonte que falha (na rede ou um arquivo ilegível) interrompe a carga inteira
+    if failing == "thread":
+        sources.append(("Estadual", FailingSource()))
+        name = "Estadual"
+    else:
+        corrupted = tmp_path / "corrompida.xlsx"
+        corrupted.write_text("não é uma planilha")
+        sources[1] = ("Sul", LocalFileSource(str(corrupted)))
+        name = "Sul"
+    data_source.source = FederatedSource(sources)
+    with pytest.raises(RuntimeError, match=f"Falha ao carregar a fonte {name}"):
+        data_source.refresh()
+    assert data_source.current() is snapshot
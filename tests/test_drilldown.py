@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from drilldown import filter_rows, page_count, page_records, parse_filter_query, sort_rows
+from ingestion import ingest
+
+
+@pytest.fixture
+def df(raw_sheet):
+    return ingest(raw_sheet)
+
+
+def test_parse_quoted_values_and_operators():
+    query = "{Hospital} contains \"Hospital A\" && {Categoria} icontains 'material' && {Valor} >= 1000"
+    assert parse_filter_query(query) == [
+        ("Hospital", "contains", "Hospital A", True),
+        ("Categoria", "contains", "material", False),
+        ("Valor", "ge", "1000", True),
+    ]
+    assert parse_filter_query("{Centro de Custo} = `UTI`") == [("Centro de Custo", "eq", "UTI", True)]
+    assert parse_filter_query("") == [] and parse_filter_query(None) == []
+
+
+@pytest.mark.parametrize("query", ["Hospital contains A", "{Valor} >", "{Valor} > 1 || {Valor} < 0"])
+def test_malformed_query_raises(query):
+    with pytest.raises(ValueError):
+        parse_filter_query(query)
+
+
+def test_filter_rows(df):
+    positions = np.arange(len(df))
+    hospital_a = np.flatnonzero(df["Hospital"] == "Hospital A")
+    np.testing.assert_array_equal(filter_rows(df, positions, '{Hospital} contains "A"'), hospital_a)
+    np.testing.assert_array_equal(filter_rows(df, positions, "{Hospital} contains 'hospital a'"), [])
+    np.testing.assert_array_equal(filter_rows(df, positions, "{Hospital} icontains 'hospital a'"), hospital_a)
+
+    # Comparações numéricas, com vírgula decimal
+    np.testing.assert_array_equal(filter_rows(df, positions, "{Valor} >= 1000"), np.flatnonzero(df["Valor"] >= 1000))
+    np.testing.assert_array_equal(filter_rows(df, positions, "{Valor} lt 0,99"), np.flatnonzero(df["Valor"] < 0.99))
+    np.testing.assert_array_equal(
+        filter_rows(df, positions, "{Hospital} = 'Hospital A' && {Valor} > 0"),
+        np.flatnonzero((df["Hospital"] == "Hospital A") & (df["Valor"] > 0)),
+    )
+
+    # Meses comparados pelo rótulo Mês/Ano, como na tabela
+    np.testing.assert_array_equal(filter_rows(df, positions, "{Data} = '03/2024'"), [4, 5])
+    # Só as linhas já selecionadas são filtradas
+    np.testing.assert_array_equal(filter_rows(df, np.array([0, 1]), '{Hospital} contains "A"'), [0])
+
+
+def test_filter_rows_rejects_text_in_numeric_comparison(df):
+    with pytest.raises(ValueError):
+        filter_rows(df, np.arange(len(df)), "{Valor} > muito")
+
+
+def test_sort_rows_by_several_columns(df):
+    positions = np.arange(len(df))
+    sort_by = [{"column_id": "Categoria", "direction": "asc"}, {"column_id": "Valor", "direction": "desc"}]
+    expected = df.sort_values(["Categoria", "Valor"], ascending=[True, False], kind="stable").index
+    np.testing.assert_array_equal(sort_rows(df, positions, sort_by), expected)
+
+    # Empates mantêm a ordem original; colunas desconhecidas são ignoradas
+    sort_by = [{"column_id": "Tipo de Custo", "direction": "desc"}, {"column_id": "Inexistente", "direction": "asc"}]
+    expected = df.sort_values("Tipo de Custo", ascending=False, kind="stable").index
+    np.testing.assert_array_equal(sort_rows(df, positions, sort_by), expected)
+
+    # Meses em ordem cronológica, só entre as linhas selecionadas
+    subset = np.array([5, 3, 0])
+    np.testing.assert_array_equal(sort_rows(df, subset, [{"column_id": "Data", "direction": "asc"}]), [0, 5, 3])
+    assert sort_rows(df, subset, []) is subset
+
+
+def test_page_records_bounds(df):
+    positions = np.arange(len(df))
+    assert [record["Valor"] for record in page_records(df, positions, 0, 4)] == list(df["Valor"][:4])
+    assert len(page_records(df, positions, 1, 4)) == 2
+    assert page_records(df, positions, 2, 4) == []
+    assert page_records(df, positions, None, 4)[0]["Data"] == "01/2024"
+    assert page_count(len(positions), 4) == 2
+    assert page_count(len(positions), 6) == 1
+    assert page_count(0, 4) == 1
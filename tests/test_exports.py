@@ -0,0 +1,67 @@
+import io
+import os
+import tempfile
+
+import numpy as np
+import pytest
+from openpyxl import load_workbook
+
+import exports
+from ingestion import ingest
+
+
+@pytest.fixture
+def df(raw_sheet):
+    return ingest(raw_sheet)
+
+
+def aggregates_for(df):
+    aggregates = {"total": df["Valor"].sum()}
+    for dimension in exports.AGGREGATE_DIMENSIONS:
+        totals = df.groupby(dimension, observed=True)["Valor"].sum().reset_index()
+        totals["Percentual"] = totals["Valor"] / aggregates["total"] * 100
+        aggregates[dimension] = totals
+    return aggregates
+
+
+def test_xlsx_splits_rows_across_sheets(df, monkeypatch):
+    # Abas de 3 linhas (com o cabeçalho): as 6 linhas ocupam 3 abas
+    monkeypatch.setattr(exports, "XLSX_MAX_ROWS", 3)
+    chunks = exports.iter_row_chunks(df, np.ones(len(df), dtype=bool), chunk_size=4)
+    content = b"".join(exports.iter_xlsx(df.columns, chunks, aggregates_for(df)))
+    workbook = load_workbook(io.BytesIO(content), read_only=True)
+
+    row_sheets = [name for name in workbook.sheetnames if name.startswith("Linhas")]
+    assert row_sheets == ["Linhas", "Linhas (2)", "Linhas (3)"]
+    rows = []
+    for name in row_sheets:
+        values = list(workbook[name].values)
+        assert list(values[0]) == list(df.columns)
+        assert 1 < len(values) <= 3
+        rows.extend(values[1:])
+    assert len(rows) == len(df)
+    assert sum(row[df.columns.get_loc("Valor")] for row in rows) == pytest.approx(df["Valor"].sum())
+    assert [name for name in workbook.sheetnames if name.startswith("Por ")] == [
+        f"Por {dimension}"[:31] for dimension in exports.AGGREGATE_DIMENSIONS
+    ]
+
+
+def test_xlsx_without_rows_keeps_the_header(df):
+    chunks = exports.iter_row_chunks(df, np.zeros(len(df), dtype=bool))
+    content = b"".join(exports.iter_xlsx(df.columns, chunks, None))
+    workbook = load_workbook(io.BytesIO(content), read_only=True)
+    assert [list(row) for row in workbook["Linhas"].values] == [list(df.columns)]
+
+
+def test_temporary_file_is_removed_when_closed_early(df, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    stream = exports.iter_xlsx(df.columns, exports.iter_row_chunks(df, np.ones(len(df), dtype=bool)), None)
+    assert os.listdir(tmp_path) == []
+    stream.close()
+    assert stream._file.closed
+
+    # Interrompido depois do primeiro bloco
+    stream = exports.iter_xlsx(df.columns, exports.iter_row_chunks(df, np.ones(len(df), dtype=bool)), None)
+    next(iter(stream))
+    stream.close()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,63 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+
+@pytest.fixture(scope="module")
+def dashboard(tmp_path_factory):
+    # O dashboard carrega a fonte em segundo plano; aqui só as funções dos gráficos são usadas
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("DATA_SOURCE_FILE", str(tmp_path_factory.mktemp("dados") / "planilha.csv"))
+        monkeypatch.setenv("DATA_CACHE_PATH", "")
+        monkeypatch.setenv("QUERY_BACKEND", "pandas")
+        return importlib.import_module("dashboard")
+
+
+@pytest.fixture
+def totals():
+    # Totais de uma dimensão como os de compute_totals (ordem alfabética, com percentual)
+    values = np.random.default_rng(11).uniform(10, 1000, size=12).round(2)
+    totals = pd.DataFrame({"Hospital": [f"Hospital {i:02d}" for i in range(12)], "Valor": values})
+    totals["Percentual"] = totals["Valor"] / totals["Valor"].sum() * 100
+    return totals
+
+
+def test_top_n_disabled_keeps_every_bar(dashboard, totals, monkeypatch):
+    monkeypatch.setattr(dashboard, "chart_top_n", 0)
+    assert dashboard.top_n(totals, "Hospital") is totals
+
+
+@pytest.mark.parametrize("limit", [1, 3, 10])
+def test_top_n_groups_the_rest_in_others(dashboard, totals, monkeypatch, limit):
+    monkeypatch.setattr(dashboard, "chart_top_n", limit)
+    compacted = dashboard.top_n(totals, "Hospital")
+
+    # As N maiores barras, na ordem original, e uma barra "Outros" com as demais
+    largest = totals.nlargest(limit, "Valor")
+    assert len(compacted) == limit + 1
+    assert list(compacted["Hospital"][:limit]) == list(totals.loc[sorted(largest.index), "Hospital"])
+    assert compacted["Hospital"].iloc[-1] == f"{dashboard.OTHERS_LABEL} ({len(totals) - limit})"
+    assert compacted["Valor"].sum() == pytest.approx(totals["Valor"].sum())
+    assert compacted["Percentual"].sum() == pytest.approx(100)
+
+
+def test_top_n_without_enough_bars_keeps_them(dashboard, totals, monkeypatch):
+    # Uma barra "Outros" com um único item não reduziria nada
+    monkeypatch.setattr(dashboard, "chart_top_n", len(totals) - 1)
+    assert dashboard.top_n(totals, "Hospital") is totals
+
+
+@pytest.mark.parametrize("limit", [0, 3])
+def test_compacted_bar_chart_is_a_valid_figure(dashboard, totals, monkeypatch, limit):
+    monkeypatch.setattr(dashboard, "chart_top_n", limit)
+    compacted = dashboard.top_n(totals, "Hospital")
+    figure = dashboard.build_bar_chart(compacted, "Hospital")
+    # O plotly valida os atributos das traces, do layout e do template
+    validated = go.Figure(figure)
+    assert [trace.name for trace in validated.data] == list(compacted["Hospital"])
+    # Os atributos repetidos em cada barra ficam uma vez, nos padrões do template
+    defaults = validated.layout.template.data.bar[0]
+    assert defaults.texttemplate == "%{text:.2f}%" and defaults.textposition == "outside"
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingestion import ingest, parse_currency, parse_month
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("R$ 1.234,56", 1234.56),
+    ("1.234", 1234.0),
+    ("1,234.56", 1234.56),
+    ("1,234", 1234.0),
+    ("12,5", 12.5),
+    ("R$\xa0-3,00", -3.0),
+    ("(R$ 50,25)", -50.25),
+    ("R$ 1.234.567,89", 1234567.89),
+    ("abc", np.nan),
+    ("", np.nan),
+])
+def test_parse_currency_text(text, expected):
+    result = parse_currency(pd.Series([text], dtype=object))
+    assert result.dtype == "float64"
+    if np.isnan(expected):
+        assert np.isnan(result.iloc[0])
+    else:
+        assert result.iloc[0] == pytest.approx(expected)
+
+
+def test_parse_currency_mixed_and_numeric():
+    mixed = parse_currency(pd.Series([10, "R$ 2,50", 3.5, None], dtype=object))
+    assert mixed.iloc[:3].tolist() == [10.0, 2.5, 3.5]
+    assert np.isnan(mixed.iloc[3])
+    assert parse_currency(pd.Series([1, 2])).tolist() == [1.0, 2.0]
+
+
+def test_parse_month_formats():
+    series = pd.Series([
+        "01/2024", "2024-02-15", "2024-03-01 00:00:00", "15/04/2024", "2024-05",
+        "06-2024", "07/24", "set/2024", "Outubro/2024", 45627, "data inválida",
+    ], dtype=object)
+    result = parse_month(series)
+    expected = ["2024-01", "2024-02", "2024-03", "2024-04", "2024-05", "2024-06", "2024-07",
+                "2024-09", "2024-10", "2024-12"]
+    assert [str(month) for month in result.iloc[:-1]] == expected
+    assert pd.isna(result.iloc[-1])
+
+
+def test_parse_month_datetimes():
+    series = pd.Series(pd.to_datetime(["2024-01-31", "2023-12-01"]))
+    assert [str(month) for month in parse_month(series)] == ["2024-01", "2023-12"]
+
+
+def test_ingest_rejects_invalid_rows(raw_sheet):
+    raw_sheet.loc[1, "Valor"] = "sem valor"
+    raw_sheet.loc[2, "Data"] = "sem data"
+    df = ingest(raw_sheet)
+    assert len(df) == 4
+    assert df["Hospital"].dtype == "category"
+    # Espaços nas pontas removidos e categorias das linhas rejeitadas descartadas
+    assert sorted(df["Hospital"].cat.categories) == ["Hospital A", "Hospital B", "Hospital C"]
+    assert df["Valor"].sum() == pytest.approx(1234.56 + 2500.75 + 10 + 0.99)
@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def registry(directory=None):
+    registry = Registry(directory)
+    registry.register(Counter("requests_total", "Requisições.", ["route"])).inc(2, route="/")
+    registry.register(Histogram("latency_seconds", "Latência.", buckets=(0.1, 1.0))).observe(0.5)
+    registry.register(Gauge("rows", "Linhas.", collect=lambda: {(): 10}))
+    return registry
+
+
+def other_process(directory, pid, name="outro.json"):
+    # Arquivo de métricas gravado por outro worker
+    samples = registry()._samples()
+    with open(os.path.join(directory, name), "w") as f:
+        json.dump({"pid": pid, "metrics": samples}, f)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_single_process_render():
+    text = registry().render()
+    assert 'requests_total{route="/"} 2' in text
+    assert 'latency_seconds_bucket{le="1"} 1' in text
+    assert "rows 10" in text
+
+
+def test_processes_are_aggregated(tmp_path):
+    current = registry(str(tmp_path))
+    other_process(str(tmp_path), os.getppid())
+    lines = current.render().splitlines()
+
+    # Contadores e histogramas somados entre os processos
+    assert 'requests_total{route="/"} 4' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 0' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert "latency_seconds_count 2" in lines
+    # Medidas instantâneas por processo
+    assert f'rows{{pid="{os.getpid()}"}} 10' in lines
+    assert f'rows{{pid="{os.getppid()}"}} 10' in lines
+
+
+def test_dead_process_keeps_counters_but_not_gauges(tmp_path):
+    current = registry(str(tmp_path))
+    pid = dead_pid()
+    other_process(str(tmp_path), pid)
+    lines = current.render().splitlines()
+    assert 'requests_total{route="/"} 4' in lines
+    assert not any(f'pid="{pid}"' in line for line in lines)
+
+
+def test_reset_after_fork(tmp_path):
+    current = registry(str(tmp_path))
+    current.flush()
+    # O processo filho começa do zero e grava num arquivo próprio
+    current.reset()
+    lines = current.render().splitlines()
+    assert len(os.listdir(tmp_path)) == 2
+    assert 'requests_total{route="/"} 2' in lines
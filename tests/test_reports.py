@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from reports import ReportQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = ReportQueue(str(tmp_path), max_workers=1, stale_after=60)
+    yield queue
+    queue._executor.shutdown(wait=True)
+
+
+def wait(queue, key, timeout=10):
+    # Estado do relatório depois que a geração termina
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status, _ = queue.status(key)
+        if status != "pending":
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"Relatório {key} ainda em andamento")
+
+
+def write_marker(queue, key, pid, age=0.0):
+    # Marcador de um relatório em andamento em outro processo
+    path = queue._path(key, "pending")
+    with open(path, "w") as f:
+        json.dump({"pid": pid, "progress": 0.5}, f)
+    modified = time.time() - age
+    os.utime(path, (modified, modified))
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_report_is_built_and_served_from_disk(queue):
+    assert queue.submit("a", lambda progress: b"%PDF-a") == "pending"
+    assert wait(queue, "a") == "ready"
+    assert queue.read("a") == b"%PDF-a"
+    assert queue.submit("a", lambda progress: pytest.fail("relatório gerado de novo")) == "ready"
+
+
+def test_dead_process_leaves_an_abandoned_report(queue):
+    write_marker(queue, "a", dead_pid())
+    assert queue.status("a") == ("error", 0.0)
+    assert os.path.exists(queue._path("a", "error"))
+    assert not os.path.exists(queue._path("a", "pending"))
+
+
+def test_report_in_progress_in_another_process_is_followed(queue):
+    write_marker(queue, "a", os.getppid())
+    assert queue.status("a") == ("pending", 0.5)
+    # Não gerar o mesmo relatório duas vezes
+    assert queue.submit("a", lambda progress: pytest.fail("relatório duplicado")) == "pending"
+
+
+def test_stale_report_is_retried(queue):
+    # Processo vivo, mas o marcador parou de ser atualizado
+    write_marker(queue, "a", os.getppid(), age=queue.stale_after + 1)
+    assert queue.submit("a", lambda progress: b"%PDF-a") == "pending"
+    assert wait(queue, "a") == "ready"
+    assert not os.path.exists(queue._path("a", "pending"))
+
+
+def test_error_is_reported_and_cleared_on_retry(queue):
+    def failing(progress):
+        raise RuntimeError("falha no PDF")
+
+    queue.submit("a", failing)
+    assert wait(queue, "a") == "error"
+    with open(queue._path("a", "error")) as f:
+        assert f.read() == "falha no PDF"
+
+    assert queue.submit("a", lambda progress: b"%PDF-a") == "pending"
+    assert wait(queue, "a") == "ready"
+    assert not os.path.exists(queue._path("a", "error"))
+
+
+def test_prune_keeps_the_newest_reports(tmp_path):
+    queue = ReportQueue(str(tmp_path), max_files=2, stale_after=60)
+    now = time.time()
+    files = {"1.pdf": 40, "2.pdf": 30, "3.pdf": 20, "4.pdf": 10, "velho.error": 120, "novo.error": 10}
+    for name, age in files.items():
+        path = tmp_path / name
+        path.write_bytes(b"")
+        os.utime(path, (now - age, now - age))
+    queue._prune()
+    assert sorted(os.listdir(tmp_path)) == ["3.pdf", "4.pdf", "novo.error"]
+    queue._executor.shutdown()
@@ -0,0 +1,182 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+from gspread.utils import a1_to_rowcol
+
+from cube import DIMENSIONS, SpendCube
+from data_source import DataSource, SheetsSource
+from ingestion import ingest
+from sheets_sync import SheetSync, _trim
+
+HEADER = ["Data", "Hospital", "Tipo de Custo", "Centro de Custo", "Categoria", "Subcategoria", "Valor"]
+
+
+def sheet_row(i):
+    return [
+        f"{i % 12 + 1:02d}/2024", f"Hospital {i % 5}", "Direto", f"Centro {i % 7}",
+        f"Categoria {i % 3}", f"Subcategoria {i % 4}", f"R$ {i * 37 % 1000},{i % 100:02d}",
+    ]
+
+
+class FakeWorksheet:
+    """Aba em memória com get_all_values e batch_get, como gspread.Worksheet."""
+
+    def __init__(self, values):
+        self.values = [list(row) for row in values]
+        self.batch_calls = 0
+
+    def get_all_values(self):
+        return [list(row) for row in self.values]
+
+    def _range(self, a1):
+        # "A2:G5", o intervalo aberto "A10:G" (até a última linha) ou a linha inteira "1:1";
+        # como a API, sem as células e as linhas vazias do final
+        (first_col, first_row), (last_col, last_row) = (
+            re.fullmatch(r"([A-Z]*)(\d*)", cell).groups() for cell in a1.split(":")
+        )
+        first_col = a1_to_rowcol(f"{first_col}1")[1] if first_col else 1
+        last_col = a1_to_rowcol(f"{last_col}1")[1] if last_col else None
+        last_row = int(last_row) if last_row else len(self.values)
+        rows = [_trim(row[first_col - 1:last_col]) for row in self.values[int(first_row) - 1:last_row]]
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def batch_get(self, ranges):
+        self.batch_calls += 1
+        return [self._range(a1) for a1 in ranges]
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.modified = 0
+
+    def get_lastUpdateTime(self):
+        return str(self.modified)
+
+    def get_worksheet(self, index):
+        return self.worksheet
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_url(self, url):
+        return self.spreadsheet
+
+
+@pytest.fixture
+def sheet():
+    return FakeSpreadsheet(FakeWorksheet([HEADER] + [sheet_row(i) for i in range(30)]))
+
+
+@pytest.fixture
+def data_source(sheet):
+    source = SheetsSource("https://planilha", client=FakeClient(sheet), incremental=True)
+    # Blocos pequenos e todos conferidos a cada ciclo, para exercitar os blocos alterados
+    source.sync_state = SheetSync(block_size=4, verify_blocks=100)
+    data_source = DataSource(source)
+    data_source.refresh()
+    return data_source
+
+
+def edit(sheet, change):
+    change(sheet.worksheet.values)
+    sheet.modified += 1
+
+
+def cells(cube):
+    # Células com linhas, identificadas pelos rótulos (os códigos dependem da ordem de chegada)
+    table = pd.DataFrame({
+        dimension: cube.categories[dimension].to_numpy()[cube.codes[dimension]] for dimension in DIMENSIONS
+    })
+    table["Valor"] = cube.values
+    table["Linhas"] = cube.counts
+    return table
+
+
+def assert_matches_rebuild(data_source, sheet):
+    snapshot = data_source.current()
+    expected = ingest(pd.DataFrame(sheet.worksheet.values[1:], columns=sheet.worksheet.values[0]))
+
+    # As linhas do snapshot, na ordem da planilha, são as de uma carga completa
+    order = np.argsort(snapshot.source_rows, kind="stable")
+    df = snapshot.df.iloc[order].reset_index(drop=True)
+    pd.testing.assert_frame_equal(df.astype({c: str for c in DIMENSIONS[1:]}), expected.astype({c: str for c in DIMENSIONS[1:]}))
+
+    rebuilt = SpendCube(snapshot.df)
+    merged, fresh = cells(snapshot.cube), cells(rebuilt)
+    live = merged[merged["Linhas"] > 0].sort_values(DIMENSIONS).reset_index(drop=True)
+    fresh_live = fresh.sort_values(DIMENSIONS).reset_index(drop=True)
+    pd.testing.assert_frame_equal(live[DIMENSIONS], fresh_live[DIMENSIONS])
+    np.testing.assert_allclose(live["Valor"], fresh_live["Valor"], atol=1e-6)
+    np.testing.assert_array_equal(live["Linhas"], fresh_live["Linhas"])
+
+    # Cada linha aponta para a célula com os seus rótulos
+    pd.testing.assert_frame_equal(
+        merged.iloc[snapshot.cube.row_cells][DIMENSIONS].reset_index(drop=True),
+        fresh.iloc[rebuilt.row_cells][DIMENSIONS].reset_index(drop=True),
+    )
+    for dimension in DIMENSIONS[1:]:
+        assert sorted(snapshot.cube.options(dimension)) == sorted(rebuilt.options(dimension))
+
+
+def test_appended_rows(data_source, sheet):
+    first = data_source.current()
+    edit(sheet, lambda values: values.extend(sheet_row(i) for i in range(30, 45)))
+    # Rótulo novo numa dimensão
+    edit(sheet, lambda values: values.append(sheet_row(45)[:1] + ["Hospital Novo"] + sheet_row(45)[2:]))
+    snapshot = data_source.refresh()
+    assert snapshot.version == first.version + 1
+    assert len(snapshot.df) == 46
+    assert snapshot.cube is not first.cube
+    assert_matches_rebuild(data_source, sheet)
+
+
+def test_edited_block(data_source, sheet):
+    def change(values):
+        values[10][6] = "R$ 9.999,99"  # Linha de dados 9, no bloco 2
+        values[11][1] = "Hospital 4"
+
+    edit(sheet, change)
+    calls = sheet.worksheet.batch_calls
+    data_source.refresh()
+    assert sheet.worksheet.batch_calls == calls + 1
+    assert data_source.current().df["Valor"].max() == pytest.approx(9999.99)
+    assert_matches_rebuild(data_source, sheet)
+
+
+def test_edited_block_and_appended_rows(data_source, sheet):
+    def change(values):
+        values[3][4] = "Categoria 9"
+        values.extend(sheet_row(i) for i in range(30, 33))
+
+    edit(sheet, change)
+    data_source.refresh()
+    assert_matches_rebuild(data_source, sheet)
+    # Sem mudanças: nada é publicado
+    sheet.modified += 1
+    assert data_source.refresh() is data_source.current()
+
+
+def test_deleted_rows(data_source, sheet):
+    edit(sheet, lambda values: values.__delitem__(slice(5, 12)))
+    snapshot = data_source.refresh()
+    assert len(snapshot.df) == 23
+    assert_matches_rebuild(data_source, sheet)
+
+
+def test_header_change(data_source, sheet):
+    def change(values):
+        values[0] = HEADER + ["Observação"]
+        for row in values[1:]:
+            row.append("")
+
+    edit(sheet, change)
+    snapshot = data_source.refresh()
+    assert "Observação" in snapshot.df.columns
+    assert_matches_rebuild(data_source, sheet)
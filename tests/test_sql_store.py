@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import FILTER_DIMENSIONS, SpendCube
+from drilldown import filter_rows, page_records, sort_rows
+from exports import iter_row_chunks, iter_rows_csv
+from sql_store import SqlStore
+from test_cube import random_selection, sparse_frame
+
+
+@pytest.fixture(scope="module")
+def df():
+    df = sparse_frame(3000, np.random.default_rng(17))
+    # Coluna extra da planilha (texto), mantida pela ingestão
+    return df.assign(Observação=np.where(np.arange(len(df)) % 3 == 0, "revisar", "ok"))
+
+
+@pytest.fixture(scope="module")
+def cube(df):
+    return SpendCube(df)
+
+
+@pytest.fixture(scope="module")
+def reader(df, tmp_path_factory):
+    store = SqlStore(str(tmp_path_factory.mktemp("sql") / "apura-sus.sqlite"))
+    store.build(df, "teste")
+    return store.reader("teste")
+
+
+def random_filters(rng, cube):
+    # Filtros normalizados como os do dashboard (None: sem filtro; vazio: nada selecionado)
+    filters = []
+    for dimension in FILTER_DIMENSIONS:
+        selected = random_selection(rng, cube.options(dimension))
+        filters.append(None if selected is None else tuple(sorted(set(selected))))
+    return tuple(filters)
+
+
+def test_filter_options_match_cube(reader, cube):
+    rng = np.random.default_rng(3)
+    for dimension in FILTER_DIMENSIONS:
+        assert reader.options(dimension) == cube.options(dimension)
+    for _ in range(60):
+        selections = [random_selection(rng, cube.options(dimension)) for dimension in FILTER_DIMENSIONS]
+        assert reader.filter_options(selections) == cube.filter_options(selections), selections
+
+
+def test_totals_and_monthly_match_cube(reader, cube):
+    rng = np.random.default_rng(5)
+    for _ in range(30):
+        filters = random_filters(rng, cube)
+        cube_slice = cube.slice(*filters)
+        cells = reader.cells(filters)
+        assert cells["Valor"].sum() == pytest.approx(cube_slice.total())
+        for dimension in ("Hospital", "Categoria"):
+            totals = cells.groupby(dimension, sort=True)["Valor"].sum().reset_index()
+            expected = cube_slice.totals(dimension)
+            assert list(totals[dimension]) == list(expected[dimension])
+            np.testing.assert_allclose(totals["Valor"], expected["Valor"])
+
+        trend_filters = (None, *filters[1:])
+        for limit in (None, 3):
+            pd.testing.assert_frame_equal(
+                reader.monthly(trend_filters, "Centro de Custo", limit=limit),
+                cube.slice(*trend_filters).monthly("Centro de Custo", limit=limit),
+                check_dtype=False,
+            )
+
+
+@pytest.mark.parametrize("filter_query, sort_by", [
+    ("", []),
+    ("{Valor} >= 300", [{"column_id": "Valor", "direction": "desc"}]),
+    ("{Centro de Custo} icontains 'CENTRO 1' && {Observação} = revisar",
+     [{"column_id": "Data", "direction": "desc"}, {"column_id": "Centro de Custo", "direction": "asc"}]),
+    ("{Data} datestartswith '0' && {Valor} contains 5", [{"column_id": "Categoria", "direction": "asc"}]),
+    ("{Categoria} = 'Inexistente'", []),
+])
+def test_drilldown_matches_pandas(reader, cube, df, filter_query, sort_by):
+    filters = (None, None, tuple(cube.options("Centro de Custo")[:20]), None)
+    for hospital in cube.options("Hospital")[:4]:
+        positions = cube.slice(*filters).rows("Hospital", hospital)
+        positions = sort_rows(df, filter_rows(df, positions, filter_query), sort_by)
+        assert reader.row_count(filters, "Hospital", hospital, filter_query) == len(positions)
+        for page in range(3):
+            records = reader.rows(filters, "Hospital", hospital, filter_query, sort_by, offset=page * 7, limit=7)
+            assert records.to_dict("records") == page_records(df, positions, page, 7)
+
+
+def test_drilldown_rejects_text_in_numeric_comparison(reader, cube):
+    with pytest.raises(ValueError):
+        reader.row_count((None, None, None, None), "Hospital", cube.options("Hospital")[0], "{Valor} > muito")
+    assert reader.row_count((None, None, None, None), "Hospital", "Inexistente") == 0
+
+
+def test_exported_rows_match_the_frame(reader, cube, df):
+    rng = np.random.default_rng(7)
+    for _ in range(10):
+        filters = random_filters(rng, cube)
+        expected = iter_rows_csv(df.columns, iter_row_chunks(df, cube.slice(*filters).row_mask()))
+        assert "".join(iter_rows_csv(reader.columns, reader.iter_rows(filters, chunk_size=97))) == "".join(expected)
+
+
+def test_previous_database_is_kept(df, tmp_path):
+    store = SqlStore(str(tmp_path / "apura-sus.sqlite"))
+    paths = [store.build(df.head(10), fingerprint) for fingerprint in ("a", "b", "c")]
+    # O banco do snapshot anterior continua disponível para quem ainda o serve
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        path.rsplit("/", 1)[1] for path in paths[1:]
+    )
+    assert store.reader("a") is None
+    assert store.reader("b").options("Hospital") == SpendCube(df.head(10)).options("Hospital")
@@ -0,0 +1,16 @@
+# Ponto de entrada de produção: expõe o servidor Flask para um servidor WSGI
+# (gunicorn -c gunicorn.conf.py wsgi:server). O modo debug fica desligado.
+import logging
+
+from dashboard import app, data_source, server
+
+# Carregar os dados antes do fork, sem iniciar a thread de atualização (ela só roda nos
+# workers): o snapshot salvo localmente (o cubo mapeado do arquivo, compartilhado pelos
+# workers) ou, sem ele (por exemplo, num disco efêmero logo após o deploy), uma carga
+# completa da fonte
+if data_source.load_cached() is None:
+    try:
+        data_source.refresh()
+    except Exception:
+        # Os workers sobem com o snapshot vazio e fazem a carga (com o cache local, um só deles)
+        logging.getLogger(__name__).exception("Falha na carga inicial dos dados antes do fork")